@@ -4,12 +4,13 @@ from typing import DefaultDict, Optional, Sequence
 from pysen.ext import black_wrapper
 from pysen.ext.black_wrapper import BlackSetting
 
+from . import resource_utils
 from .command import CommandBase
 from .component import LintComponentBase
 from .lint_command import LintCommandBase
 from .path import resolve_path
 from .reporter import Reporter
-from .runner_options import PathContext, RunOptions
+from .runner_options import ExecutionBackend, PathContext, RunOptions
 from .setting import SettingFile
 from .source import PythonFileFilter, Source
 
@@ -23,8 +24,13 @@ class BlackCommand(LintCommandBase):
         paths: PathContext,
         source: Source,
         inplace_edit: bool,
+        cache_dir: Optional[pathlib.Path] = None,
+        jobs: Optional[int] = None,
+        backend: ExecutionBackend = ExecutionBackend.SUBPROCESS,
     ) -> None:
-        super().__init__(paths.base_dir, source)
+        super().__init__(paths.base_dir, source, cache_dir)
+        self._jobs = jobs
+        self._backend = backend
         self._name = name
         self._setting_path = resolve_path(paths.settings_dir, _SettingFileName)
         self._inplace_edit = inplace_edit
@@ -33,15 +39,37 @@ class BlackCommand(LintCommandBase):
     def name(self) -> str:
         return self._name
 
+    @property
+    def tools(self) -> Sequence[str]:
+        return ["black"]
+
     @property
     def has_side_effects(self) -> bool:
         return self._inplace_edit
 
+    def _run(self, reporter: Reporter, files: Sequence[pathlib.Path]) -> int:
+        run = black_wrapper.run
+        if self._backend == ExecutionBackend.IN_PROCESS:
+            run = black_wrapper.run_in_process
+        return run(
+            reporter,
+            self.base_dir,
+            self._setting_path,
+            files,
+            self._inplace_edit,
+            resource_utils.get_num_jobs(self._jobs),
+        )
+
     def __call__(self, reporter: Reporter) -> int:
         sources = self._get_sources(reporter, PythonFileFilter)
         reporter.logger.info(f"Checking {len(sources)} files")
-        return black_wrapper.run(
-            reporter, self.base_dir, self._setting_path, sources, self._inplace_edit
+        return self._run_cached(
+            reporter,
+            sources,
+            lambda files: self._run(reporter, files),
+            "black",
+            self._setting_path,
+            self._inplace_edit,
         )
 
     def run_files(self, reporter: Reporter, files: Sequence[pathlib.Path]) -> int:
@@ -50,11 +78,12 @@ class BlackCommand(LintCommandBase):
         if len(covered_files) == 0:
             return 0
 
-        return black_wrapper.run(
+        return self._run_cached(
             reporter,
-            self.base_dir,
-            self._setting_path,
             covered_files,
+            lambda files: self._run(reporter, files),
+            "black",
+            self._setting_path,
             self._inplace_edit,
         )
 
@@ -95,8 +124,24 @@ class Black(LintComponentBase):
         self, target: str, paths: PathContext, options: RunOptions
     ) -> CommandBase:
         if target == "lint":
-            return BlackCommand(self.name, paths, self.source, False)
+            return BlackCommand(
+                self.name,
+                paths,
+                self.source,
+                False,
+                cache_dir=options.cache_dir,
+                jobs=options.jobs,
+                backend=options.backend,
+            )
         elif target == "format":
-            return BlackCommand(self.name, paths, self.source, True)
+            return BlackCommand(
+                self.name,
+                paths,
+                self.source,
+                True,
+                cache_dir=options.cache_dir,
+                jobs=options.jobs,
+                backend=options.backend,
+            )
 
         raise AssertionError(f"unknown {target}")
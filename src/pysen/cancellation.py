@@ -0,0 +1,113 @@
+import contextlib
+import contextvars
+import itertools
+import threading
+from typing import Callable, Dict, Iterator, Optional
+
+from .exceptions import CommandCancelledError
+
+
+class Cancellation:
+    """Cancels the commands of a target once one of them fails (see `--fail-fast`).
+
+    Running subprocesses register a function that terminates them, which is called
+    when the target is cancelled. Subprocesses are never started after that.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._terminators: Dict[int, Callable[[], None]] = {}
+        self._ids = itertools.count()
+
+    @property
+    def cancelled(self) -> bool:
+        with self._lock:
+            return self._cancelled
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            terminators = list(self._terminators.values())
+
+        for terminate in terminators:
+            terminate()
+
+    def check(self) -> None:
+        """Raises `CommandCancelledError` if the target is cancelled."""
+        if self.cancelled:
+            raise CommandCancelledError("cancelled by another failure")
+
+    @contextlib.contextmanager
+    def register(self, terminate: Callable[[], None]) -> Iterator[None]:
+        """Calls `terminate` when the target is cancelled while the context is active.
+
+        `terminate` is called immediately if the target is already cancelled.
+        """
+        key = next(self._ids)
+        with self._lock:
+            cancelled = self._cancelled
+            if not cancelled:
+                self._terminators[key] = terminate
+
+        if cancelled:
+            terminate()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._terminators.pop(key, None)
+
+
+_current_cancellation: contextvars.ContextVar[
+    Optional[Cancellation]
+] = contextvars.ContextVar("cancellation", default=None)
+
+
+def get_cancellation() -> Optional[Cancellation]:
+    return _current_cancellation.get()
+
+
+@contextlib.contextmanager
+def cancellation_scope(enabled: bool) -> Iterator[Optional[Cancellation]]:
+    """Makes the commands in the context cancellable if `enabled` is True."""
+    if not enabled:
+        yield None
+        return
+
+    cancellation = Cancellation()
+    token = _current_cancellation.set(cancellation)
+    try:
+        yield cancellation
+    finally:
+        _current_cancellation.reset(token)
+
+
+_current_interruption: contextvars.ContextVar[
+    Optional[Cancellation]
+] = contextvars.ContextVar("interruption", default=None)
+
+
+def get_interruption() -> Optional[Cancellation]:
+    return _current_interruption.get()
+
+
+@contextlib.contextmanager
+def interruption_scope() -> Iterator[Cancellation]:
+    """Kills the processes registered in the context when pysen is interrupted.
+
+    Processes running in their own process group don't receive SIGINT from
+    the terminal, so they are killed by `Cancellation.cancel` of the returned object,
+    which is called when `KeyboardInterrupt` leaves the context.
+    """
+    interruption = Cancellation()
+    token = _current_interruption.set(interruption)
+    try:
+        yield interruption
+    except KeyboardInterrupt:
+        interruption.cancel()
+        raise
+    finally:
+        _current_interruption.reset(token)
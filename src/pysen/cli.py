@@ -4,9 +4,9 @@ import enum
 import logging
 import pathlib
 import sys
-from typing import Optional, Sequence, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
-from . import __version__, cli_config, exceptions
+from . import __version__, cli_config, exceptions, git_utils, resource_utils
 from .cli_config import CliConfig
 from .diagnostic import DiagnosticFormatter, FLCMFormatter
 from .logging_utils import setup_logger
@@ -15,7 +15,8 @@ from .path import wrap_path
 from .pyproject import find_pyproject, load_manifest
 from .reporter import ReporterFactory
 from .runner import Runner
-from .runner_options import RunOptions
+from .runner_options import ExecutionBackend, RunOptions
+from .source import PythonFileFilter
 
 CLI_DESCRIPTION = "pysen CLI"
 
@@ -67,6 +68,27 @@ def _use_pretty_logging() -> bool:
     return sys.stderr.isatty()
 
 
+def _positive_int(value: str) -> int:
+    ret = int(value)
+    if ret < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {value}")
+    return ret
+
+
+def _positive_float(value: str) -> float:
+    ret = float(value)
+    if not ret > 0:
+        raise argparse.ArgumentTypeError(f"must be a positive number: {value}")
+    return ret
+
+
+def _memory_size(value: str) -> int:
+    try:
+        return resource_utils.parse_memory_size(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
 def _show_version() -> None:
     print(__version__)
 
@@ -89,8 +111,58 @@ def _setup_run(
         args.process_output, error_formatter is None
     )
 
+    jobs: Optional[int] = args.jobs
+    if jobs is None and config is not None:
+        jobs = config.jobs
+
+    cache_dir: Optional[pathlib.Path] = None
+    if args.cache_dir is not None:
+        cache_dir = pathlib.Path(args.cache_dir).resolve()
+    elif config is not None:
+        cache_dir = config.cache_dir
+
+    memory_limit: Optional[int] = args.memory_limit
+    memory_footprints: Dict[str, int] = {}
+    if config is not None:
+        if memory_limit is None and config.memory_limit is not None:
+            memory_limit = resource_utils.parse_memory_size(config.memory_limit)
+        memory_footprints = {
+            k: resource_utils.parse_memory_size(v)
+            for k, v in config.memory_footprints.items()
+        }
+
+    backend = ExecutionBackend.SUBPROCESS
+    if args.backend is not None:
+        backend = ExecutionBackend(args.backend)
+    elif config is not None and config.backend is not None:
+        backend = config.backend
+
+    timeout: Optional[float] = args.timeout
+    command_timeout: Optional[float] = args.command_timeout
+    command_timeouts: Dict[str, float] = {}
+    if config is not None:
+        if timeout is None:
+            timeout = config.timeout
+        if command_timeout is None:
+            command_timeout = config.command_timeout
+        command_timeouts = config.command_timeouts
+
     options = RunOptions(
-        require_diagnostics=error_formatter is not None, no_parallel=args.no_parallel
+        require_diagnostics=error_formatter is not None,
+        no_parallel=args.no_parallel,
+        jobs=jobs,
+        cache_dir=cache_dir,
+        memory_limit=memory_limit,
+        memory_footprints=memory_footprints,
+        mypy_cache_dir=config.mypy_cache_dir if config is not None else None,
+        mypy_sqlite_cache=config is not None and config.mypy_sqlite_cache,
+        mypy_fine_grained_cache=(config is not None and config.mypy_fine_grained_cache),
+        backend=backend,
+        fork_server=args.fork_server or (config is not None and config.fork_server),
+        fail_fast=args.fail_fast or (config is not None and config.fail_fast),
+        timeout=timeout,
+        command_timeout=command_timeout,
+        command_timeouts=command_timeouts,
     )
     return _SetupOptions(error_formatter, options, loglevel, process_output)
 
@@ -147,6 +219,26 @@ def _run_target(
         sys.exit(1)
 
 
+def _get_changed_files(
+    base_dir: pathlib.Path, args: argparse.Namespace
+) -> Optional[List[pathlib.Path]]:
+    if args.changed_since is None and not args.staged:
+        return None
+
+    try:
+        changed = git_utils.list_changed_files(
+            base_dir, since=args.changed_since, staged=args.staged
+        )
+    except git_utils.GitRepositoryNotFoundError:
+        sys.stderr.write(f"{base_dir} is not in an available git repository\n")
+        sys.exit(1)
+    except git_utils.GitRevisionNotFoundError as e:
+        sys.stderr.write(f"revision not found: {e}\n")
+        sys.exit(1)
+
+    return [p for p in changed if p.is_file() and PythonFileFilter(p)]
+
+
 def _start_run(
     base_dir: pathlib.Path,
     runner: Runner,
@@ -155,13 +247,18 @@ def _start_run(
 ) -> None:
     target_names = args.targets
     setup_options = _setup_run(base_dir, args, config)
+    files = _get_changed_files(base_dir, args)
+    if files is not None and len(files) == 0:
+        sys.stderr.write("No changed python files found\n")
+        return
+
     for target_name in target_names:
         _run_target(
             target_name=target_name,
             runner=runner,
             base_dir=base_dir,
             args=args,
-            files=None,
+            files=files,
             setup_options=setup_options,
             config=config,
         )
@@ -255,6 +352,64 @@ def _setup_manifest_parser() -> argparse.ArgumentParser:
     return parser
 
 
+def _setup_run_options_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--error-format", type=str, choices=_ErrorFormat.keys(), default=None
+    )
+    parser.add_argument("--no-parallel", action="store_true")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=_positive_int,
+        default=None,
+        help="Maximum number of commands to run concurrently "
+        "(default: number of available CPUs)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory to cache lint results of unchanged files",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=_memory_size,
+        default=None,
+        help="Memory budget for commands running concurrently, e.g., 4G "
+        "(default: the cgroup memory limit or the physical memory)",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=[x.value for x in ExecutionBackend],
+        default=None,
+        help="Run tools in subprocesses or through their python API in pysen "
+        "when supported (default: subprocess)",
+    )
+    parser.add_argument(
+        "--fork-server",
+        action="store_true",
+        help="Run tools in processes forked from a server that keeps them imported",
+    )
+    parser.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="Cancel the remaining commands as soon as a command fails",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=_positive_float,
+        default=None,
+        help="Terminate the commands still running after this many seconds",
+    )
+    parser.add_argument(
+        "--command-timeout",
+        type=_positive_float,
+        default=None,
+        help="Terminate each command that runs longer than this many seconds",
+    )
+
+
 def _parse_manifest_options() -> Tuple[ManifestBase, Optional[CliConfig], pathlib.Path]:
     # NOTE(igarashi): show detailed help to the user when a configuration is available
     # In this method, we
@@ -331,10 +486,20 @@ def cli() -> None:
         choices=targets,
         nargs="+",
     )
-    run_parser.add_argument(
-        "--error-format", type=str, choices=_ErrorFormat.keys(), default=None
+    _setup_run_options_parser(run_parser)
+    changed_files_group = run_parser.add_mutually_exclusive_group()
+    changed_files_group.add_argument(
+        "--changed-since",
+        type=str,
+        default=None,
+        metavar="REF",
+        help="Run target only for python files changed since the merge base of REF",
+    )
+    changed_files_group.add_argument(
+        "--staged",
+        action="store_true",
+        help="Run target only for python files staged in git",
     )
-    run_parser.add_argument("--no-parallel", action="store_true")
     run_parser.set_defaults(func=_start_run)
 
     run_files_parser = subparsers.add_parser(
@@ -347,10 +512,7 @@ def cli() -> None:
         choices=targets,
     )
     run_files_parser.add_argument("files", type=str, help="target file", nargs="+")
-    run_files_parser.add_argument(
-        "--error-format", type=str, choices=_ErrorFormat.keys(), default=None
-    )
-    run_files_parser.add_argument("--no-parallel", action="store_true")
+    _setup_run_options_parser(run_files_parser)
     run_files_parser.set_defaults(func=_start_run_files)
 
     generate_parser = subparsers.add_parser("generate", help="generate setting files")
@@ -1,17 +1,50 @@
 import dataclasses
 import pathlib
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Union
 
 import dacite
 import tomlkit
 
 from .exceptions import InvalidConfigurationError
 from .pyproject_model import _get_descendant, _workaround_tomlkit_unmarshal
+from .resource_utils import parse_memory_size
+from .runner_options import ExecutionBackend
 
 
 @dataclasses.dataclass
 class CliConfig:
     settings_dir: Optional[pathlib.Path] = None
+    jobs: Optional[int] = None
+    cache_dir: Optional[pathlib.Path] = None
+    # NOTE: memory sizes are either bytes or strings like "4G", and are converted
+    # into bytes after parsing
+    memory_limit: Optional[Union[int, str]] = None
+    memory_footprints: Dict[str, Union[int, str]] = dataclasses.field(
+        default_factory=dict
+    )
+    mypy_cache_dir: Optional[pathlib.Path] = None
+    mypy_sqlite_cache: bool = False
+    mypy_fine_grained_cache: bool = False
+    backend: Optional[ExecutionBackend] = None
+    fork_server: bool = False
+    fail_fast: bool = False
+    # NOTE: timeouts are in seconds
+    timeout: Optional[float] = None
+    command_timeout: Optional[float] = None
+    command_timeouts: Dict[str, float] = dataclasses.field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        if self.jobs is not None and self.jobs < 1:
+            raise ValueError(f"jobs must be a positive integer: {self.jobs}")
+        if self.memory_limit is not None:
+            self.memory_limit = parse_memory_size(self.memory_limit)
+        self.memory_footprints = {
+            k: parse_memory_size(v) for k, v in self.memory_footprints.items()
+        }
+        timeouts = [self.timeout, self.command_timeout, *self.command_timeouts.values()]
+        for t in timeouts:
+            if t is not None and t <= 0:
+                raise ValueError(f"timeout must be a positive number: {t}")
 
 
 def _expand_path(base_dir: pathlib.Path, s: Any) -> pathlib.Path:
@@ -38,7 +71,12 @@ def _load_cli_section(path: pathlib.Path) -> Optional[Dict[str, Any]]:
 
 def _parse_dict(data: Dict[str, Any], base_dir: pathlib.Path) -> CliConfig:
     dacite_config = dacite.Config(
-        type_hooks={pathlib.Path: lambda x: _expand_path(base_dir, x)},
+        type_hooks={
+            pathlib.Path: lambda x: _expand_path(base_dir, x),
+            ExecutionBackend: ExecutionBackend,
+            # NOTE: accept integers for the fields of seconds
+            float: float,
+        },
         strict=True,
     )
 
@@ -46,7 +84,7 @@ def _parse_dict(data: Dict[str, Any], base_dir: pathlib.Path) -> CliConfig:
         config = dacite.from_dict(CliConfig, data, dacite_config)
         assert isinstance(config, CliConfig)
         return config
-    except dacite.DaciteError as e:
+    except (dacite.DaciteError, ValueError) as e:
         raise InvalidConfigurationError(f"invalid configuration: {e}") from None
 
 
@@ -1,11 +1,16 @@
+import logging
 import pathlib
 import subprocess
+import sys
 from abc import ABC, abstractmethod
-from typing import Sequence
+from typing import Optional, Sequence
 
+from . import fork_server, probe_cache
 from .exceptions import CommandNotFoundError, RunTargetFileNotSupported
 from .reporter import Reporter
 
+_logger = logging.getLogger(__name__)
+
 
 class CommandBase(ABC):
     @property
@@ -21,6 +26,25 @@ class CommandBase(ABC):
     def has_side_effects(self) -> bool:
         return True
 
+    @property
+    def expected_memory(self) -> Optional[int]:
+        """Expected peak memory usage of the command in bytes, if known.
+
+        The runner doesn't start a command in parallel with others unless this
+        amount of memory fits within the budget. The value measured in a previous run
+        takes precedence when a cache directory is available.
+        """
+        return None
+
+    @property
+    def tools(self) -> Sequence[str]:
+        """Python modules that the command runs, e.g., `black`.
+
+        The runner probes the installation and the versions of the tools
+        before running the commands of a target.
+        """
+        return []
+
     def run(self, reporter: Reporter) -> int:
         return self.__call__(reporter)
 
@@ -28,19 +52,34 @@ class CommandBase(ABC):
         raise RunTargetFileNotSupported(self.name)
 
 
+def _call(cmd: Sequence[str]) -> int:
+    client = fork_server.get_client()
+    if client is not None and client.supports(cmd):
+        try:
+            return client.call(cmd)
+        except OSError:
+            _logger.warning("fork server is not available", exc_info=True)
+
+    return subprocess.call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
 def check_command_installed(
     *validation_command: str,
 ) -> None:
+    # NOTE: only the commands run by the current python are cached, since the other
+    # commands depend on `PATH` rather than the installed distributions
+    cache = probe_cache.get_probe_cache()
+    if len(validation_command) == 0 or validation_command[0] != sys.executable:
+        cache = None
+    if cache is not None and cache.is_installed(validation_command):
+        return
+
     err = CommandNotFoundError(
         f"The command `{' '.join(validation_command)}` failed."
         " Make sure it is installed."
     )
     try:
-        retval = subprocess.call(
-            validation_command,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
+        retval = _call(validation_command)
     except FileNotFoundError:
         # This will be raised when self.validation_command[0] does not exist.
         raise err
@@ -48,3 +87,5 @@ def check_command_installed(
         # In some cases (e.g. pyenv), FileNotFoundError is not raised.
         # Instead, we look at the return code to tell if the command could not be found.
         raise err
+    if cache is not None:
+        cache.set_installed(validation_command)
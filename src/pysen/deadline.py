@@ -0,0 +1,40 @@
+import contextlib
+import contextvars
+import time
+from typing import Iterator, Optional
+
+_current_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "deadline", default=None
+)
+
+
+def get_deadline() -> Optional[float]:
+    """Returns the deadline of the current context in `time.monotonic()` if any."""
+    return _current_deadline.get()
+
+
+def get_remaining() -> Optional[float]:
+    """Returns the seconds left until the deadline of the current context if any."""
+    deadline = get_deadline()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+@contextlib.contextmanager
+def deadline_scope(timeout: Optional[float]) -> Iterator[Optional[float]]:
+    """Limits the time of the context to `timeout` seconds from now.
+
+    A scope inside another scope never extends the deadline of the outer scope.
+    """
+    deadline = get_deadline()
+    if timeout is not None:
+        new_deadline = time.monotonic() + timeout
+        if deadline is None or new_deadline < deadline:
+            deadline = new_deadline
+
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
@@ -2,6 +2,7 @@ import logging
 from importlib.metadata import Distribution, PackageNotFoundError, distribution
 from typing import Optional
 
+from pysen import probe_cache
 from pysen.exceptions import DistributionNotFound
 from pysen.py_version import VersionRepresentation
 
@@ -17,10 +18,19 @@ def _get_distro(name: str) -> Optional[Distribution]:
 
 
 def get_version(name: str) -> VersionRepresentation:
-    distro = _get_distro(name)
-    if distro is None:
-        raise DistributionNotFound(
-            f"Expected {name} to be installed but importlib could not find it.\n"
-            f'Hint: Did you install "{name}" in the same Python environment as pysen?'
-        )
-    return VersionRepresentation.from_str(distro.version)
+    # NOTE: looking up a distribution scans `sys.path`, which is slow when
+    # site-packages is large
+    cache = probe_cache.get_probe_cache()
+    version = cache.get_version(name) if cache is not None else None
+    if version is None:
+        distro = _get_distro(name)
+        if distro is None:
+            raise DistributionNotFound(
+                f"Expected {name} to be installed but importlib could not find it.\n"
+                f'Hint: Did you install "{name}" in the same Python environment '
+                "as pysen?"
+            )
+        version = distro.version
+        if cache is not None:
+            cache.set_version(name, version)
+    return VersionRepresentation.from_str(version)
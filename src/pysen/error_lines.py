@@ -1,7 +1,8 @@
+import difflib
 import logging
 import re
 from pathlib import Path
-from typing import Callable, Generator, Iterable, Optional
+from typing import Callable, Dict, Generator, Iterable, List, Optional
 
 import unidiff
 
@@ -10,6 +11,8 @@ from pysen.exceptions import UnexpectedErrorFormat
 
 FilePathParserType = Callable[[str], Path]
 _logger = logging.getLogger(__name__)
+# NOTE: the number of context lines in the diffs of black
+_DiffContextLines = 5
 
 
 def _warn_parse_error(errors: str, logger: Optional[logging.Logger]) -> None:
@@ -107,3 +110,92 @@ def parse_error_diffs(
                 file_path=file_path,
                 diff="".join(map(str, filter_hunk(hunk))),
             )
+
+
+def diff_diagnostics(
+    file_path: Path,
+    source: str,
+    formatted: str,
+    context: int = _DiffContextLines,
+) -> Iterable[Diagnostic]:
+    """
+    Compatible with `parse_error_diffs` for the unified diff of `source` and
+    `formatted`, without formatting and parsing the diff
+    """
+    source_lines = source.splitlines(keepends=True)
+    formatted_lines = formatted.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, source_lines, formatted_lines)
+    for group in matcher.get_grouped_opcodes(context):
+        changes = [op for op in group if op[0] != "equal"]
+        if any(i1 < i2 for _, i1, i2, _, _ in changes):
+            start_line = min(i1 for _, i1, i2, _, _ in changes if i1 < i2) + 1
+            end_line = max(i2 for _, i1, i2, _, _ in changes if i1 < i2)
+        else:
+            start_line = changes[0][3] + 1
+            end_line = changes[-1][4]
+
+        diff: List[str] = []
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for i in range(max(i1, start_line - 1), min(i2, end_line)):
+                    diff.append(" " + source_lines[i])
+                continue
+            diff.extend("-" + line for line in source_lines[i1:i2])
+            diff.extend("+" + line for line in formatted_lines[j1:j2])
+
+        yield Diagnostic(
+            start_line=start_line,
+            end_line=end_line,
+            start_column=1,
+            file_path=file_path,
+            diff="".join(diff),
+        )
+
+
+def _format_hunk_range(start: int, length: int) -> str:
+    return f"{start},{length}" if length != 1 else f"{start}"
+
+
+def format_error_lines(diagnostics: Iterable[Diagnostic]) -> str:
+    """
+    Renders `diagnostics` like the outputs which `parse_error_lines` and
+    `parse_error_diffs` read, i.e., `path:line:column: message` for messages and
+    a unified diff of each file for diffs
+    """
+    lines: List[str] = []
+    diffs: Dict[Path, List[Diagnostic]] = {}
+    for d in diagnostics:
+        if d.diff is not None:
+            diffs.setdefault(d.file_path, []).append(d)
+            continue
+        position = f"{d.file_path}:{d.start_line or 1}"
+        if d.start_column is not None:
+            position += f":{d.start_column}"
+        lines.append(f"{position}: {d.message}\n")
+
+    for file_path, hunks in diffs.items():
+        lines.append(f"--- {file_path}\n")
+        lines.append(f"+++ {file_path}\n")
+        # NOTE: the target lines are shifted by the lines added in the previous hunks
+        offset = 0
+        for d in sorted(hunks, key=lambda d: d.start_line or 1):
+            assert d.diff is not None
+            diff = d.diff.splitlines(keepends=True)
+            source_len = sum(1 for line in diff if line[:1] in (" ", "-"))
+            target_len = sum(1 for line in diff if line[:1] in (" ", "+"))
+            start = d.start_line or 1
+            if source_len == 0:
+                # `start` is the first added line of the target for an insertion
+                source_start, target_start = start - offset - 1, start
+            else:
+                source_start, target_start = start, start + offset
+            if target_len == 0:
+                target_start -= 1
+            lines.append(
+                f"@@ -{_format_hunk_range(source_start, source_len)} "
+                f"+{_format_hunk_range(target_start, target_len)} @@\n"
+            )
+            lines.extend(line if line.endswith("\n") else line + "\n" for line in diff)
+            offset += target_len - source_len
+
+    return "".join(lines)
@@ -0,0 +1,55 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import Any, Coroutine, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class EventLoopThread:
+    """Runs an asyncio event loop in a daemon thread.
+
+    The loop is shared by all the threads of pysen, so that a single thread drives
+    the pipes of every subprocess instead of a few threads for each subprocess.
+    """
+
+    def __init__(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run, name="pysen-event-loop", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> "concurrent.futures.Future[T]":
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        """Runs `coro` in the loop and waits for the result in the calling thread."""
+        assert threading.current_thread() is not self._thread
+        return self.submit(coro).result()
+
+
+_lock = threading.Lock()
+_instance: Optional[EventLoopThread] = None
+_instance_pid: Optional[int] = None
+
+
+def get_event_loop_thread() -> EventLoopThread:
+    """Returns the event loop shared by the process, starting it if necessary."""
+    global _instance, _instance_pid
+
+    with _lock:
+        # NOTE: the thread of the loop doesn't survive fork
+        if _instance is None or _instance_pid != os.getpid():
+            _instance = EventLoopThread()
+            _instance_pid = os.getpid()
+        return _instance
@@ -52,3 +52,11 @@ class InvalidComponentName(PysenError):
 
 class RunTargetFileNotSupported(PysenError):
     pass
+
+
+class CommandCancelledError(PysenError):
+    pass
+
+
+class CommandTimeoutError(PysenError):
+    pass
@@ -1,14 +1,18 @@
 import dataclasses
+import difflib
 import functools
+import importlib
 import pathlib
+from types import ModuleType
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+import tomlkit
+
 from pysen import process_utils
 from pysen.command import check_command_installed
 from pysen.dist_version import get_version
-from pysen.error_lines import parse_error_diffs
+from pysen.error_lines import diff_diagnostics, parse_error_diffs
 from pysen.exceptions import IncompatibleVersionError
-from pysen.path import change_dir
 from pysen.py_version import PythonVersion, VersionRepresentation
 from pysen.reporter import Reporter
 from pysen.setting import SettingBase, to_dash_case
@@ -47,12 +51,15 @@ class BlackSetting(SettingBase):
         return section_name, entries
 
 
+_WorkersOptionSupported = VersionRepresentation(22, 1)
+
+
 def _parse_file_path(file_path: str) -> pathlib.Path:
     return pathlib.Path(file_path.split(" ")[0])
 
 
 @functools.lru_cache(1)
-def _check_black_version() -> None:
+def _check_black_version() -> VersionRepresentation:
     version = get_version("black")
     minimum_supported = VersionRepresentation(19, 10)
 
@@ -62,6 +69,8 @@ def _check_black_version() -> None:
             f"version {version} is not supported."
         )
 
+    return version
+
 
 def run(
     reporter: Reporter,
@@ -69,25 +78,204 @@ def run(
     setting_path: pathlib.Path,
     sources: Iterable[pathlib.Path],
     inplace_edit: bool,
+    jobs: int = 1,
 ) -> int:
     check_command_installed(*process_utils.add_python_executable("black", "--version"))
-    _check_black_version()
+    version = _check_black_version()
 
     targets = [str(d) for d in sources]
     if len(targets) == 0:
         return 0
 
-    cmd = (
-        ["black", "--config", str(setting_path)]
-        + (["--diff", "--check"] if not inplace_edit else [])
-        + targets
+    cmd = ["black", "--config", str(setting_path)] + (
+        ["--diff", "--check"] if not inplace_edit else []
+    )
+    if not version < _WorkersOptionSupported:
+        # NOTE: the targets are sharded by `process_utils.run_sharded` instead
+        cmd += ["--workers", "1"]
+    ret, stdout, _ = process_utils.run_sharded(
+        process_utils.add_python_executable(*cmd),
+        targets,
+        reporter,
+        jobs,
+        cwd=base_dir,
     )
-    with change_dir(base_dir):
-        ret, stdout, _ = process_utils.run(
-            process_utils.add_python_executable(*cmd), reporter
-        )
 
     diagnostics = parse_error_diffs(stdout, _parse_file_path, logger=reporter.logger)
     reporter.report_diagnostics(list(diagnostics))
 
     return ret
+
+
+# NOTE: options of the exported setting that `_create_mode` understands.
+# The subprocess is used for settings with other options (e.g., merged from
+# the user's `settings_dir`) so that black behaves exactly as configured.
+_InProcessOptions = {
+    "line_length",
+    "target_version",
+    "skip_string_normalization",
+    "skip_magic_trailing_comma",
+    "preview",
+}
+# NOTE: black exits with this code when it fails to format a file
+_InternalErrorExitCode = 123
+
+
+@dataclasses.dataclass(frozen=True)
+class _FormatResult:
+    path: str
+    # the contents are set only when the file is (or would be) reformatted
+    source: Optional[str] = None
+    formatted: Optional[str] = None
+    error: Optional[str] = None
+
+
+@functools.lru_cache(1)
+def _load_black_api() -> Optional[ModuleType]:
+    try:
+        black = importlib.import_module("black")
+    except ImportError:
+        return None
+
+    required = ["Mode", "TargetVersion", "NothingChanged"]
+    required += ["decode_bytes", "format_file_contents"]
+    if not all(hasattr(black, x) for x in required):
+        return None
+    return black
+
+
+def _load_options(setting_path: pathlib.Path) -> Optional[Dict[str, Any]]:
+    try:
+        document = tomlkit.loads(setting_path.read_text())
+    except (OSError, tomlkit.exceptions.TOMLKitError):
+        return None
+
+    # NOTE: convert the items of tomlkit into builtin types so that the options can
+    # be passed to worker processes
+    options: Dict[str, Any] = {}
+    section = document.get("tool", {}).get("black", {})
+    for key, value in section.items():
+        name = key.replace("-", "_")
+        if name not in _InProcessOptions:
+            return None
+        elif name == "target_version":
+            options[name] = [str(v) for v in value]
+        elif name == "line_length":
+            options[name] = int(value)
+        else:
+            options[name] = bool(value)
+
+    return options
+
+
+def _create_mode(black: ModuleType, options: Dict[str, Any], is_pyi: bool) -> Any:
+    kwargs: Dict[str, Any] = {
+        "target_versions": {
+            black.TargetVersion[v.upper()] for v in options.get("target_version", [])
+        },
+        "is_pyi": is_pyi,
+    }
+    if "line_length" in options:
+        kwargs["line_length"] = options["line_length"]
+    if "skip_string_normalization" in options:
+        kwargs["string_normalization"] = not options["skip_string_normalization"]
+    if "skip_magic_trailing_comma" in options:
+        kwargs["magic_trailing_comma"] = not options["skip_magic_trailing_comma"]
+    if "preview" in options:
+        kwargs["preview"] = options["preview"]
+    return black.Mode(**kwargs)
+
+
+def _format_file(
+    black: ModuleType, path: str, options: Dict[str, Any], inplace_edit: bool
+) -> _FormatResult:
+    try:
+        with open(path, "rb") as f:
+            source, encoding, newline = black.decode_bytes(f.read())
+        mode = _create_mode(black, options, path.endswith(".pyi"))
+        try:
+            formatted = black.format_file_contents(source, fast=False, mode=mode)
+        except black.NothingChanged:
+            return _FormatResult(path)
+
+        if inplace_edit:
+            with open(path, "w", encoding=encoding, newline=newline) as f:
+                f.write(formatted)
+    except Exception as e:
+        return _FormatResult(path, error=str(e))
+
+    return _FormatResult(path, source, formatted)
+
+
+def _format_files(
+    options: Dict[str, Any], inplace_edit: bool, paths: List[str]
+) -> List[_FormatResult]:
+    black = _load_black_api()
+    assert black is not None
+    return [_format_file(black, p, options, inplace_edit) for p in paths]
+
+
+def run_in_process(
+    reporter: Reporter,
+    base_dir: pathlib.Path,
+    setting_path: pathlib.Path,
+    sources: Iterable[pathlib.Path],
+    inplace_edit: bool,
+    jobs: int = 1,
+) -> int:
+    """Formats `sources` through the python API of black instead of its CLI.
+
+    Diagnostics are built from the original and the formatted contents directly.
+    It falls back to `run` when the API of the installed black is not available
+    or the setting has options that are not supported here.
+    """
+    black = _load_black_api()
+    options = _load_options(setting_path)
+    if black is None or options is None:
+        reporter.logger.info("Falling back to the black command")
+        return run(reporter, base_dir, setting_path, sources, inplace_edit, jobs)
+
+    _check_black_version()
+
+    targets = [str(d) for d in sources]
+    if len(targets) == 0:
+        return 0
+
+    results = process_utils.map_sharded(
+        functools.partial(_format_files, options, inplace_edit),
+        targets,
+        reporter,
+        jobs,
+    )
+
+    ret = 0
+    for r in results:
+        if r.error is not None:
+            process_utils.log_output(
+                reporter, "", f"error: cannot format {r.path}: {r.error}"
+            )
+            ret = _InternalErrorExitCode
+            continue
+        if r.source is None or r.formatted is None:
+            continue
+
+        if inplace_edit:
+            process_utils.log_output(reporter, "", f"reformatted {r.path}")
+            continue
+
+        if ret == 0:
+            ret = 1
+        # NOTE: print the same diff as `black --diff` for users reading the outputs
+        diff = difflib.unified_diff(
+            r.source.splitlines(keepends=True),
+            r.formatted.splitlines(keepends=True),
+            r.path,
+            r.path,
+            n=5,
+        )
+        process_utils.log_output(reporter, "".join(diff), f"would reformat {r.path}")
+        reporter.report_diagnostics(
+            list(diff_diagnostics(pathlib.Path(r.path), r.source, r.formatted))
+        )
+
+    return ret
@@ -1,20 +1,27 @@
 import copy
 import dataclasses
 import functools
+import importlib
+import inspect
+import os
 import pathlib
+import threading
+from types import ModuleType
 from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
 from pysen import process_utils
 from pysen.command import check_command_installed
+from pysen.diagnostic import Diagnostic
 from pysen.dist_version import get_version
 from pysen.error_lines import parse_error_lines
 from pysen.exceptions import IncompatibleVersionError
-from pysen.path import change_dir
 from pysen.py_version import VersionRepresentation
 from pysen.reporter import Reporter
 from pysen.setting import SettingBase, to_dash_case
 
 _SettingFileName = "setup.cfg"
+# NOTE: an application of flake8 is not safe to be used by multiple threads at once
+_application_lock = threading.Lock()
 
 
 def _contains(target: Sequence[str], item: str) -> bool:
@@ -116,6 +123,7 @@ def run(
     base_dir: pathlib.Path,
     setting_path: pathlib.Path,
     sources: Iterable[pathlib.Path],
+    jobs: int = 1,
 ) -> int:
     check_command_installed(*process_utils.add_python_executable("flake8", "--version"))
     _check_flake8_version()
@@ -123,13 +131,151 @@ def run(
     if len(targets) == 0:
         return 0
 
-    cmd = ["flake8", "--config", str(setting_path)] + targets
-    with change_dir(base_dir):
-        ret, stdout, _ = process_utils.run(
-            process_utils.add_python_executable(*cmd), reporter
-        )
+    # NOTE: `--jobs 1` since the targets are sharded by `process_utils.run_sharded`
+    cmd = ["flake8", "--config", str(setting_path), "--jobs", "1"]
+    ret, stdout, _ = process_utils.run_sharded(
+        process_utils.add_python_executable(*cmd),
+        targets,
+        reporter,
+        jobs,
+        cwd=base_dir,
+    )
 
     diagnostics = parse_error_lines(stdout, logger=reporter.logger)
     reporter.report_diagnostics(list(diagnostics))
 
     return ret
+
+
+@dataclasses.dataclass(frozen=True)
+class _CheckResult:
+    diagnostics: List[Diagnostic]
+    error: Optional[str] = None
+
+
+@functools.lru_cache(1)
+def _load_flake8_api() -> Optional[ModuleType]:
+    try:
+        application = importlib.import_module("flake8.main.application")
+    except ImportError:
+        return None
+
+    app_class = getattr(application, "Application", None)
+    required = [
+        "initialize",
+        "make_formatter",
+        "make_guide",
+        "make_file_checker_manager",
+        "run_checks",
+        "report_errors",
+    ]
+    if app_class is None or not all(hasattr(app_class, x) for x in required):
+        return None
+    return application
+
+
+@functools.lru_cache(8)
+def _get_application(setting_path: str, mtime_ns: int, cwd: str) -> Any:
+    """Returns the application of flake8 initialized with `setting_path`.
+
+    Plugins are discovered and options are parsed only once for each setting,
+    which is reused by the following checks in the same process.
+    """
+    application = _load_flake8_api()
+    assert application is not None
+
+    app = application.Application()
+    app.initialize(["--config", setting_path, "--jobs", "1"])
+    return app
+
+
+def _check_files(setting_path: str, paths: List[str]) -> List[_CheckResult]:
+    diagnostics: List[Diagnostic] = []
+
+    def handle(error: Any) -> None:
+        # NOTE: `error` is a violation that the style guide decided to report,
+        # whose column number is already converted for display
+        diagnostics.append(
+            Diagnostic(
+                start_line=error.line_number,
+                end_line=error.line_number,
+                start_column=error.column_number,
+                message=f"{error.code} {error.text}",
+                file_path=pathlib.Path(error.filename),
+            )
+        )
+
+    try:
+        with _application_lock:
+            app = _get_application(
+                setting_path, os.stat(setting_path).st_mtime_ns, os.getcwd()
+            )
+            # NOTE: only the states of a check are rebuilt for `paths`.
+            # flake8 < 5 checks `args` while flake8 >= 5 checks `options.filenames`.
+            app.args = paths
+            app.options.filenames = paths
+            app.catastrophic_failure = False
+            app.make_formatter()
+            app.formatter.handle = handle
+            app.make_guide()
+            if len(inspect.signature(app.make_file_checker_manager).parameters) > 0:
+                app.make_file_checker_manager(paths)
+            else:
+                app.make_file_checker_manager()
+            app.run_checks()
+            app.report_errors()
+    except (Exception, SystemExit) as e:
+        return [_CheckResult(diagnostics, error=str(e) or type(e).__name__)]
+
+    return [_CheckResult(diagnostics)]
+
+
+def run_in_process(
+    reporter: Reporter,
+    base_dir: pathlib.Path,
+    setting_path: pathlib.Path,
+    sources: Iterable[pathlib.Path],
+    jobs: int = 1,
+) -> int:
+    """Checks `sources` by driving the application of flake8 in pysen.
+
+    Diagnostics are built from the violations reported by flake8 directly.
+    It falls back to `run` when the API of the installed flake8 is not available.
+    """
+    if _load_flake8_api() is None:
+        reporter.logger.info("Falling back to the flake8 command")
+        return run(reporter, base_dir, setting_path, sources, jobs)
+
+    _check_flake8_version()
+    targets = [str(d) for d in sources]
+    if len(targets) == 0:
+        return 0
+
+    results = process_utils.map_sharded(
+        functools.partial(_check_files, str(setting_path)),
+        targets,
+        reporter,
+        jobs,
+    )
+
+    ret = 0
+    for r in results:
+        if r.error is not None:
+            process_utils.log_output(reporter, "", f"flake8: error: {r.error}")
+            ret = 1
+        if len(r.diagnostics) == 0:
+            continue
+
+        ret = 1
+        # NOTE: print the same outputs as the default format of flake8
+        process_utils.log_output(
+            reporter,
+            "\n".join(
+                f"{d.file_path}:{d.start_line}:{d.start_column}: {d.message}"
+                for d in r.diagnostics
+            ),
+            "",
+        )
+        reporter.report_diagnostics(r.diagnostics)
+
+    return ret
@@ -1,21 +1,27 @@
 import copy
 import dataclasses
+import difflib
 import enum
 import functools
+import importlib
+import os
 import pathlib
+import tokenize
+from types import ModuleType
 from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 from pysen import process_utils
 from pysen.command import check_command_installed
 from pysen.dist_version import get_version
-from pysen.error_lines import parse_error_diffs
+from pysen.error_lines import diff_diagnostics, parse_error_diffs
 from pysen.exceptions import IncompatibleVersionError, UnexpectedErrorFormat
-from pysen.path import change_dir
 from pysen.py_version import VersionRepresentation
 from pysen.reporter import Reporter
 from pysen.setting import SettingBase
 
 _SettingFileName = "pyproject.toml"
+# NOTE: the number of context lines in the diffs of isort
+_DiffContextLines = 3
 
 
 class IsortSectionName(enum.Enum):
@@ -120,6 +126,7 @@ def run(
     setting_path: pathlib.Path,
     sources: Iterable[pathlib.Path],
     inplace_edit: bool,
+    jobs: int = 1,
 ) -> int:
     check_command_installed(*process_utils.add_python_executable("isort", "--version"))
     version = _get_isort_version()
@@ -133,14 +140,153 @@ def run(
         cmd.append("--recursive")
     if not inplace_edit:
         cmd += ["--diff", "--check-only"]
-    cmd += targets
 
-    with change_dir(base_dir):
-        ret, stdout, _ = process_utils.run(
-            process_utils.add_python_executable(*cmd), reporter
-        )
+    ret, stdout, _ = process_utils.run_sharded(
+        process_utils.add_python_executable(*cmd),
+        targets,
+        reporter,
+        jobs,
+        cwd=base_dir,
+    )
 
     diagnostics = parse_error_diffs(stdout, _parse_file_path, logger=reporter.logger)
     reporter.report_diagnostics(list(diagnostics))
 
     return ret
+
+
+@dataclasses.dataclass(frozen=True)
+class _SortResult:
+    path: str
+    # the contents are set only when the imports are (or would be) sorted
+    source: Optional[str] = None
+    sorted: Optional[str] = None
+    error: Optional[str] = None
+
+
+@functools.lru_cache(1)
+def _load_isort_api() -> Optional[ModuleType]:
+    try:
+        isort = importlib.import_module("isort")
+    except ImportError:
+        return None
+
+    # NOTE: isort 4 has a different API (`SortImports`)
+    if _get_isort_version().major < 5:
+        return None
+    if not all(hasattr(isort, x) for x in ["Config", "code"]):
+        return None
+    return isort
+
+
+@functools.lru_cache(1)
+def _load_config(setting_path: str, mtime: int) -> Any:
+    # NOTE: `mtime` is a part of the cache key so that the setting is reloaded
+    # when it changes in a long-running process
+    isort = _load_isort_api()
+    assert isort is not None
+    # NOTE: `--settings-path` of the isort command passes a file as `settings_file`
+    return isort.Config(settings_file=setting_path)
+
+
+def _sort_file(
+    isort: ModuleType, path: str, setting_path: str, inplace_edit: bool
+) -> _SortResult:
+    try:
+        with open(path, "rb") as f:
+            encoding, _ = tokenize.detect_encoding(f.readline)
+        # NOTE: keep the line endings as is, isort follows the ones of the input
+        with open(path, encoding=encoding, newline="") as f:
+            source = f.read()
+
+        config = _load_config(setting_path, os.stat(setting_path).st_mtime_ns)
+        sorted_source = isort.code(source, config=config, file_path=pathlib.Path(path))
+        if sorted_source == source:
+            return _SortResult(path)
+
+        if inplace_edit:
+            with open(path, "w", encoding=encoding, newline="") as f:
+                f.write(sorted_source)
+    except Exception as e:
+        return _SortResult(path, error=str(e))
+
+    return _SortResult(path, source, sorted_source)
+
+
+def _sort_files(
+    setting_path: str, inplace_edit: bool, paths: List[str]
+) -> List[_SortResult]:
+    isort = _load_isort_api()
+    assert isort is not None
+    return [_sort_file(isort, p, setting_path, inplace_edit) for p in paths]
+
+
+def run_in_process(
+    reporter: Reporter,
+    base_dir: pathlib.Path,
+    setting_path: pathlib.Path,
+    sources: Iterable[pathlib.Path],
+    inplace_edit: bool,
+    jobs: int = 1,
+) -> int:
+    """Sorts the imports of `sources` through the python API of isort.
+
+    Diagnostics are built from the original and the sorted contents directly.
+    It falls back to `run` when the API of the installed isort is not available.
+    """
+    isort = _load_isort_api()
+    if isort is None:
+        reporter.logger.info("Falling back to the isort command")
+        return run(reporter, base_dir, setting_path, sources, inplace_edit, jobs)
+
+    targets = [str(d) for d in sources]
+    if len(targets) == 0:
+        return 0
+
+    results = process_utils.map_sharded(
+        functools.partial(_sort_files, str(setting_path), inplace_edit),
+        targets,
+        reporter,
+        jobs,
+    )
+
+    ret = 0
+    for r in results:
+        if r.error is not None:
+            process_utils.log_output(reporter, "", f"ERROR: {r.path} {r.error}")
+            ret = 1
+            continue
+        if r.source is None or r.sorted is None:
+            continue
+
+        if inplace_edit:
+            process_utils.log_output(reporter, f"Fixing {r.path}", "")
+            continue
+
+        ret = 1
+        # NOTE: translate the line endings as `run` reads the outputs of isort in
+        # the universal newlines mode
+        source = r.source.replace("\r\n", "\n").replace("\r", "\n")
+        sorted_source = r.sorted.replace("\r\n", "\n").replace("\r", "\n")
+        # NOTE: print the same diff as `isort --diff` for users reading the outputs
+        diff = difflib.unified_diff(
+            source.splitlines(keepends=True),
+            sorted_source.splitlines(keepends=True),
+            f"{r.path}:before",
+            f"{r.path}:after",
+            n=_DiffContextLines,
+        )
+        process_utils.log_output(
+            reporter,
+            "".join(diff),
+            f"ERROR: {r.path} Imports are incorrectly sorted and/or formatted.",
+        )
+        reporter.report_diagnostics(
+            list(
+                diff_diagnostics(
+                    pathlib.Path(r.path), source, sorted_source, _DiffContextLines
+                )
+            )
+        )
+
+    return ret
@@ -1,20 +1,45 @@
+import contextlib
 import dataclasses
 import enum
 import functools
+import hashlib
+import json
+import os
 import pathlib
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+import shutil
+import sqlite3
+import sys
+import tempfile
+from typing import (
+    AbstractSet,
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 from pysen import process_utils
 from pysen.command import check_command_installed
 from pysen.dist_version import get_version
 from pysen.error_lines import parse_error_lines
 from pysen.exceptions import IncompatibleVersionError
-from pysen.path import PathLikeType, change_dir, get_relative_path, resolve_path
+from pysen.path import PathLikeType, get_relative_path, resolve_path
 from pysen.py_version import PythonVersion
 from pysen.reporter import Reporter
 from pysen.setting import SettingBase
 
 _IgnoreFields: List[str] = ["_pysen_convert_abspath"]
+# NOTE: the mypy daemon shuts itself down after being idle for this period (seconds)
+_DaemonIdleTimeout = 30 * 60
+_DaemonMessagePrefixes = ("Daemon ", "Restarting: ")
+_MetaFileSuffix = ".meta.json"
+_SqliteCacheFileName = "cache.db"
+# NOTE: newer versions of mypy store the cache in `files2`
+_SqliteCacheTables = ["files2", "files"]
 
 
 class MypyFollowImports(enum.Enum):
@@ -188,6 +213,97 @@ class MypyTarget:
     namespace_packages: bool = False
 
 
+@dataclasses.dataclass(frozen=True)
+class MypyCacheSetting:
+    cache_dir: pathlib.Path
+    sqlite: bool = False
+    fine_grained: bool = False
+
+    def as_options(self) -> List[str]:
+        options = ["--cache-dir", str(self.cache_dir)]
+        if self.sqlite:
+            options.append("--sqlite-cache")
+        if self.fine_grained:
+            options.append("--cache-fine-grained")
+        return options
+
+
+@dataclasses.dataclass(frozen=True)
+class MypyCacheStatistics:
+    hits: int = 0
+    misses: int = 0
+
+    def __add__(self, other: "MypyCacheStatistics") -> "MypyCacheStatistics":
+        return MypyCacheStatistics(self.hits + other.hits, self.misses + other.misses)
+
+    @staticmethod
+    def compare(
+        before: Mapping[str, float], after: Mapping[str, float]
+    ) -> "MypyCacheStatistics":
+        """Counts modules whose cache is reused (hits) or (re)written (misses)."""
+        misses = sum(1 for k, v in after.items() if before.get(k) != v)
+        return MypyCacheStatistics(len(after) - misses, misses)
+
+
+def _is_meta_file(path: str) -> bool:
+    # NOTE: `@deps.meta.json` of fine-grained caches is not a module
+    return path.endswith(_MetaFileSuffix) and not os.path.basename(path).startswith("@")
+
+
+def _snapshot_sqlite_cache(path: pathlib.Path) -> Dict[str, float]:
+    ret: Dict[str, float] = {}
+    try:
+        conn = sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True)
+    except sqlite3.Error:
+        return ret
+
+    try:
+        for table in _SqliteCacheTables:
+            try:
+                rows = conn.execute(f"SELECT path, mtime FROM {table}").fetchall()
+            except sqlite3.Error:
+                continue
+            for p, mtime in rows:
+                if _is_meta_file(p):
+                    ret[f"{path}:{p}"] = mtime
+            break
+    finally:
+        conn.close()
+
+    return ret
+
+
+def snapshot_cache(
+    cache_dir: pathlib.Path, python_version: Optional[PythonVersion] = None
+) -> Dict[str, float]:
+    """Returns the modification time of the metadata of each module in the cache
+    for `python_version` (the version of the running python by default).
+    """
+    ret: Dict[str, float] = {}
+    # NOTE: mypy stores the cache in a subdirectory for each python version.
+    # Only that subdirectory is scanned since other subdirectories hold the caches
+    # of other python versions, targets (see `MypyCommand`) or projects.
+    if python_version is not None:
+        version_dir = cache_dir / f"{python_version.major}.{python_version.minor}"
+    else:
+        version_dir = cache_dir / "{}.{}".format(*sys.version_info[:2])
+    if not version_dir.is_dir():
+        return ret
+
+    for root, _, files in os.walk(version_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if name == _SqliteCacheFileName:
+                ret.update(_snapshot_sqlite_cache(pathlib.Path(path)))
+            elif _is_meta_file(name):
+                try:
+                    ret[path] = os.stat(path).st_mtime
+                except OSError:
+                    continue
+
+    return ret
+
+
 @functools.lru_cache(1)
 def _check_mypy_version() -> None:
     version = get_version("mypy")
@@ -198,20 +314,11 @@ def _check_mypy_version() -> None:
         )
 
 
-def run(
-    reporter: Reporter,
-    base_dir: pathlib.Path,
-    setting_path: pathlib.Path,
+def _get_extra_options(
     target: MypyTarget,
     require_diagnostics: bool,
-) -> int:
-    check_command_installed(*process_utils.add_python_executable("mypy", "--version"))
-    _check_mypy_version()
-
-    target_paths = [str(resolve_path(base_dir, x)) for x in target.paths]
-    if len(target_paths) == 0:
-        return 0
-
+    cache: Optional[MypyCacheSetting] = None,
+) -> List[str]:
     extra_options: List[str] = ["--show-absolute-path"]
     if require_diagnostics:
         extra_options += [
@@ -227,14 +334,248 @@ def run(
     if target.namespace_packages:
         extra_options.append("--namespace-packages")
 
-    cmd = ["mypy"] + extra_options + ["--config-file", str(setting_path)] + target_paths
-    with change_dir(base_dir):
-        ret, stdout, _ = process_utils.run(
-            process_utils.add_python_executable(*cmd), reporter
-        )
+    if cache is not None:
+        extra_options += cache.as_options()
+
+    return extra_options
+
+
+def _add_tag(output: str, tag: Optional[str]) -> str:
+    if tag is None:
+        return output
+    return "".join(f"[{tag}] {line}" for line in output.splitlines(keepends=True))
+
+
+def _run_process(
+    cmd: Sequence[str],
+    reporter: Reporter,
+    buffer_output: bool,
+    tag: Optional[str] = None,
+    cwd: Optional[pathlib.Path] = None,
+) -> Tuple[int, str]:
+    if not buffer_output and tag is None:
+        ret, stdout, _ = process_utils.run(cmd, reporter, cwd=cwd)
+        return ret, stdout
+
+    # NOTE: log the outputs after the process finishes so that the outputs of mypy
+    # processes running concurrently are not interleaved
+    ret, stdout, stderr = process_utils.run(cmd, reporter, None, None, cwd=cwd)
+    process_utils.log_output(reporter, _add_tag(stdout, tag), _add_tag(stderr, tag))
+    return ret, stdout
+
+
+@contextlib.contextmanager
+def _target_arguments(
+    cmd: Sequence[str], target_paths: List[str]
+) -> Iterator[List[str]]:
+    # NOTE: mypy must check all the targets at once, so a long list of targets
+    # is passed through an argument file instead of being split into chunks
+    if process_utils.fits_command_line(
+        process_utils.add_python_executable(*cmd, *target_paths)
+    ):
+        yield target_paths
+    else:
+        with process_utils.argument_file(target_paths) as args_path:
+            yield [f"@{args_path}"]
 
-    if require_diagnostics:
-        diagnostics = parse_error_lines(stdout, logger=reporter.logger)
-        reporter.report_diagnostics(list(diagnostics))
 
+def _report_diagnostics(
+    reporter: Reporter,
+    ret: int,
+    stdout: str,
+    require_diagnostics: bool,
+    report_files: Optional[AbstractSet[pathlib.Path]] = None,
+    tag: Optional[str] = None,
+) -> int:
+    if not require_diagnostics:
+        return ret
+
+    diagnostics = list(parse_error_lines(stdout, logger=reporter.logger))
+    if tag is not None:
+        diagnostics = [
+            dataclasses.replace(d, message=f"[{tag}] {d.message}") for d in diagnostics
+        ]
+    if report_files is not None:
+        diagnostics = [d for d in diagnostics if d.file_path in report_files]
+        # NOTE: exit code 1 means that mypy found errors, possibly in other files
+        if ret == 1 and len(diagnostics) == 0:
+            ret = 0
+
+    reporter.report_diagnostics(diagnostics)
     return ret
+
+
+def run(
+    reporter: Reporter,
+    base_dir: pathlib.Path,
+    setting_path: pathlib.Path,
+    target: MypyTarget,
+    require_diagnostics: bool,
+    cache: Optional[MypyCacheSetting] = None,
+    buffer_output: bool = False,
+    tag: Optional[str] = None,
+) -> int:
+    """Checks `target` with mypy.
+
+    The outputs and the diagnostics are prefixed with `tag` if specified, which tells
+    apart the results of checks that run concurrently with different settings.
+    """
+    check_command_installed(*process_utils.add_python_executable("mypy", "--version"))
+    _check_mypy_version()
+
+    target_paths = [str(resolve_path(base_dir, x)) for x in target.paths]
+    if len(target_paths) == 0:
+        return 0
+
+    extra_options = _get_extra_options(target, require_diagnostics, cache)
+    cmd = ["mypy"] + extra_options + ["--config-file", str(setting_path)]
+    with contextlib.ExitStack() as stack:
+        args = stack.enter_context(_target_arguments(cmd, target_paths))
+        ret, stdout = _run_process(
+            process_utils.add_python_executable(*cmd, *args),
+            reporter,
+            buffer_output,
+            tag,
+            base_dir,
+        )
+
+    return _report_diagnostics(reporter, ret, stdout, require_diagnostics, tag=tag)
+
+
+def get_daemon_state_dir(cache_dir: Optional[pathlib.Path]) -> pathlib.Path:
+    if cache_dir is not None:
+        return cache_dir / "dmypy"
+
+    user = str(os.getuid()) if hasattr(os, "getuid") else "default"
+    return pathlib.Path(tempfile.gettempdir()) / f"pysen-dmypy-{user}"
+
+
+def get_daemon_dir(
+    state_dir: pathlib.Path,
+    base_dir: pathlib.Path,
+    target: MypyTarget,
+    require_diagnostics: bool,
+    cache: Optional[MypyCacheSetting] = None,
+) -> pathlib.Path:
+    # NOTE: a daemon is dedicated to a set of files and options since it rechecks
+    # everything when the files or the options change
+    key = json.dumps(
+        [
+            str(base_dir),
+            sys.executable,
+            sorted(str(p) for p in target.paths),
+            _get_extra_options(target, require_diagnostics, cache),
+        ]
+    )
+    return state_dir / hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def _get_daemon_fingerprint(setting_path: pathlib.Path) -> str:
+    return json.dumps(
+        {
+            "python": sys.version,
+            "mypy": str(get_version("mypy")),
+            "setting": hashlib.sha256(setting_path.read_bytes()).hexdigest(),
+        }
+    )
+
+
+@contextlib.contextmanager
+def _lock_daemon_dir(daemon_dir: pathlib.Path) -> Iterator[None]:
+    # NOTE: pysen processes that share a daemon must not restart it while
+    # another process is checking files
+    with (daemon_dir / "lock").open("a") as f:
+        if sys.platform == "win32":
+            yield
+            return
+
+        import fcntl
+
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def run_daemon(
+    reporter: Reporter,
+    base_dir: pathlib.Path,
+    setting_path: pathlib.Path,
+    target: MypyTarget,
+    require_diagnostics: bool,
+    state_dir: pathlib.Path,
+    report_files: Optional[AbstractSet[pathlib.Path]] = None,
+    cache: Optional[MypyCacheSetting] = None,
+    buffer_output: bool = False,
+    tag: Optional[str] = None,
+) -> int:
+    """Checks `target` with the mypy daemon (dmypy) that is kept running across runs.
+
+    The daemon is restarted when the exported setting, mypy or python changes,
+    and shuts itself down after being idle for `_DaemonIdleTimeout` seconds.
+    Only the diagnostics of `report_files` are reported if specified.
+    The results are prefixed with `tag` if specified as in `run`.
+    """
+    check_command_installed(*process_utils.add_python_executable("mypy", "--version"))
+    _check_mypy_version()
+
+    target_paths = [str(resolve_path(base_dir, x)) for x in target.paths]
+    if len(target_paths) == 0:
+        return 0
+
+    daemon_dir = get_daemon_dir(state_dir, base_dir, target, require_diagnostics, cache)
+    daemon_dir.mkdir(parents=True, exist_ok=True)
+    status_file = daemon_dir / "status.json"
+    fingerprint_path = daemon_dir / "fingerprint.json"
+    # NOTE: the setting is copied to a stable location since `setting_path` may be
+    # in a temporary directory, and the daemon restarts when the path changes
+    config_path = daemon_dir / setting_path.name
+    dmypy = ["mypy.dmypy", "--status-file", str(status_file)]
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(_lock_daemon_dir(daemon_dir))
+
+        fingerprint = _get_daemon_fingerprint(setting_path)
+        if not fingerprint_path.exists() or fingerprint_path.read_text() != fingerprint:
+            if status_file.exists():
+                reporter.logger.info(
+                    "Restarting mypy daemon since the setting or the version changed"
+                )
+                process_utils.run(
+                    process_utils.add_python_executable(*dmypy, "kill"),
+                    reporter,
+                    None,
+                    None,
+                )
+                # NOTE: `dmypy kill` leaves the status file, which makes `dmypy run`
+                # try to connect to the killed daemon
+                status_file.unlink(missing_ok=True)
+            shutil.copyfile(setting_path, config_path)
+            fingerprint_path.write_text(fingerprint)
+
+        cmd = (
+            dmypy
+            + ["run", "--timeout", str(_DaemonIdleTimeout)]
+            + ["--log-file", str(daemon_dir / "daemon.log"), "--"]
+            + _get_extra_options(target, require_diagnostics, cache)
+            + ["--config-file", str(config_path)]
+        )
+        args = stack.enter_context(_target_arguments(cmd, target_paths))
+        ret, stdout = _run_process(
+            process_utils.add_python_executable(*cmd, *args),
+            reporter,
+            buffer_output,
+            tag,
+            base_dir,
+        )
+
+    # NOTE: dmypy prints its own status like "Daemon started" to stdout
+    stdout = "".join(
+        line
+        for line in stdout.splitlines(keepends=True)
+        if not line.startswith(_DaemonMessagePrefixes)
+    )
+    return _report_diagnostics(
+        reporter, ret, stdout, require_diagnostics, report_files, tag
+    )
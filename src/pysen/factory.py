@@ -59,6 +59,8 @@ class ConfigureLintOptions:
     mypy_path: Optional[List[pathlib.Path]] = None
     mypy_plugins: Optional[List[MypyPlugin]] = None
     mypy_targets: Optional[List[MypyTarget]] = None
+    mypy_daemon: Optional[bool] = None
+    mypy_py_versions: Optional[List[PythonVersion]] = None
 
 
 def configure_lint(options: ConfigureLintOptions) -> List[ComponentBase]:
@@ -128,6 +130,8 @@ def configure_lint(options: ConfigureLintOptions) -> List[ComponentBase]:
             setting=mypy_setting,
             module_settings=mypy_module_settings,
             mypy_targets=options.mypy_targets,
+            daemon=bool(options.mypy_daemon),
+            py_versions=options.mypy_py_versions,
         )
         components.append(mypy)
 
@@ -4,12 +4,13 @@ from typing import DefaultDict, Optional, Sequence
 from pysen.ext import flake8_wrapper
 from pysen.ext.flake8_wrapper import Flake8Setting
 
+from . import resource_utils
 from .command import CommandBase
 from .component import LintComponentBase
 from .lint_command import LintCommandBase
 from .path import resolve_path
 from .reporter import Reporter
-from .runner_options import PathContext, RunOptions
+from .runner_options import ExecutionBackend, PathContext, RunOptions
 from .setting import SettingFile
 from .source import PythonFileFilter, Source
 
@@ -17,8 +18,18 @@ _SettingFileName = "setup.cfg"
 
 
 class Flake8Command(LintCommandBase):
-    def __init__(self, name: str, paths: PathContext, source: Source) -> None:
-        super().__init__(paths.base_dir, source)
+    def __init__(
+        self,
+        name: str,
+        paths: PathContext,
+        source: Source,
+        cache_dir: Optional[pathlib.Path] = None,
+        jobs: Optional[int] = None,
+        backend: ExecutionBackend = ExecutionBackend.SUBPROCESS,
+    ) -> None:
+        super().__init__(paths.base_dir, source, cache_dir)
+        self._jobs = jobs
+        self._backend = backend
         self._name = name
         self._setting_path = resolve_path(paths.settings_dir, _SettingFileName)
 
@@ -26,14 +37,36 @@ class Flake8Command(LintCommandBase):
     def name(self) -> str:
         return self._name
 
+    @property
+    def tools(self) -> Sequence[str]:
+        return ["flake8"]
+
     @property
     def has_side_effects(self) -> bool:
         return False
 
+    def _run(self, reporter: Reporter, files: Sequence[pathlib.Path]) -> int:
+        run = flake8_wrapper.run
+        if self._backend == ExecutionBackend.IN_PROCESS:
+            run = flake8_wrapper.run_in_process
+        return run(
+            reporter,
+            self.base_dir,
+            self._setting_path,
+            files,
+            resource_utils.get_num_jobs(self._jobs),
+        )
+
     def __call__(self, reporter: Reporter) -> int:
         sources = self._get_sources(reporter, PythonFileFilter)
         reporter.logger.info(f"Checking {len(sources)} files")
-        return flake8_wrapper.run(reporter, self.base_dir, self._setting_path, sources)
+        return self._run_cached(
+            reporter,
+            sources,
+            lambda files: self._run(reporter, files),
+            "flake8",
+            self._setting_path,
+        )
 
     def run_files(self, reporter: Reporter, files: Sequence[pathlib.Path]) -> int:
         covered_files = self._get_covered_files(reporter, files, PythonFileFilter)
@@ -41,7 +74,13 @@ class Flake8Command(LintCommandBase):
         if len(covered_files) == 0:
             return 0
 
-        return flake8_wrapper.run(reporter, self.base_dir, self._setting_path, files)
+        return self._run_cached(
+            reporter,
+            covered_files,
+            lambda files: self._run(reporter, files),
+            "flake8",
+            self._setting_path,
+        )
 
 
 class Flake8(LintComponentBase):
@@ -79,6 +118,13 @@ class Flake8(LintComponentBase):
         self, target: str, paths: PathContext, options: RunOptions
     ) -> CommandBase:
         if target == "lint":
-            return Flake8Command(self.name, paths, self.source)
+            return Flake8Command(
+                self.name,
+                paths,
+                self.source,
+                cache_dir=options.cache_dir,
+                jobs=options.jobs,
+                backend=options.backend,
+            )
 
         raise AssertionError(f"unknown {target}")
@@ -0,0 +1,513 @@
+import contextlib
+import contextvars
+import hashlib
+import importlib
+import importlib.util
+import json
+import logging
+import os
+import pathlib
+import runpy
+import select
+import signal
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from typing import IO, Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from . import memory_budget
+from ._version import __version__
+from .dist_version import get_version
+
+if sys.platform != "win32":
+    import fcntl
+
+_logger = logging.getLogger(__name__)
+
+# NOTE: tools that pysen runs with `python -m`
+DefaultModules = ["black", "isort", "flake8", "mypy"]
+# NOTE: the server shuts itself down after being idle for this period (seconds)
+_IdleTimeout = 30 * 60
+# NOTE: the server checks if it is still the owner of the socket at this interval
+_CheckInterval = 60.0
+_StartTimeout = 30.0
+_HeaderFormat = "!I"
+# NOTE: struct ucred of linux (pid, uid, gid)
+_PeerCredFormat = "3i"
+
+
+def is_supported() -> bool:
+    return (
+        hasattr(socket, "AF_UNIX")
+        and hasattr(socket, "send_fds")
+        and hasattr(os, "fork")
+        and hasattr(os, "wait4")
+    )
+
+
+def get_state_dir() -> pathlib.Path:
+    # NOTE: the path of a unix domain socket is limited to about 100 bytes,
+    # so the sockets are not placed under `cache_dir`
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return pathlib.Path(runtime_dir) / "pysen-forkserver"
+    user = str(os.getuid()) if hasattr(os, "getuid") else "default"
+    return pathlib.Path(tempfile.gettempdir()) / f"pysen-forkserver-{user}"
+
+
+def _ensure_private_dir(path: pathlib.Path) -> None:
+    """Creates `path` accessible only by the current user.
+
+    Raises PermissionError if `path` already exists and other users can modify it,
+    since anyone who can replace the socket would receive the commands and
+    the environment of pysen.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with contextlib.suppress(FileExistsError):
+        os.mkdir(path, 0o700)
+
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f"{path} is not a directory")
+    if st.st_uid != os.getuid():
+        raise PermissionError(f"{path} is not owned by the current user")
+    if st.st_mode & 0o077 != 0:
+        raise PermissionError(f"{path} is accessible by other users")
+
+
+def _check_peer(conn: socket.socket) -> None:
+    """Raises PermissionError unless the peer of `conn` runs as the current user."""
+    # NOTE: SO_PEERCRED is not available on some platforms, e.g., macOS.
+    # The permission of the state directory still keeps other users out.
+    if not hasattr(socket, "SO_PEERCRED"):
+        return
+    creds = conn.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize(_PeerCredFormat)
+    )
+    _, uid, _ = struct.unpack(_PeerCredFormat, creds)
+    if uid != os.getuid():
+        raise PermissionError(f"peer of the fork server runs as another user: {uid}")
+
+
+def _get_fingerprint(modules: Sequence[str]) -> str:
+    versions: Dict[str, Optional[str]] = {}
+    for m in sorted(modules):
+        try:
+            versions[m] = str(get_version(m))
+        except Exception:
+            versions[m] = None
+    return json.dumps([sys.executable, sys.version, __version__, versions])
+
+
+def get_socket_path(state_dir: pathlib.Path, modules: Sequence[str]) -> pathlib.Path:
+    # NOTE: a server is dedicated to a python and the versions of the tools, so that
+    # an upgraded tool is never run from the modules imported before the upgrade
+    key = hashlib.sha256(_get_fingerprint(modules).encode()).hexdigest()[:16]
+    return state_dir / f"{key}.sock"
+
+
+def _recv_exactly(conn: socket.socket, size: int) -> bytes:
+    ret = b""
+    while len(ret) < size:
+        chunk = conn.recv(size - len(ret))
+        if len(chunk) == 0:
+            raise ConnectionError("connection closed")
+        ret += chunk
+    return ret
+
+
+def _get_exit_code(code: Any) -> int:
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _run_module(request: Dict[str, Any], fds: List[int]) -> None:
+    code = 1
+    try:
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        for fd in [devnull, *fds]:
+            os.close(fd)
+
+        # NOTE: the process leads its own process group, so that the processes it
+        # starts are terminated together (see `process_utils._terminate_tree`)
+        os.setpgid(0, 0)
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        # NOTE: `python -m` puts the working directory at the top of `sys.path`
+        sys.path[0] = request["cwd"]
+        sys.argv = [request["module"], *request["args"]]
+        try:
+            runpy.run_module(request["module"], run_name="__main__", alter_sys=True)
+            code = 0
+        except SystemExit as e:
+            code = _get_exit_code(e.code)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+    finally:
+        with contextlib.suppress(Exception):
+            sys.stdout.flush()
+            sys.stderr.flush()
+        os._exit(code)
+
+
+def _handle(conn: socket.socket) -> None:
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, [signal.SIGTERM])
+        header, fds, _, _ = socket.recv_fds(conn, struct.calcsize(_HeaderFormat), 2)
+        (size,) = struct.unpack(_HeaderFormat, header)
+        request = json.loads(_recv_exactly(conn, size))
+
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            _run_module(request, fds)
+
+        for fd in fds:
+            os.close(fd)
+        # NOTE: set the process group here too, so that the group exists when the
+        # client receives the pid
+        with contextlib.suppress(OSError):
+            os.setpgid(pid, pid)
+        conn.sendall(json.dumps({"pid": pid}).encode() + b"\n")
+        _, status, rusage = os.wait4(pid, 0)
+        response = {
+            "returncode": os.waitstatus_to_exitcode(status),
+            "maxrss": rusage.ru_maxrss,
+        }
+        conn.sendall(json.dumps(response).encode() + b"\n")
+    finally:
+        os._exit(0)
+
+
+def _owns_socket(socket_path: pathlib.Path, inode: int) -> bool:
+    try:
+        return os.stat(socket_path).st_ino == inode
+    except OSError:
+        return False
+
+
+def _exit_server(signum: int, frame: Any) -> None:
+    sys.exit(0)
+
+
+def serve(
+    socket_path: pathlib.Path,
+    modules: Sequence[str],
+    idle_timeout: float = _IdleTimeout,
+) -> None:
+    """Imports `modules` and runs them in a forked process for each request.
+
+    The server never runs threads, so that it is safe to fork. It exits after
+    being idle for `idle_timeout` seconds or when another server replaces the socket.
+    """
+    for m in modules:
+        try:
+            importlib.import_module(m)
+        except Exception:
+            _logger.warning(f"failed to import {m}", exc_info=True)
+
+    # NOTE: handlers are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    # NOTE: remove the socket when the server is terminated
+    signal.signal(signal.SIGTERM, _exit_server)
+
+    # NOTE: bind a temporary path and rename it, so that clients connect to the socket
+    # only after the modules are imported
+    temp_path = socket_path.with_name(f"{socket_path.name}.{os.getpid()}")
+    with contextlib.suppress(FileNotFoundError):
+        temp_path.unlink()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(temp_path))
+    os.chmod(temp_path, 0o600)
+    server.listen(64)
+    os.replace(temp_path, socket_path)
+    inode = os.stat(socket_path).st_ino
+
+    last_active = time.monotonic()
+    try:
+        while True:
+            readable, _, _ = select.select([server], [], [], _CheckInterval)
+            if len(readable) == 0:
+                idle = time.monotonic() - last_active
+                if idle >= idle_timeout or not _owns_socket(socket_path, inode):
+                    return
+                continue
+
+            conn, _ = server.accept()
+            try:
+                _check_peer(conn)
+            except OSError:
+                _logger.warning("rejected a connection", exc_info=True)
+                conn.close()
+                continue
+
+            last_active = time.monotonic()
+            # NOTE: SIGTERM is deferred while forking, since the exception raised by
+            # `_exit_server` is ignored if it is raised in the hooks of `os.fork`
+            signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGTERM])
+            if os.fork() == 0:
+                server.close()
+                _handle(conn)
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, [signal.SIGTERM])
+            conn.close()
+    finally:
+        server.close()
+        if _owns_socket(socket_path, inode):
+            with contextlib.suppress(OSError):
+                socket_path.unlink()
+
+
+class ForkedProcess:
+    """A process forked by the fork server, which looks like `subprocess.Popen`."""
+
+    def __init__(
+        self,
+        conn: socket.socket,
+        response: IO[str],
+        pid: int,
+        stdout: IO[bytes],
+        stderr: IO[bytes],
+    ) -> None:
+        self._conn = conn
+        self._response = response
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode: Optional[int] = None
+        self._started = time.monotonic()
+
+    def wait(self) -> int:
+        if self.returncode is not None:
+            return self.returncode
+
+        line = self._response.readline()
+        if len(line) == 0:
+            raise ConnectionError("fork server closed the connection")
+        response = json.loads(line)
+        memory_budget.record_peak_rss(response["maxrss"], self._started)
+        self.returncode = int(response["returncode"])
+        return self.returncode
+
+    def kill(self) -> None:
+        with contextlib.suppress(ProcessLookupError):
+            os.kill(self.pid, signal.SIGKILL)
+
+    def close(self) -> None:
+        closeables: List[Any] = [self.stdout, self.stderr, self._response, self._conn]
+        for f in closeables:
+            with contextlib.suppress(OSError):
+                f.close()
+
+    def __enter__(self) -> "ForkedProcess":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+class ForkServerClient:
+    def __init__(self, socket_path: pathlib.Path, modules: Sequence[str]) -> None:
+        self._socket_path = socket_path
+        self._modules = list(modules)
+
+    @property
+    def socket_path(self) -> pathlib.Path:
+        return self._socket_path
+
+    def supports(self, cmd: Sequence[str]) -> bool:
+        """Checks if `cmd` is `python -m <module>` of one of the imported modules."""
+        return (
+            len(cmd) >= 3
+            and cmd[0] == sys.executable
+            and cmd[1] == "-m"
+            and cmd[2].split(".")[0] in self._modules
+        )
+
+    def _connect(self) -> Optional[socket.socket]:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(str(self._socket_path))
+        except OSError:
+            conn.close()
+            return None
+
+        try:
+            _check_peer(conn)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def _start_server(self) -> None:
+        subprocess.Popen(
+            [sys.executable, "-m", "pysen.fork_server", str(self._socket_path)]
+            + self._modules,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            # NOTE: the server outlives pysen, and must not receive the signals
+            # sent to the terminal of pysen
+            start_new_session=True,
+        )
+
+    @contextlib.contextmanager
+    def _lock(self) -> Iterator[None]:
+        with self._socket_path.with_suffix(".lock").open("a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def connect(self) -> socket.socket:
+        """Connects to the server, starting a new server if it is not running."""
+        # NOTE: check the directory before trusting the socket in it
+        _ensure_private_dir(self._socket_path.parent)
+        conn = self._connect()
+        if conn is not None:
+            return conn
+
+        # NOTE: pysen processes running concurrently must not start servers twice
+        with self._lock():
+            conn = self._connect()
+            if conn is not None:
+                return conn
+
+            _logger.info("Starting fork server")
+            self._start_server()
+            deadline = time.monotonic() + _StartTimeout
+            while time.monotonic() < deadline:
+                conn = self._connect()
+                if conn is not None:
+                    return conn
+                time.sleep(0.05)
+
+        raise ConnectionError(f"failed to start fork server: {self._socket_path}")
+
+    def _request(
+        self,
+        cmd: Sequence[str],
+        stdout_fd: int,
+        stderr_fd: int,
+        cwd: Optional[pathlib.Path] = None,
+    ) -> Tuple[socket.socket, IO[str], int]:
+        assert self.supports(cmd)
+        conn = self.connect()
+        # NOTE: the server sends the pid, and then the result of the process
+        # on the same connection
+        response = conn.makefile("r")
+        try:
+            request = {
+                "module": cmd[2],
+                "args": list(cmd[3:]),
+                "cwd": str(cwd) if cwd is not None else os.getcwd(),
+                "env": dict(os.environ),
+            }
+            body = json.dumps(request).encode()
+            header = struct.pack(_HeaderFormat, len(body))
+            socket.send_fds(conn, [header], [stdout_fd, stderr_fd])
+            conn.sendall(body)
+
+            line = response.readline()
+            if len(line) == 0:
+                raise ConnectionError("fork server closed the connection")
+            pid = int(json.loads(line)["pid"])
+        except BaseException:
+            response.close()
+            conn.close()
+            raise
+
+        return conn, response, pid
+
+    def spawn(
+        self, cmd: Sequence[str], cwd: Optional[pathlib.Path] = None
+    ) -> ForkedProcess:
+        """Runs `python -m <module>` of `cmd` in a process forked by the server.
+
+        The outputs of the process are available as `stdout` and `stderr` of the
+        returned process, like `subprocess.Popen` with `stdout=PIPE, stderr=PIPE`.
+        The process runs in `cwd` if specified, or the current working directory.
+        """
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        try:
+            conn, response, pid = self._request(cmd, stdout_w, stderr_w, cwd)
+        except BaseException:
+            os.close(stdout_r)
+            os.close(stderr_r)
+            raise
+        finally:
+            os.close(stdout_w)
+            os.close(stderr_w)
+
+        stdout = open(stdout_r, "rb")
+        stderr = open(stderr_r, "rb")
+        return ForkedProcess(conn, response, pid, stdout, stderr)
+
+    def call(self, cmd: Sequence[str]) -> int:
+        """Runs `cmd` like `subprocess.call` with the outputs discarded."""
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        try:
+            conn, response, pid = self._request(cmd, devnull, devnull)
+        finally:
+            os.close(devnull)
+
+        with contextlib.closing(conn), contextlib.closing(response):
+            line = response.readline()
+            if len(line) == 0:
+                raise ConnectionError("fork server closed the connection")
+            return int(json.loads(line)["returncode"])
+
+
+_current_client: contextvars.ContextVar[
+    Optional[ForkServerClient]
+] = contextvars.ContextVar("fork_server", default=None)
+
+
+def get_client() -> Optional[ForkServerClient]:
+    return _current_client.get()
+
+
+@contextlib.contextmanager
+def fork_server_scope(
+    enabled: bool, modules: Optional[Sequence[str]] = None
+) -> Iterator[Optional[ForkServerClient]]:
+    """Runs the tools in `modules` through the fork server while the context is active.
+
+    Only the modules that are installed are imported by the server.
+    """
+    if not enabled or not is_supported():
+        yield None
+        return
+
+    installed = [
+        m
+        for m in (modules or DefaultModules)
+        if importlib.util.find_spec(m) is not None
+    ]
+    client = ForkServerClient(get_socket_path(get_state_dir(), installed), installed)
+    token = _current_client.set(client)
+    try:
+        yield client
+    finally:
+        _current_client.reset(token)
+
+
+if __name__ == "__main__":
+    serve(pathlib.Path(sys.argv[1]), sys.argv[2:])
@@ -1,102 +1,418 @@
 import functools
 import logging
+import mmap
 import os
 import pathlib
+import stat
+import struct
 import threading
-from typing import Sequence, Tuple, cast
+from typing import (
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
 _logger = logging.getLogger(__name__)
 _lock = threading.Lock()
+_index_lock = threading.Lock()
 
-try:
-    import git
-    from git import Blob  # type: ignore
+# NOTE: See https://git-scm.com/docs/index-format for the layout of the index file.
+# Each entry starts with ctime, mtime, dev, ino, mode, uid, gid, size (32-bit each),
+# followed by a 20-byte object name and 16-bit flags.
+_INDEX_SIGNATURE = b"DIRC"
+_INDEX_HEADER = struct.Struct(">4sII")
+_INDEX_ENTRY_HEADER = struct.Struct(">10I20sH")
+_INDEX_EXTENDED_FLAG = 0x4000
+_INDEX_NAME_MASK = 0x0FFF
+_INDEX_EXTENSION_HEADER = struct.Struct(">4sI")
+# NOTE: the index file ends with a checksum of SHA-1 (or SHA-256)
+_INDEX_CHECKSUM_SIZE = 20
+_GITLINK_MODE = 0o160000
+# NOTE: entries of a split index are partly stored in `sharedindex.*` files,
+# and a sparse index stores directories out of the sparse-checkout cone as entries.
+# These indexes are read by `git ls-files` instead.
+_UNSUPPORTED_EXTENSIONS = {b"link": "split index", b"sdir": "sparse index"}
 
-    # NOTE: Upstream issue: https://github.com/gitpython-developers/GitPython/issues/1349
-
-    _git_available = True
-except ImportError:
-    _git_available = False
-    _logger.warning("[pysen.git_utils] git is not available")
+_Buffer = Union[bytes, mmap.mmap]
 
 
 class GitRepositoryNotFoundError(Exception):
     pass
 
 
-def _check_git_enabled() -> bool:
-    if not _git_available:
-        return False
+class GitRevisionNotFoundError(Exception):
+    pass
+
+
+class InvalidGitIndexError(Exception):
+    pass
+
+
+class UnsupportedGitIndexError(InvalidGitIndexError):
+    pass
+
+
+class IndexEntry(NamedTuple):
+    path: str  # relative to the working tree, separated by "/"
+    mode: int
+    size: int
+    mtime_ns: int
+
 
+class _Repository(NamedTuple):
+    working_tree_dir: str
+    git_dir: str
+
+
+def _check_git_enabled() -> bool:
     if os.environ.get("PYSEN_IGNORE_GIT", "0") != "0":
         return False
 
     return True
 
 
+def _find_repository(path: pathlib.Path) -> Optional[_Repository]:
+    abspath = path.expanduser().resolve()
+    for d in (abspath, *abspath.parents):
+        dot_git = d / ".git"
+        if dot_git.is_dir():
+            return _Repository(str(d), str(dot_git))
+        if dot_git.is_file():
+            # worktrees and submodules have a .git file that points to the git dir
+            try:
+                content = dot_git.read_text().strip()
+            except OSError:
+                continue
+            if content.startswith("gitdir:"):
+                git_dir = d / content[len("gitdir:") :].strip()
+                return _Repository(str(d), str(git_dir.resolve()))
+
+    return None
+
+
+def _get_repository(path: pathlib.Path) -> _Repository:
+    repo = _find_repository(path)
+    if repo is None:
+        raise GitRepositoryNotFoundError()
+    return repo
+
+
+def _decode_varint(buf: _Buffer, offset: int) -> Tuple[int, int]:
+    c = buf[offset]
+    offset += 1
+    value = c & 0x7F
+    while c & 0x80:
+        c = buf[offset]
+        offset += 1
+        value = ((value + 1) << 7) | (c & 0x7F)
+    return value, offset
+
+
+def _find_nul(buf: _Buffer, offset: int) -> int:
+    end = buf.find(b"\0", offset)
+    if end < 0:
+        raise InvalidGitIndexError("index file is truncated")
+    return end
+
+
+def _parse_index(buf: _Buffer) -> Tuple[IndexEntry, ...]:
+    if len(buf) < _INDEX_HEADER.size:
+        raise InvalidGitIndexError("index file is too short")
+
+    signature, version, num_entries = _INDEX_HEADER.unpack_from(buf, 0)
+    if signature != _INDEX_SIGNATURE:
+        raise InvalidGitIndexError("invalid signature")
+    if version not in (2, 3, 4):
+        raise InvalidGitIndexError(f"unsupported index version: {version}")
+
+    entries: List[IndexEntry] = []
+    offset = _INDEX_HEADER.size
+    prev_path = b""
+    try:
+        for _ in range(num_entries):
+            entry_offset = offset
+            header = _INDEX_ENTRY_HEADER.unpack_from(buf, offset)
+            mtime_s, mtime_ns, mode, size, flags = (
+                header[2],
+                header[3],
+                header[6],
+                header[9],
+                header[11],
+            )
+            offset += _INDEX_ENTRY_HEADER.size
+            if version >= 3 and flags & _INDEX_EXTENDED_FLAG:
+                offset += 2
+
+            if version == 4:
+                # paths are prefix-compressed against the previous entry
+                strip_len, offset = _decode_varint(buf, offset)
+                end = _find_nul(buf, offset)
+                path = prev_path[: len(prev_path) - strip_len] + buf[offset:end]
+                offset = end + 1
+            else:
+                name_len = flags & _INDEX_NAME_MASK
+                if name_len < _INDEX_NAME_MASK:
+                    end = offset + name_len
+                else:
+                    end = _find_nul(buf, offset)
+                path = buf[offset:end]
+                # entries are padded with 1-8 NUL bytes to a multiple of 8 bytes
+                offset = entry_offset + ((end - entry_offset + 8) & ~7)
+
+            prev_path = path
+            entries.append(
+                IndexEntry(
+                    os.fsdecode(path), mode, size, mtime_s * 1_000_000_000 + mtime_ns
+                )
+            )
+
+        while offset + _INDEX_EXTENSION_HEADER.size <= len(buf) - _INDEX_CHECKSUM_SIZE:
+            signature, size = _INDEX_EXTENSION_HEADER.unpack_from(buf, offset)
+            if signature in _UNSUPPORTED_EXTENSIONS:
+                raise UnsupportedGitIndexError(
+                    f"{_UNSUPPORTED_EXTENSIONS[signature]} is not supported"
+                )
+            offset += _INDEX_EXTENSION_HEADER.size + size
+    except (struct.error, ValueError, IndexError):
+        raise InvalidGitIndexError("index file is truncated") from None
+
+    return tuple(entries)
+
+
+def read_index(index_path: pathlib.Path) -> Tuple[IndexEntry, ...]:
+    """Parses a git index file (version 2, 3 or 4) and returns its entries.
+
+    `UnsupportedGitIndexError` is raised for a split index or a sparse index.
+    """
+    with index_path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return _parse_index(buf)
+
+
+class _Index(NamedTuple):
+    entries: Tuple[IndexEntry, ...]
+    paths: FrozenSet[str]
+
+
+def _list_index_entries(repo: _Repository) -> Tuple[IndexEntry, ...]:
+    # NOTE: GitPython is imported lazily since importing it is slow
+    try:
+        import git
+    except ImportError:
+        raise InvalidGitIndexError("git is not available") from None
+
+    try:
+        with _lock, git.Repo(repo.working_tree_dir) as r:
+            output = r.git.ls_files("--stage", "-z")
+    except (git.InvalidGitRepositoryError, git.GitCommandError) as e:
+        raise InvalidGitIndexError(f"git ls-files failed: {e}") from None
+
+    entries: List[IndexEntry] = []
+    for record in output.split("\0"):
+        if len(record) == 0:
+            continue
+        # <mode> <object> <stage>\t<path>
+        info, path = record.split("\t", 1)
+        # NOTE: git ls-files doesn't show the size and mtime of entries
+        entries.append(IndexEntry(path, int(info.split(" ", 1)[0], 8), 0, 0))
+
+    return tuple(entries)
+
+
+@functools.lru_cache(8)
+def _read_index_cached(
+    repo: _Repository, index_path: str, mtime_ns: int, size: int, inode: int
+) -> _Index:
+    try:
+        entries = read_index(pathlib.Path(index_path))
+    except UnsupportedGitIndexError as e:
+        _logger.debug(f"[pysen.git_utils] {e}: {index_path}. using git ls-files")
+        entries = _list_index_entries(repo)
+    return _Index(entries, frozenset(e.path for e in entries))
+
+
+def _get_index_path(repo: _Repository) -> str:
+    index_file = os.environ.get("GIT_INDEX_FILE")
+    if index_file:
+        return os.path.abspath(index_file)
+    return os.path.join(repo.git_dir, "index")
+
+
+def _load_index(repo: _Repository) -> _Index:
+    """Returns the entries of the index of `repo`.
+
+    `InvalidGitIndexError` is raised when the index can be read neither natively
+    nor by git.
+    """
+    index_path = _get_index_path(repo)
+    try:
+        st = os.stat(index_path)
+    except FileNotFoundError:
+        # a repository without any staged files has no index
+        return _Index((), frozenset())
+
+    # NOTE: the parsed index is reused until the index file is rewritten
+    with _index_lock:
+        return _read_index_cached(
+            repo, index_path, st.st_mtime_ns, st.st_size, st.st_ino
+        )
+
+
 def check_git_available(target_dir: pathlib.Path) -> bool:
-    with _lock:
-        try:
-            if not _check_git_enabled():
-                return False
+    if not _check_git_enabled():
+        return False
 
-            with git.Repo(target_dir, search_parent_directories=True):
-                return True
-        except git.InvalidGitRepositoryError:
-            return False
+    return _find_repository(target_dir) is not None
 
 
 def _list_indexed_files(target_dir: pathlib.Path) -> Sequence[pathlib.Path]:
     if not _check_git_enabled():
         return []
 
+    repo = _get_repository(target_dir)
+    index = _load_index(repo)
+
     # Ensure abs_target_dir ends with /
-    # We avoid pathlib.Path because the loop calling predicate is performance critical.
+    # We avoid pathlib.Path because the loop is performance critical.
     abs_target_dir = os.path.join(str(target_dir.resolve()), "")
+    working_tree_dir = repo.working_tree_dir
 
-    def predicate(item: Tuple[int, Blob]) -> bool:
-        blob = item[1]
-        ret: bool = blob.abspath.startswith(abs_target_dir)
-        return ret
+    ret: List[pathlib.Path] = []
+    seen = set()
+    for entry in index.entries:
+        if stat.S_IFMT(entry.mode) == _GITLINK_MODE or entry.path in seen:
+            continue
+        # NOTE: unmerged paths have an entry for each stage
+        seen.add(entry.path)
 
-    try:
-        with git.Repo(target_dir, search_parent_directories=True) as repo:
-            deleted_files = set(
-                diff.a_blob.abspath
-                for diff in repo.index.diff(None)
-                if diff.change_type == "D"
-            )
-            blobs = set(blob.abspath for _, blob in repo.index.iter_blobs(predicate))
-            return [pathlib.Path(abspath) for abspath in blobs - deleted_files]
-    except git.InvalidGitRepositoryError:
-        raise GitRepositoryNotFoundError() from None
+        abspath = os.path.join(working_tree_dir, entry.path)
+        if not abspath.startswith(abs_target_dir):
+            continue
+
+        # files deleted from the working tree without being staged are excluded
+        try:
+            os.lstat(abspath)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+
+        ret.append(pathlib.Path(abspath))
+
+    return ret
 
 
 @functools.lru_cache(8)
 def list_indexed_files(target_dir: pathlib.Path) -> Sequence[pathlib.Path]:
-    with _lock:
-        return _list_indexed_files(target_dir)
+    return _list_indexed_files(target_dir)
 
 
-def _check_tracked(path: pathlib.Path) -> bool:
+def _is_tracked(repo: _Repository, abspath: str) -> bool:
+    relpath = os.path.relpath(abspath, repo.working_tree_dir)
+    if relpath.startswith(os.pardir):
+        return False
+
+    return pathlib.Path(relpath).as_posix() in _load_index(repo).paths
+
+
+def check_tracked(path: pathlib.Path) -> bool:
     if not _check_git_enabled():
         return False
 
-    # TODO(igarashi) use git command directly for better performance
-    abspath = str(path.expanduser().resolve())
+    repo = _get_repository(path)
+    return _is_tracked(repo, str(path.expanduser().resolve()))
+
+
+def check_tracked_files(
+    paths: Iterable[pathlib.Path],
+) -> Tuple[Set[pathlib.Path], Set[pathlib.Path]]:
+    """Returns a set of paths tracked in git and a set of paths outside any repository.
+
+    Unlike calling `check_tracked` for each path, the index of each repository is
+    loaded only once.
+    """
+    tracked: Set[pathlib.Path] = set()
+    outside: Set[pathlib.Path] = set()
+    if not _check_git_enabled():
+        return tracked, outside
+
+    repositories: Dict[pathlib.Path, Optional[_Repository]] = {}
+    for path in paths:
+        abspath = path.expanduser().resolve()
+        parent = abspath.parent
+        if parent not in repositories:
+            repositories[parent] = _find_repository(parent)
+
+        repo = repositories[parent]
+        if repo is None:
+            outside.add(path)
+        elif _is_tracked(repo, str(abspath)):
+            tracked.add(path)
+
+    return tracked, outside
 
-    def predicate(item: Tuple[int, Blob]) -> bool:
-        blob = item[1]
-        return cast(bool, blob.abspath == abspath)
+
+def _list_changed_files(
+    target_dir: pathlib.Path, since: Optional[str], staged: bool
+) -> List[pathlib.Path]:
+    if not _check_git_enabled():
+        raise GitRepositoryNotFoundError()
+
+    # NOTE: GitPython is imported lazily since importing it is slow
+    try:
+        import git
+    except ImportError:
+        _logger.warning("[pysen.git_utils] git is not available")
+        raise GitRepositoryNotFoundError() from None
+
+    # NOTE: deleted files are excluded by --diff-filter
+    diff_options = ["--name-only", "-z", "--no-renames", "--diff-filter=d"]
 
     try:
-        with git.Repo(path, search_parent_directories=True) as repo:
-            items = list(repo.index.iter_blobs(predicate))
-            return len(items) > 0
+        with git.Repo(target_dir, search_parent_directories=True) as repo:
+            assert repo.working_tree_dir is not None
+            working_tree_dir = pathlib.Path(repo.working_tree_dir).resolve()
+
+            if staged:
+                output = repo.git.diff("--cached", *diff_options)
+            else:
+                assert since is not None
+                try:
+                    merge_bases = repo.merge_base(since, "HEAD")
+                except git.GitCommandError:
+                    raise GitRevisionNotFoundError(since) from None
+                if len(merge_bases) == 0:
+                    raise GitRevisionNotFoundError(since)
+
+                # compare the working tree with the fork point of `since`
+                # so that changes made in `since` after the fork are not included
+                merge_base = merge_bases[0]
+                assert merge_base is not None
+                output = repo.git.diff(merge_base.hexsha, *diff_options)
     except git.InvalidGitRepositoryError:
         raise GitRepositoryNotFoundError() from None
 
+    return [working_tree_dir / p for p in output.split("\0") if len(p) > 0]
+
+
+def list_changed_files(
+    target_dir: pathlib.Path,
+    *,
+    since: Optional[str] = None,
+    staged: bool = False,
+) -> List[pathlib.Path]:
+    """Returns files changed since the merge base of `since` and HEAD,
+    or files staged for the next commit if `staged` is True.
+    """
+    if (since is None) == (not staged):
+        raise ValueError("only one of since and staged must be specified")
 
-def check_tracked(path: pathlib.Path) -> bool:
     with _lock:
-        return _check_tracked(path)
+        return _list_changed_files(target_dir, since, staged)
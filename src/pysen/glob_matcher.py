@@ -0,0 +1,171 @@
+import os
+import pathlib
+import re
+from typing import Iterable, List, Optional, Pattern
+
+_RECURSIVE = "**"
+
+
+def _translate_component(component: str) -> str:
+    # NOTE: a wildcard in a component never matches the path separator
+    ret: List[str] = []
+    i = 0
+    n = len(component)
+    while i < n:
+        c = component[i]
+        if c == "*":
+            ret.append("[^/]*")
+        elif c == "?":
+            ret.append("[^/]")
+        elif c == "[":
+            j = i + 1
+            if j < n and component[j] == "!":
+                j += 1
+            if j < n and component[j] == "]":
+                j += 1
+            j = component.find("]", j)
+            if j < 0:
+                ret.append(re.escape(c))
+            else:
+                content = component[i + 1 : j].replace("\\", "\\\\")
+                # escape characters that may form nested sets or set operations
+                content = re.sub(r"([\[&~|])", r"\\\1", content)
+                if content.startswith("!"):
+                    content = "^" + content[1:]
+                elif content.startswith("^"):
+                    content = "\\" + content
+                ret.append(f"[{content}]")
+                i = j
+        else:
+            ret.append(re.escape(c))
+        i += 1
+
+    return "".join(ret)
+
+
+def _translate(components: List[str]) -> str:
+    ret: List[str] = []
+    for i, c in enumerate(components):
+        if c == _RECURSIVE:
+            # zero or more directories
+            ret.append("(?:[^/]+/)*")
+        else:
+            ret.append(_translate_component(c))
+            if i + 1 < len(components):
+                ret.append("/")
+
+    return "".join(ret)
+
+
+def _split_pattern(pattern: str) -> List[str]:
+    # NOTE: pathlib ignores empty and "." components
+    return [c for c in pattern.split("/") if c not in ("", ".")]
+
+
+def is_supported_pattern(pattern: str) -> bool:
+    """Checks if `pattern` can be compiled into `GlobMatcher`.
+
+    Absolute patterns, patterns with ".." and invalid recursive wildcards are not
+    supported, and should be evaluated by `pathlib.Path.glob` instead.
+    """
+    if len(pattern) == 0 or os.path.isabs(pattern):
+        return False
+
+    for c in pattern.split("/"):
+        if c == "..":
+            return False
+        if _RECURSIVE in c and c != _RECURSIVE:
+            return False
+
+    return True
+
+
+class GlobMatcher:
+    """Evaluates patterns of `pathlib.Path.glob` relative to `base_dir` at once.
+
+    All patterns are compiled into a single regular expression, so that files listed
+    by git or by a single directory traversal are matched without walking the
+    directory tree for each pattern.
+    """
+
+    def __init__(self, base_dir: pathlib.Path, patterns: Iterable[str]) -> None:
+        self._base_dir = base_dir
+        self._prefix = os.path.join(str(base_dir), "")
+
+        matches: List[str] = []
+        dir_matches: List[str] = []
+        parent_matches: List[str] = []
+        self._match_all_children = False
+
+        for pattern in patterns:
+            if not is_supported_pattern(pattern):
+                raise ValueError(f"unsupported pattern: {pattern}")
+
+            components = _split_pattern(pattern)
+            # NOTE: a pattern ending with "**" matches only directories
+            dir_only = len(components) == 0 or components[-1] == _RECURSIVE
+            while len(components) > 0 and components[-1] == _RECURSIVE:
+                components.pop()
+
+            if len(components) == 0:
+                # base_dir itself matches ("." or "**")
+                self._match_all_children = True
+                continue
+
+            regex = _translate(components)
+            if dir_only:
+                # subdirectories of the matched directories are also matched
+                dir_matches.append(f"{regex}(?:/.*)?")
+            else:
+                matches.append(regex)
+                dir_matches.append(regex)
+            parent_matches.append(regex)
+
+        self._match = self._compile(f"(?:{'|'.join(matches)})$", matches)
+        self._dir_match = self._compile(f"(?:{'|'.join(dir_matches)})$", dir_matches)
+        self._parent_match = self._compile(
+            f"(?:{'|'.join(parent_matches)})/", parent_matches
+        )
+
+    @staticmethod
+    def _compile(regex: str, patterns: List[str]) -> Optional[Pattern[str]]:
+        if len(patterns) == 0:
+            return None
+        return re.compile(regex)
+
+    @property
+    def base_dir(self) -> pathlib.Path:
+        return self._base_dir
+
+    def relative(self, path: str) -> Optional[str]:
+        """Returns `path` relative to `base_dir` if `path` is under `base_dir`."""
+        if not path.startswith(self._prefix):
+            return None
+
+        relpath = path[len(self._prefix) :]
+        if os.sep != "/":
+            relpath = relpath.replace(os.sep, "/")
+        return relpath
+
+    def match(self, relpath: str, is_dir: bool = False) -> bool:
+        """Checks if `base_dir.glob(pattern)` yields `relpath` for any pattern."""
+        if is_dir and self._match_all_children:
+            return True
+        regex = self._dir_match if is_dir else self._match
+        return regex is not None and regex.match(relpath) is not None
+
+    def match_parent(self, relpath: str) -> bool:
+        """Checks if `base_dir.glob(pattern)` yields any parent directory of `relpath`."""
+        if self._match_all_children:
+            return True
+        return (
+            self._parent_match is not None
+            and self._parent_match.match(relpath) is not None
+        )
+
+    def contains(self, path: str, is_dir: bool = False) -> bool:
+        """Checks if `path` or any of its parent directories is matched."""
+        relpath = self.relative(path)
+        if relpath is None:
+            return False
+        return self.match(relpath, is_dir) or self.match_parent(relpath)
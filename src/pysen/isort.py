@@ -1,6 +1,7 @@
 import pathlib
 from typing import DefaultDict, Optional, Sequence
 
+from . import resource_utils
 from .command import CommandBase
 from .component import LintComponentBase
 from .ext import isort_wrapper
@@ -9,7 +10,7 @@ from .ext.isort_wrapper import IsortSetting
 from .lint_command import LintCommandBase
 from .path import resolve_path
 from .reporter import Reporter
-from .runner_options import PathContext, RunOptions
+from .runner_options import ExecutionBackend, PathContext, RunOptions
 from .setting import SettingFile
 from .source import PythonFileFilter, Source
 
@@ -23,8 +24,13 @@ class IsortCommand(LintCommandBase):
         paths: PathContext,
         source: Source,
         inplace_edit: bool,
+        cache_dir: Optional[pathlib.Path] = None,
+        jobs: Optional[int] = None,
+        backend: ExecutionBackend = ExecutionBackend.SUBPROCESS,
     ) -> None:
-        super().__init__(paths.base_dir, source)
+        super().__init__(paths.base_dir, source, cache_dir)
+        self._jobs = jobs
+        self._backend = backend
         self._name = name
         self._setting_path = resolve_path(paths.settings_dir, _SettingFileName)
         self._inplace_edit = inplace_edit
@@ -33,15 +39,37 @@ class IsortCommand(LintCommandBase):
     def name(self) -> str:
         return self._name
 
+    @property
+    def tools(self) -> Sequence[str]:
+        return ["isort"]
+
     @property
     def has_side_effects(self) -> bool:
         return self._inplace_edit
 
+    def _run(self, reporter: Reporter, files: Sequence[pathlib.Path]) -> int:
+        run = isort_wrapper.run
+        if self._backend == ExecutionBackend.IN_PROCESS:
+            run = isort_wrapper.run_in_process
+        return run(
+            reporter,
+            self.base_dir,
+            self._setting_path,
+            files,
+            self._inplace_edit,
+            resource_utils.get_num_jobs(self._jobs),
+        )
+
     def __call__(self, reporter: Reporter) -> int:
         sources = self._get_sources(reporter, PythonFileFilter)
         reporter.logger.info(f"Checking {len(sources)} files")
-        return isort_wrapper.run(
-            reporter, self.base_dir, self._setting_path, sources, self._inplace_edit
+        return self._run_cached(
+            reporter,
+            sources,
+            lambda files: self._run(reporter, files),
+            "isort",
+            self._setting_path,
+            self._inplace_edit,
         )
 
     def run_files(self, reporter: Reporter, files: Sequence[pathlib.Path]) -> int:
@@ -50,11 +78,12 @@ class IsortCommand(LintCommandBase):
         if len(covered_files) == 0:
             return 0
 
-        return isort_wrapper.run(
+        return self._run_cached(
             reporter,
-            self.base_dir,
+            covered_files,
+            lambda files: self._run(reporter, files),
+            "isort",
             self._setting_path,
-            files,
             self._inplace_edit,
         )
 
@@ -94,8 +123,24 @@ class Isort(LintComponentBase):
         self, target: str, paths: PathContext, options: RunOptions
     ) -> CommandBase:
         if target == "lint":
-            return IsortCommand(self.name, paths, self.source, False)
+            return IsortCommand(
+                self.name,
+                paths,
+                self.source,
+                False,
+                cache_dir=options.cache_dir,
+                jobs=options.jobs,
+                backend=options.backend,
+            )
         elif target == "format":
-            return IsortCommand(self.name, paths, self.source, True)
+            return IsortCommand(
+                self.name,
+                paths,
+                self.source,
+                True,
+                cache_dir=options.cache_dir,
+                jobs=options.jobs,
+                backend=options.backend,
+            )
 
         raise AssertionError(f"unknown {target}")
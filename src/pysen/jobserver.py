@@ -0,0 +1,305 @@
+import contextlib
+import contextvars
+import logging
+import os
+import re
+import select
+import stat
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple, TypeVar, cast
+
+from . import resource_utils
+
+_logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# NOTE: GNU make >= 4.2 uses `--jobserver-auth`, older versions use `--jobserver-fds`.
+# The value is either `R,W` (inherited pipe fds) or `fifo:PATH` (make >= 4.4).
+_JobServerAuthPattern = re.compile(r"--jobserver-(?:auth|fds)=(\S+)")
+# NOTE: threads waiting for a token wake up periodically to see if they are still needed
+_PollInterval = 0.05
+
+
+class JobServer(ABC):
+    """A pool of job tokens shared by pysen and its child processes.
+
+    Following the protocol of GNU make, every process implicitly owns one token,
+    so `acquire` is required only for jobs that run in addition to the first one.
+    """
+
+    @abstractmethod
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        ...
+
+    @abstractmethod
+    def release(self) -> None:
+        ...
+
+
+class LocalJobServer(JobServer):
+    """A jobserver of `jobs` tokens (including the implicit one) inside this process."""
+
+    def __init__(self, jobs: int) -> None:
+        self._jobs = max(1, jobs)
+        self._semaphore = threading.BoundedSemaphore(self._jobs)
+        # take the implicit token
+        self._semaphore.acquire()
+
+    @property
+    def jobs(self) -> int:
+        return self._jobs
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        return self._semaphore.acquire(timeout=timeout)
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+
+class PipeJobServer(JobServer):
+    """A client of the jobserver of GNU make.
+
+    A token is a byte read from the jobserver pipe, and must be written back
+    to the pipe as is when released.
+    """
+
+    def __init__(self, read_fd: int, write_fd: int) -> None:
+        self._read_fd = read_fd
+        self._write_fd = write_fd
+        self._lock = threading.Lock()
+        self._tokens: List[bytes] = []
+
+    def _read_token(self, timeout: Optional[float]) -> Optional[bytes]:
+        try:
+            readable, _, _ = select.select([self._read_fd], [], [], timeout)
+        except InterruptedError:
+            return None
+        if len(readable) == 0:
+            return None
+
+        try:
+            token = os.read(self._read_fd, 1)
+        except (BlockingIOError, InterruptedError):
+            # another process took the token first
+            return None
+
+        if len(token) == 0:
+            # NOTE: make has exited and closed the pipe. Wait as if no tokens are
+            # available so that only the implicit token is used.
+            if timeout is not None:
+                time.sleep(timeout)
+            return None
+
+        return token
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+
+            token = self._read_token(remaining)
+            if token is not None:
+                with self._lock:
+                    self._tokens.append(token)
+                return True
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+    def release(self) -> None:
+        with self._lock:
+            token = self._tokens.pop()
+        os.write(self._write_fd, token)
+
+
+def _is_fifo(fd: int) -> bool:
+    try:
+        return stat.S_ISFIFO(os.fstat(fd).st_mode)
+    except OSError:
+        return False
+
+
+def _open_nonblocking(path: str, flags: int) -> Optional[int]:
+    try:
+        return os.open(path, flags | os.O_NONBLOCK)
+    except OSError:
+        return None
+
+
+def parse_jobserver_auth(makeflags: str) -> Optional[Tuple[str, str]]:
+    """Parses `MAKEFLAGS` and returns the kind ("fds" or "fifo") and its value."""
+    # NOTE: the last option wins when make passes multiple options
+    matches = _JobServerAuthPattern.findall(makeflags)
+    if len(matches) == 0:
+        return None
+
+    auth: str = matches[-1]
+    if auth.startswith("fifo:"):
+        return "fifo", auth[len("fifo:") :]
+    return "fds", auth
+
+
+def _create_client(makeflags: str) -> Optional[PipeJobServer]:
+    parsed = parse_jobserver_auth(makeflags)
+    if parsed is None:
+        return None
+
+    kind, value = parsed
+    if kind == "fifo":
+        fd = _open_nonblocking(value, os.O_RDWR)
+        if fd is None:
+            _logger.warning(f"failed to open the jobserver fifo: {value}")
+            return None
+        return PipeJobServer(fd, fd)
+
+    try:
+        read_fd, write_fd = (int(x) for x in value.split(","))
+    except ValueError:
+        _logger.warning(f"invalid jobserver in MAKEFLAGS: {value}")
+        return None
+
+    if not (_is_fifo(read_fd) and _is_fifo(write_fd)):
+        # NOTE: make closes the pipe unless the recipe is marked with `+`
+        _logger.warning(
+            "jobserver is not available, prefix the make recipe with `+` "
+            "to share the jobs with pysen"
+        )
+        return None
+
+    # NOTE: reopen the pipe as a new open file description so that pysen can read it
+    # without blocking, and without changing the mode of the pipe used by make
+    nonblocking_fd = _open_nonblocking(f"/proc/self/fd/{read_fd}", os.O_RDONLY)
+    if nonblocking_fd is not None:
+        read_fd = nonblocking_fd
+    return PipeJobServer(read_fd, write_fd)
+
+
+_client_lock = threading.Lock()
+_client: Optional[PipeJobServer] = None
+_client_loaded = False
+
+
+def get_make_jobserver() -> Optional[JobServer]:
+    """Returns the jobserver of GNU make in `MAKEFLAGS` if any."""
+    global _client, _client_loaded
+
+    with _client_lock:
+        if not _client_loaded:
+            _client = _create_client(os.environ.get("MAKEFLAGS", ""))
+            _client_loaded = True
+        return _client
+
+
+_current_jobserver: contextvars.ContextVar[
+    Optional[JobServer]
+] = contextvars.ContextVar("jobserver", default=None)
+
+
+def get_jobserver() -> Optional[JobServer]:
+    """Returns the jobserver of the running target, or the one of GNU make if any."""
+    current = _current_jobserver.get()
+    if current is not None:
+        return current
+    return get_make_jobserver()
+
+
+@contextlib.contextmanager
+def jobserver_scope(jobs: Optional[int]) -> Iterator[JobServer]:
+    """Makes a jobserver available while the context is active.
+
+    The jobserver of GNU make is used when pysen runs under `make -j`. Otherwise,
+    a new pool of `jobs` tokens is created. A scope inside another scope reuses
+    the outer jobserver so that the whole run shares a single budget.
+    """
+    jobserver = get_jobserver()
+    if jobserver is None:
+        jobserver = LocalJobServer(resource_utils.get_num_jobs(jobs))
+
+    token = _current_jobserver.set(jobserver)
+    try:
+        yield jobserver
+    finally:
+        _current_jobserver.reset(token)
+
+
+def parallel_map(
+    func: Callable[[T], R], items: Sequence[T], max_workers: int
+) -> List[R]:
+    """Applies `func` to `items` on up to `max_workers` threads.
+
+    The calling thread processes items with the token it already owns, and every
+    additional thread processes items only while it holds a token of the jobserver,
+    so that nested calls never exceed the budget nor deadlock.
+    Results are returned in the order of `items`. When `func` raises, the remaining
+    items are not processed and the first exception is raised.
+    """
+    num_workers = min(max_workers, len(items))
+    if num_workers <= 1:
+        return [func(x) for x in items]
+
+    jobserver = get_jobserver()
+    results: List[Optional[R]] = [None] * len(items)
+    errors: List[BaseException] = []
+    lock = threading.Lock()
+    next_index = 0
+    finished = threading.Event()
+
+    def take() -> Optional[int]:
+        nonlocal next_index
+        with lock:
+            if len(errors) > 0 or next_index >= len(items):
+                finished.set()
+                return None
+            index = next_index
+            next_index += 1
+            return index
+
+    def work() -> None:
+        while True:
+            index = take()
+            if index is None:
+                return
+            try:
+                results[index] = func(items[index])
+            except BaseException as e:
+                with lock:
+                    errors.append(e)
+                return
+
+    def helper() -> None:
+        if jobserver is None:
+            work()
+            return
+
+        while not jobserver.acquire(_PollInterval):
+            if finished.is_set():
+                return
+        try:
+            work()
+        finally:
+            jobserver.release()
+
+    # NOTE: copy the context so that workers see the run-scoped state
+    threads = [
+        threading.Thread(target=contextvars.copy_context().run, args=(helper,))
+        for _ in range(num_workers - 1)
+    ]
+    for t in threads:
+        t.start()
+    try:
+        work()
+    finally:
+        finished.set()
+        for t in threads:
+            t.join()
+
+    if len(errors) > 0:
+        raise errors[0]
+
+    return cast(List[R], results)
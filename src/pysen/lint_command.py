@@ -1,20 +1,29 @@
+import collections
 import difflib
 import logging
 import pathlib
 from abc import abstractmethod
-from typing import Iterable, List, Optional, Sequence
+from typing import Callable, Container, DefaultDict, Iterable, List, Optional, Sequence
 
-from . import git_utils
+from . import git_utils, process_utils
 from .command import CommandBase
-from .error_lines import parse_error_diffs
+from .diagnostic import Diagnostic
+from .error_lines import format_error_lines, parse_error_diffs
 from .reporter import Reporter
+from .result_cache import ResultCache
 from .source import FilePredicateType, Source
 
 
 class LintCommandBase(CommandBase):
-    def __init__(self, base_dir: pathlib.Path, source: Source) -> None:
+    def __init__(
+        self,
+        base_dir: pathlib.Path,
+        source: Source,
+        cache_dir: Optional[pathlib.Path] = None,
+    ) -> None:
         self._base_dir = base_dir
         self._source = source
+        self._cache_dir = cache_dir
 
     def _get_sources(
         self, reporter: Reporter, filter_predicate: FilePredicateType
@@ -33,7 +42,16 @@ class LintCommandBase(CommandBase):
         files: Sequence[pathlib.Path],
         filter_predicate: FilePredicateType,
     ) -> List[pathlib.Path]:
-        sources = self._get_sources(reporter, filter_predicate)
+        if self.source.supports_covered_files():
+            sources: Container[pathlib.Path] = self.source.resolve_covered_files(
+                self.base_dir,
+                files,
+                filter_predicate,
+                self.git_enabled(),
+                reporter,
+            )
+        else:
+            sources = set(self._get_sources(reporter, filter_predicate))
         covered: List[pathlib.Path] = []
 
         for f in files:
@@ -44,6 +62,74 @@ class LintCommandBase(CommandBase):
 
         return covered
 
+    def _run_cached(
+        self,
+        reporter: Reporter,
+        files: Sequence[pathlib.Path],
+        run: Callable[[Sequence[pathlib.Path]], int],
+        tool_name: str,
+        setting_path: pathlib.Path,
+        inplace_edit: bool = False,
+    ) -> int:
+        """Runs `run` only for the files whose results are not cached.
+        Note:
+            Cached diagnostics are replayed to `reporter`, and to its process output
+            in the format of the outputs of the tools. In inplace_edit mode,
+            files with cached diagnostics are passed to `run` so that they get formatted.
+        """
+        cache: Optional[ResultCache] = None
+        if self._cache_dir is not None:
+            cache = ResultCache.create(
+                self._cache_dir, self.name, tool_name, setting_path
+            )
+
+        if cache is None:
+            return run(files)
+
+        hits, misses = cache.lookup(files)
+        replayed: List[Diagnostic] = []
+        for file_path, diagnostics in hits.items():
+            if len(diagnostics) == 0:
+                continue
+
+            if inplace_edit:
+                misses.append(file_path)
+            else:
+                replayed.extend(diagnostics)
+
+        if len(replayed) > 0:
+            reporter.report_diagnostics(replayed)
+            process_utils.log_output(reporter, format_error_lines(replayed), "")
+
+        reporter.logger.info(
+            f"Skipping {len(files) - len(misses)} files with cached results"
+        )
+
+        ret = 0
+        if len(misses) > 0:
+            num_reported = len(reporter.diagnostics)
+            ret = run(sorted(misses))
+
+            # NOTE: the content of files may be changed by run() in inplace_edit mode
+            if not inplace_edit:
+                reported: DefaultDict[
+                    pathlib.Path, List[Diagnostic]
+                ] = collections.defaultdict(list)
+                for d in reporter.diagnostics[num_reported:]:
+                    reported[d.file_path].append(d)
+
+                for f in misses:
+                    # NOTE: when the command fails, only the files with diagnostics are
+                    # cached since we cannot tell which file caused the failure
+                    if ret == 0 or f in reported:
+                        cache.store(f, reported.get(f, []))
+
+        cache.save()
+
+        if ret == 0 and len(replayed) > 0:
+            ret = 1
+        return ret
+
     @property
     def base_dir(self) -> pathlib.Path:
         return self._base_dir
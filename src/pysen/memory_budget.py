@@ -0,0 +1,211 @@
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+_logger = logging.getLogger(__name__)
+
+_FootprintsFileName = "memory.json"
+# NOTE: bump this value when the layout of the file changes
+_FootprintsFormatVersion = 1
+# NOTE: a footprint decays by this factor in each run rather than being replaced by
+# a smaller peak, which may come from a run that skipped most files (e.g., cached)
+_FootprintDecay = 0.9
+
+
+class MemoryBudget:
+    """Admits commands while the sum of their expected memory fits within `limit`.
+
+    A command is always admitted when nothing else is running, so that a command
+    that needs more memory than the budget still runs (alone).
+    """
+
+    def __init__(self, limit: int) -> None:
+        self._limit = limit
+        self._used = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def used(self) -> int:
+        with self._condition:
+            return self._used
+
+    @contextlib.contextmanager
+    def reserve(self, amount: int) -> Iterator[None]:
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._used == 0 or self._used + amount <= self._limit
+            )
+            self._used += amount
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._used -= amount
+                self._condition.notify_all()
+
+
+class PeakMemory:
+    """Estimates the peak memory usage of the subprocesses spawned by a command.
+
+    Subprocesses running at the same time (e.g., shards) add up, assuming that each
+    subprocess uses its peak RSS during its whole lifetime.
+    The estimate is `partial` if the command did some of its work in pysen's own
+    process, which is not measured.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # (started, finished, peak RSS) of each subprocess in `time.monotonic()`
+        self._usages: List[Tuple[float, float, int]] = []
+        self._partial = False
+
+    @property
+    def partial(self) -> bool:
+        with self._lock:
+            return self._partial
+
+    @property
+    def value(self) -> Optional[int]:
+        with self._lock:
+            usages = list(self._usages)
+        if len(usages) == 0:
+            return None
+
+        # NOTE: a subprocess finishing at the same time as another one starts
+        # doesn't overlap with it
+        events = sorted(
+            [(started, 1, rss) for started, _, rss in usages]
+            + [(finished, 0, -rss) for _, finished, rss in usages]
+        )
+        ret = 0
+        current = 0
+        for _, _, delta in events:
+            current += delta
+            ret = max(ret, current)
+        return ret
+
+    def add(self, started: float, finished: float, rss: int) -> None:
+        with self._lock:
+            self._usages.append((started, finished, rss))
+
+    def mark_partial(self) -> None:
+        with self._lock:
+            self._partial = True
+
+
+_peak_memory: contextvars.ContextVar[Optional[PeakMemory]] = contextvars.ContextVar(
+    "peak_memory", default=None
+)
+
+
+@contextlib.contextmanager
+def track_peak_memory() -> Iterator[PeakMemory]:
+    """Records the peak RSS of subprocesses run by `process_utils` in the context."""
+    peak = PeakMemory()
+    token = _peak_memory.set(peak)
+    try:
+        yield peak
+    finally:
+        _peak_memory.reset(token)
+
+
+def record_peak_rss(max_rss: int, started: float) -> None:
+    """Records `ru_maxrss` of `getrusage` or `wait4` for the current command.
+
+    `started` is the time when the subprocess started in `time.monotonic()`.
+    It is supposed to have finished just now.
+    """
+    peak = _peak_memory.get()
+    if peak is None:
+        return
+
+    # NOTE: ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+    if sys.platform != "darwin":
+        max_rss *= 1024
+    peak.add(started, time.monotonic(), max_rss)
+
+
+def record_in_process() -> None:
+    """Records that the current command does its work in pysen's own process."""
+    peak = _peak_memory.get()
+    if peak is not None:
+        peak.mark_partial()
+
+
+class MemoryFootprints:
+    """Stores the peak memory usage of each command measured in previous runs."""
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self._path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, int] = {}
+        self._dirty = False
+        self._load()
+
+    @classmethod
+    def create(cls, cache_dir: pathlib.Path) -> "MemoryFootprints":
+        return cls(cache_dir / _FootprintsFileName)
+
+    def _load(self) -> None:
+        try:
+            with self._path.open() as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            _logger.warning(f"ignoring broken memory footprints: {self._path}")
+            return
+
+        if isinstance(data, dict) and data.get("version") == _FootprintsFormatVersion:
+            entries = data.get("entries", {})
+            if isinstance(entries, dict):
+                self._entries = {
+                    k: v for k, v in entries.items() if isinstance(v, int) and v > 0
+                }
+
+    def get(self, command_name: str) -> Optional[int]:
+        with self._lock:
+            return self._entries.get(command_name)
+
+    def update(self, command_name: str, peak: int) -> None:
+        """Updates the footprint of `command_name` with the decayed maximum of peaks."""
+        with self._lock:
+            previous = self._entries.get(command_name)
+            value = peak
+            if previous is not None:
+                value = max(peak, int(previous * _FootprintDecay))
+            if previous != value:
+                self._entries[command_name] = value
+                self._dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": _FootprintsFormatVersion, "entries": self._entries}
+            self._dirty = False
+
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            # NOTE: write to a temporary file and rename it so that concurrent pysen
+            # processes never read a partially written file
+            fd, temp_path = tempfile.mkstemp(dir=self._path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self._path)
+        except OSError:
+            _logger.warning(
+                f"failed to save memory footprints: {self._path}", exc_info=True
+            )
@@ -1,23 +1,46 @@
+import dataclasses
+import hashlib
 import itertools
+import json
 import pathlib
 from enum import Enum
-from typing import Any, Callable, DefaultDict, Dict, List, Mapping, Optional, Sequence
+from typing import (
+    AbstractSet,
+    Any,
+    Callable,
+    DefaultDict,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
+from . import jobserver
 from .command import CommandBase
 from .component import ComponentBase
 from .ext import mypy_wrapper
 from .ext.mypy_wrapper import (  # NOQA
+    MypyCacheSetting,
+    MypyCacheStatistics,
     MypyFollowImports,
     MypyPlugin,
     MypySetting,
     MypyTarget,
 )
-from .path import is_covered, resolve_path
+from .path import is_covered_resolved, resolve_path
+from .py_version import PythonVersion
 from .reporter import Reporter
 from .runner_options import PathContext, RunOptions
 from .setting import SettingFile
 
 _SettingFileName = "setup.cfg"
+# NOTE: a rough estimate of the peak RSS of mypy on a mid-sized codebase.
+# The value measured in a previous run is used instead when available.
+_ExpectedMemory = 1 << 30
+_DefaultCacheDirName = ".mypy_cache"
 
 
 def _get_differences_from_base(
@@ -61,6 +84,27 @@ class MypyPreset(Enum):
         return self._factory(**kwargs)
 
 
+def _get_setting_file_name(py_version: PythonVersion) -> str:
+    return f"mypy_{py_version.short_representation}.cfg"
+
+
+@dataclasses.dataclass(frozen=True)
+class _MypyCheck:
+    target: MypyTarget
+    setting_path: pathlib.Path
+    cache: MypyCacheSetting
+    tag: Optional[str] = None
+    python_version: Optional[PythonVersion] = None
+
+
+def _get_mypy_cache_dir(paths: PathContext, options: RunOptions) -> pathlib.Path:
+    if options.mypy_cache_dir is not None:
+        return options.mypy_cache_dir
+    if options.cache_dir is not None:
+        return options.cache_dir / "mypy"
+    return paths.base_dir / _DefaultCacheDirName
+
+
 class MypyCommand(CommandBase):
     def __init__(
         self,
@@ -68,13 +112,29 @@ class MypyCommand(CommandBase):
         paths: PathContext,
         mypy_targets: Sequence[MypyTarget],
         require_diagnostics: bool,
+        daemon: bool = False,
+        cache_dir: Optional[pathlib.Path] = None,
+        mypy_cache: Optional[MypyCacheSetting] = None,
+        py_versions: Optional[Sequence[PythonVersion]] = None,
+        python_version: Optional[PythonVersion] = None,
     ) -> None:
         self._name = name
         self._base_dir = paths.base_dir
+        self._settings_dir = paths.settings_dir
         self._mypy_targets: List[MypyTarget] = list(mypy_targets)
+        self._py_versions: List[PythonVersion] = list(py_versions or [])
+        # the python_version of the setting, which is None for the running python
+        self._python_version = python_version
 
         self._setting_path = resolve_path(paths.settings_dir, _SettingFileName)
         self._require_diagnostics = require_diagnostics
+        self._daemon = daemon
+        self._cache_dir = cache_dir
+        # NOTE: pass the cache directory explicitly since mypy otherwise resolves it
+        # relative to the working directory
+        self._mypy_cache = mypy_cache or MypyCacheSetting(
+            paths.base_dir / _DefaultCacheDirName
+        )
 
     @property
     def name(self) -> str:
@@ -84,6 +144,17 @@ class MypyCommand(CommandBase):
     def has_side_effects(self) -> bool:
         return False
 
+    @property
+    def tools(self) -> Sequence[str]:
+        return ["mypy"]
+
+    @property
+    def expected_memory(self) -> Optional[int]:
+        # NOTE: targets and python versions are checked concurrently by separate
+        # mypy processes
+        num_checks = len(self._mypy_targets) * max(1, len(self._py_versions))
+        return _ExpectedMemory * max(1, num_checks)
+
     @property
     def base_dir(self) -> pathlib.Path:
         return self._base_dir
@@ -92,40 +163,178 @@ class MypyCommand(CommandBase):
     def setting_path(self) -> pathlib.Path:
         return self._setting_path
 
-    def __call__(self, reporter: Reporter) -> int:
-        exit_code: int = 0
-        num_targets = len(self._mypy_targets)
+    @property
+    def daemon(self) -> bool:
+        return self._daemon
 
-        if num_targets == 0:
-            reporter.logger.error(
-                "No mypy targets specified. "
-                "You must specify at least one entry in `tool.pysen.lint.mypy_targets`."
-            )
-            return 2
+    @property
+    def mypy_cache(self) -> MypyCacheSetting:
+        return self._mypy_cache
 
-        for idx, target in enumerate(self._mypy_targets):
-            reporter.logger.info(
-                f"[{idx+1}/{num_targets}] Checking {len(target.paths)} entries"
+    @property
+    def py_versions(self) -> List[PythonVersion]:
+        return self._py_versions
+
+    def _get_target_cache(self, target: MypyTarget) -> MypyCacheSetting:
+        # NOTE: mypy processes running concurrently must not share a cache directory,
+        # otherwise they corrupt the cache of each other
+        if len(self._mypy_targets) <= 1:
+            return self._mypy_cache
+
+        key = json.dumps(
+            [sorted(str(p) for p in target.paths), target.namespace_packages]
+        )
+        cache_dir = (
+            self._mypy_cache.cache_dir
+            / f"pysen-{hashlib.sha256(key.encode()).hexdigest()[:16]}"
+        )
+        return dataclasses.replace(self._mypy_cache, cache_dir=cache_dir)
+
+    def _get_version_checks(
+        self, target: MypyTarget, cache: MypyCacheSetting
+    ) -> List[_MypyCheck]:
+        if len(self._py_versions) == 0:
+            return [
+                _MypyCheck(
+                    target,
+                    self._setting_path,
+                    cache,
+                    python_version=self._python_version,
+                )
+            ]
+
+        # NOTE: each python version has its own exported setting and cache, and
+        # the results are tagged with the version when multiple versions are checked
+        tagged = len(self._py_versions) > 1
+        return [
+            _MypyCheck(
+                target,
+                resolve_path(self._settings_dir, _get_setting_file_name(v)),
+                dataclasses.replace(
+                    cache, cache_dir=cache.cache_dir / v.short_representation
+                ),
+                v.short_representation if tagged else None,
+                v,
+            )
+            for v in self._py_versions
+        ]
+
+    def _get_checks(self) -> List[_MypyCheck]:
+        return [
+            check
+            for target in self._mypy_targets
+            for check in self._get_version_checks(
+                target, self._get_target_cache(target)
             )
-            ret = mypy_wrapper.run(
+        ]
+
+    def _run_check(
+        self,
+        reporter: Reporter,
+        check: _MypyCheck,
+        report_files: Optional[AbstractSet[pathlib.Path]] = None,
+        buffer_output: bool = False,
+    ) -> int:
+        if self._daemon:
+            return mypy_wrapper.run_daemon(
                 reporter,
                 self.base_dir,
-                self.setting_path,
-                target,
+                check.setting_path,
+                check.target,
                 self._require_diagnostics,
+                mypy_wrapper.get_daemon_state_dir(self._cache_dir),
+                report_files,
+                check.cache,
+                buffer_output,
+                check.tag,
             )
+
+        return mypy_wrapper.run(
+            reporter,
+            self.base_dir,
+            check.setting_path,
+            check.target,
+            self._require_diagnostics,
+            check.cache,
+            buffer_output,
+            check.tag,
+        )
+
+    def _run_checks(
+        self,
+        reporter: Reporter,
+        checks: Sequence[Tuple[_MypyCheck, Optional[AbstractSet[pathlib.Path]]]],
+    ) -> int:
+        num_checks = len(checks)
+
+        def run_check(
+            item: Tuple[int, Tuple[_MypyCheck, Optional[AbstractSet[pathlib.Path]]]]
+        ) -> int:
+            idx, (check, report_files) = item
+            version = f" for {check.tag}" if check.tag is not None else ""
+            reporter.logger.info(
+                f"[{idx+1}/{num_checks}] Checking {len(check.target.paths)} entries"
+                f"{version}"
+            )
+            return self._run_check(
+                reporter, check, report_files, buffer_output=num_checks > 1
+            )
+
+        # NOTE: checks are independent of each other, so they are run concurrently
+        # within the jobs budget of the runner
+        results = jobserver.parallel_map(run_check, list(enumerate(checks)), num_checks)
+        exit_code = 0
+        for ret in results:
             if ret != 0:
                 exit_code = ret
+        return exit_code
+
+    def __call__(self, reporter: Reporter) -> int:
+        if len(self._mypy_targets) == 0:
+            reporter.logger.error(
+                "No mypy targets specified. "
+                "You must specify at least one entry in `tool.pysen.lint.mypy_targets`."
+            )
+            return 2
+
+        checks = self._get_checks()
+        before = [
+            mypy_wrapper.snapshot_cache(check.cache.cache_dir, check.python_version)
+            for check in checks
+        ]
+
+        exit_code = self._run_checks(reporter, [(check, None) for check in checks])
+
+        statistics = MypyCacheStatistics()
+        for check, b in zip(checks, before):
+            after = mypy_wrapper.snapshot_cache(
+                check.cache.cache_dir, check.python_version
+            )
+            statistics += MypyCacheStatistics.compare(b, after)
+        reporter.logger.info(
+            f"mypy cache: {statistics.hits} modules reused, "
+            f"{statistics.misses} modules checked"
+        )
+        reporter.report_statistics(
+            f"cache: {statistics.hits} hits, {statistics.misses} misses"
+        )
 
         return exit_code
 
     def run_files(self, reporter: Reporter, files: Sequence[pathlib.Path]) -> int:
-        sources = list(
-            itertools.chain.from_iterable(target.paths for target in self._mypy_targets)
-        )
+        if self._daemon:
+            return self._run_files_with_daemon(reporter, files)
+
+        # NOTE: resolve the sources once instead of resolving them for each file
+        sources = {
+            p.resolve()
+            for p in itertools.chain.from_iterable(
+                target.paths for target in self._mypy_targets
+            )
+        }
         covered_files: List[pathlib.Path] = []
         for f in files:
-            if is_covered(f, sources):
+            if is_covered_resolved(f.resolve(), sources):
                 covered_files.append(f)
             else:
                 reporter.logger.info(f"Skipping {f} for {self._name}")
@@ -133,13 +342,39 @@ class MypyCommand(CommandBase):
         if len(covered_files) == 0:
             return 0
 
-        return mypy_wrapper.run(
-            reporter,
-            self.base_dir,
-            self._setting_path,
-            MypyTarget(covered_files),
-            self._require_diagnostics,
-        )
+        checks = self._get_version_checks(MypyTarget(covered_files), self._mypy_cache)
+        return self._run_checks(reporter, [(check, None) for check in checks])
+
+    def _run_files_with_daemon(
+        self, reporter: Reporter, files: Sequence[pathlib.Path]
+    ) -> int:
+        # NOTE: the daemon rechecks the whole target incrementally, which is much
+        # faster than checking only `files` from scratch. The diagnostics of the other
+        # files in the target are dropped.
+        resolved_files = {f: f.resolve() for f in files}
+        checks: List[Tuple[_MypyCheck, Optional[AbstractSet[pathlib.Path]]]] = []
+        covered: Set[pathlib.Path] = set()
+        for target in self._mypy_targets:
+            sources = {p.resolve() for p in target.paths}
+            report_files = {
+                resolved
+                for resolved in resolved_files.values()
+                if is_covered_resolved(resolved, sources)
+            }
+            if len(report_files) == 0:
+                continue
+
+            covered.update(report_files)
+            for check in self._get_version_checks(
+                target, self._get_target_cache(target)
+            ):
+                checks.append((check, report_files))
+
+        for f, resolved in resolved_files.items():
+            if resolved not in covered:
+                reporter.logger.info(f"Skipping {f} for {self._name}")
+
+        return self._run_checks(reporter, checks)
 
 
 class Mypy(ComponentBase):
@@ -149,11 +384,15 @@ class Mypy(ComponentBase):
         mypy_targets: Optional[Sequence[MypyTarget]] = None,
         setting: Optional[MypySetting] = None,
         module_settings: Optional[Mapping[str, MypySetting]] = None,
+        daemon: bool = False,
+        py_versions: Optional[Sequence[PythonVersion]] = None,
     ) -> None:
         self._name = name
         self._mypy_targets = list(mypy_targets or [])
         self._setting: MypySetting = setting or MypySetting()
         self._module_settings: Dict[str, MypySetting] = dict(module_settings or {})
+        self._daemon = daemon
+        self._py_versions: List[PythonVersion] = list(py_versions or [])
 
     @property
     def name(self) -> str:
@@ -171,22 +410,46 @@ class Mypy(ComponentBase):
     def mypy_targets(self) -> List[MypyTarget]:
         return self._mypy_targets
 
-    def export_settings(
+    @property
+    def daemon(self) -> bool:
+        return self._daemon
+
+    @property
+    def py_versions(self) -> List[PythonVersion]:
+        return self._py_versions
+
+    def _export_setting(
         self,
         paths: PathContext,
-        files: DefaultDict[str, SettingFile],
+        setting_file: SettingFile,
+        global_setting: MypySetting,
     ) -> None:
-        setting_file = files[_SettingFileName]
-        global_section, global_setting = self._setting.export(paths.base_dir)
-        setting_file.set_section(global_section, global_setting)
+        global_section, global_entries = global_setting.export(paths.base_dir)
+        setting_file.set_section(global_section, global_entries)
 
         for module_name, setting in self._module_settings.items():
             section, module_setting = setting.export(
                 paths.base_dir, target_module=module_name
             )
-            module_setting = _get_differences_from_base(module_setting, global_setting)
+            module_setting = _get_differences_from_base(module_setting, global_entries)
             setting_file.set_section(section, module_setting)
 
+    def export_settings(
+        self,
+        paths: PathContext,
+        files: DefaultDict[str, SettingFile],
+    ) -> None:
+        self._export_setting(paths, files[_SettingFileName], self._setting)
+
+        # NOTE: a separate file is exported for each python version since mypy
+        # accepts only one `python_version` at a time
+        for py_version in self._py_versions:
+            self._export_setting(
+                paths,
+                files[_get_setting_file_name(py_version)],
+                dataclasses.replace(self._setting, python_version=py_version),
+            )
+
     @property
     def targets(self) -> Sequence[str]:
         return ["lint"]
@@ -196,7 +459,19 @@ class Mypy(ComponentBase):
     ) -> CommandBase:
         if target == "lint":
             return MypyCommand(
-                self.name, paths, self.mypy_targets, options.require_diagnostics
+                self.name,
+                paths,
+                self.mypy_targets,
+                options.require_diagnostics,
+                self._daemon,
+                options.cache_dir,
+                MypyCacheSetting(
+                    _get_mypy_cache_dir(paths, options),
+                    options.mypy_sqlite_cache,
+                    options.mypy_fine_grained_cache,
+                ),
+                self._py_versions,
+                self._setting.python_version,
             )
 
         raise AssertionError(f"unknown {target}")
@@ -1,7 +1,7 @@
 import contextlib
 import os
 import pathlib
-from typing import Iterable, Iterator, Union
+from typing import AbstractSet, Dict, Iterable, Iterator, List, Union
 
 PathLikeType = Union[pathlib.Path, str]
 
@@ -39,12 +39,76 @@ def is_covered(path: pathlib.Path, sources: Iterable[pathlib.Path]) -> bool:
     Checks if `path` is contained in any of the subdirectories in sources.
     See the test cases for details.
     """
-    path = path.resolve()
-    abs_path = [source.resolve() for source in sources]
-    return any(c in abs_path for c in list(path.parents) + [path])
+    return is_covered_resolved(path.resolve(), {source.resolve() for source in sources})
+
+
+def is_covered_resolved(
+    path: pathlib.Path, resolved_sources: AbstractSet[pathlib.Path]
+) -> bool:
+    """
+    Same as `is_covered`, but `path` and `resolved_sources` must be resolved in advance.
+    It is useful to check many paths against the same sources.
+    """
+    return path in resolved_sources or any(p in resolved_sources for p in path.parents)
 
 
 def is_contained(parent: pathlib.Path, child: pathlib.Path) -> bool:
     if not parent.is_absolute() or not child.is_absolute():
         raise ValueError("Argument 'parent' and 'child' must be absolute")
     return str(child).startswith(str(parent))
+
+
+class _TrieNode:
+    __slots__ = ("children", "prefixes")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_TrieNode"] = {}
+        # last components of registered paths that end at this node
+        self.prefixes: List[str] = []
+
+
+class PathPrefixTrie:
+    """A set of absolute paths that answers `is_contained` queries.
+
+    `trie.is_contained(child)` is equivalent to
+    `any(is_contained(parent, child) for parent in paths)`, but the cost of a query
+    depends only on the depth of `child`, not on the number of registered paths.
+    """
+
+    def __init__(self, paths: Iterable[PathLikeType] = ()) -> None:
+        self._root = _TrieNode()
+        self._empty = True
+        for p in paths:
+            self.add(p)
+
+    def add(self, path: PathLikeType) -> None:
+        s = str(path)
+        if not os.path.isabs(s):
+            raise ValueError("Argument 'path' must be absolute")
+
+        *dirs, last = s.split(os.sep)
+        node = self._root
+        for c in dirs:
+            node = node.children.setdefault(c, _TrieNode())
+        node.prefixes.append(last)
+        self._empty = False
+
+    def is_contained(self, child: PathLikeType) -> bool:
+        s = str(child)
+        if not os.path.isabs(s):
+            raise ValueError("Argument 'child' must be absolute")
+        if self._empty:
+            return False
+
+        # NOTE: is_contained compares paths as strings, so the last component of a
+        # registered path is a prefix of the corresponding component of `child`.
+        node = self._root
+        for c in s.split(os.sep):
+            if any(c.startswith(p) for p in node.prefixes):
+                return True
+            next_node = node.children.get(c)
+            if next_node is None:
+                return False
+            node = next_node
+
+        return False
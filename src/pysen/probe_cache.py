@@ -0,0 +1,162 @@
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import sys
+import tempfile
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence
+
+_logger = logging.getLogger(__name__)
+
+_ProbesFileName = "probes.json"
+# NOTE: bump this value when the layout of the file changes
+_ProbesFormatVersion = 1
+# NOTE: installing, upgrading or removing a distribution adds or replaces these entries
+_MetadataSuffixes = (".dist-info", ".egg-info", ".egg-link", ".pth")
+
+
+def get_environment_key() -> str:
+    """Returns a key that changes when python or the installed distributions change.
+
+    The key consists of the interpreter and the mtimes of the metadata entries
+    in `sys.path`, which is much cheaper than reading the metadata itself.
+    """
+    entries: List[object] = [sys.executable, sys.version]
+    for p in sys.path:
+        try:
+            with os.scandir(p or ".") as it:
+                for e in it:
+                    if e.name.endswith(_MetadataSuffixes):
+                        entries.append((p, e.name, e.stat().st_mtime_ns))
+        except OSError:
+            continue
+
+    return hashlib.sha256(json.dumps(entries).encode()).hexdigest()
+
+
+class ProbeCache:
+    """Stores the results of tool probes (installation and versions) across runs.
+
+    The results are discarded when the environment key changes.
+    """
+
+    def __init__(self, path: pathlib.Path, key: str) -> None:
+        self._path = path
+        self._key = key
+        self._lock = threading.Lock()
+        self._installed: Dict[str, bool] = {}
+        self._versions: Dict[str, str] = {}
+        self._loaded = False
+        self._load()
+        # NOTE: a stale cache is rewritten even if nothing is probed, so that
+        # the next run doesn't probe the tools again
+        self._dirty = not self._loaded
+
+    @classmethod
+    def create(cls, cache_dir: pathlib.Path) -> "ProbeCache":
+        return cls(cache_dir / _ProbesFileName, get_environment_key())
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the probes of a previous run in the same environment are loaded."""
+        return self._loaded
+
+    def _load(self) -> None:
+        try:
+            with self._path.open() as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            _logger.warning(f"ignoring broken probe cache: {self._path}")
+            return
+
+        if not isinstance(data, dict):
+            return
+        if data.get("version") != _ProbesFormatVersion or data.get("key") != self._key:
+            return
+
+        installed = data.get("installed", {})
+        versions = data.get("versions", {})
+        if isinstance(installed, dict) and isinstance(versions, dict):
+            self._installed = {
+                k: v for k, v in installed.items() if isinstance(v, bool)
+            }
+            self._versions = {k: v for k, v in versions.items() if isinstance(v, str)}
+            self._loaded = True
+
+    def is_installed(self, cmd: Sequence[str]) -> bool:
+        with self._lock:
+            return self._installed.get(" ".join(cmd), False)
+
+    def set_installed(self, cmd: Sequence[str]) -> None:
+        key = " ".join(cmd)
+        with self._lock:
+            if not self._installed.get(key, False):
+                self._installed[key] = True
+                self._dirty = True
+
+    def get_version(self, name: str) -> Optional[str]:
+        with self._lock:
+            return self._versions.get(name)
+
+    def set_version(self, name: str, version: str) -> None:
+        with self._lock:
+            if self._versions.get(name) != version:
+                self._versions[name] = version
+                self._dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {
+                "version": _ProbesFormatVersion,
+                "key": self._key,
+                "installed": self._installed,
+                "versions": self._versions,
+            }
+            self._dirty = False
+
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            # NOTE: write to a temporary file and rename it so that concurrent pysen
+            # processes never read a partially written file
+            fd, temp_path = tempfile.mkstemp(dir=self._path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self._path)
+        except OSError:
+            _logger.warning(f"failed to save probe cache: {self._path}", exc_info=True)
+
+
+_current_cache: contextvars.ContextVar[Optional[ProbeCache]] = contextvars.ContextVar(
+    "probe_cache", default=None
+)
+
+
+def get_probe_cache() -> Optional[ProbeCache]:
+    return _current_cache.get()
+
+
+@contextlib.contextmanager
+def probe_scope(cache_dir: Optional[pathlib.Path]) -> Iterator[Optional[ProbeCache]]:
+    """Caches the tool probes under `cache_dir` while the context is active.
+
+    Nothing is cached when `cache_dir` is None.
+    """
+    if cache_dir is None:
+        yield None
+        return
+
+    cache = ProbeCache.create(cache_dir)
+    token = _current_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _current_cache.reset(token)
+        cache.save()
@@ -1,36 +1,376 @@
+import asyncio
+import codecs
+import concurrent.futures
 import contextlib
+import heapq
+import io
 import logging
+import math
+import multiprocessing
+import os
+import pathlib
+import queue
+import signal
 import subprocess
 import sys
-from concurrent.futures import ThreadPoolExecutor
-from typing import IO, List, Optional, Sequence, Tuple
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import (
+    IO,
+    Callable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
+from . import cancellation, deadline, event_loop, fork_server, jobserver, memory_budget
+from .exceptions import CommandCancelledError, CommandTimeoutError
 from .reporter import Reporter
 
+if sys.platform != "win32":
+    import resource
 
-def _read_stream(stream: Optional[IO[str]], reporter: Reporter, loglevel: int) -> str:
-    if stream is None:
-        return ""
+_logger = logging.getLogger(__name__)
 
-    ret: List[str] = []
-    for line in stream:
-        ret.append(line)
-        reporter.process_output.log(loglevel, line.rstrip("\n"))
+# NOTE: Windows limits the length of a command line to 32767 characters
+_DefaultCommandLineLimit = 32767
+# reserved for the environment variables added by subprocesses and so on
+_CommandLineMargin = 4096
+_PointerSize = 8
+# NOTE: starting a tool takes a while, so small file lists are not split
+_MinArgsPerShard = 16
+# NOTE: a process is killed if it is still running after this period (seconds)
+# since it is asked to terminate on its timeout
+_KillGracePeriod = 5.0
+# the maximum size of a chunk read from the outputs of a process at once
+_ReadChunkSize = 64 * 1024
 
-    return "".join(ret)
+R = TypeVar("R")
+
+
+class _OutputReader:
+    """Decodes the output of a process and logs each line of it as it is read.
+
+    Newlines are translated to "\\n" like `universal_newlines` of `subprocess.Popen`.
+    """
+
+    def __init__(
+        self, reporter: Reporter, encoding: str, loglevel: Optional[int]
+    ) -> None:
+        self._reporter = reporter
+        self._loglevel = loglevel
+        self._decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(encoding)(errors="ignore"), translate=True
+        )
+        self._chunks: List[str] = []
+        self._partial_line = ""
+        self._error: Optional[Exception] = None
+
+    @property
+    def error(self) -> Optional[Exception]:
+        """The exception raised while logging the output if any."""
+        return self._error
+
+    def feed(self, data: bytes, final: bool = False) -> None:
+        text = self._decoder.decode(data, final=final)
+        self._chunks.append(text)
+        if self._loglevel is None:
+            return
+
+        lines = (self._partial_line + text).split("\n")
+        self._partial_line = lines.pop()
+        if final and len(self._partial_line) > 0:
+            lines.append(self._partial_line)
+            self._partial_line = ""
+
+        # NOTE: the output is read until the end even if logging fails,
+        # so that the process never blocks on a full pipe
+        if self._error is not None:
+            return
+        try:
+            for line in lines:
+                self._reporter.process_output.log(self._loglevel, line)
+        except Exception as e:
+            self._error = e
+
+    def getvalue(self) -> str:
+        return "".join(self._chunks)
 
 
 def add_python_executable(*cmd: str) -> Sequence[str]:
     return [sys.executable, "-m"] + list(cmd)
 
 
+_Process = Union["subprocess.Popen[bytes]", fork_server.ForkedProcess]
+
+
+def _wait(proc: _Process, started: float) -> None:
+    if isinstance(proc, fork_server.ForkedProcess) or not hasattr(os, "wait4"):
+        proc.wait()
+        return
+
+    # NOTE: reap the process with wait4 to learn its peak memory usage, which is
+    # used to schedule memory hungry commands (see `memory_budget`)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    memory_budget.record_peak_rss(rusage.ru_maxrss, started)
+
+
+_KillSignal = getattr(signal, "SIGKILL", signal.SIGTERM)
+
+
+def _terminate_tree(proc: _Process, sig: int = signal.SIGTERM) -> None:
+    if sys.platform == "win32":
+        proc.kill()
+        return
+
+    # NOTE: the process leads its own process group (see `_spawn`), so that the
+    # processes it has started are terminated together
+    with contextlib.suppress(ProcessLookupError, PermissionError):
+        os.killpg(proc.pid, sig)
+
+
+# an event of `_Supervisor`: a chunk of an output (empty when the output is closed),
+# or None for the output when the process has been reaped
+_Event = Tuple[Optional[_OutputReader], bytes]
+
+
+async def _read_pipe(
+    pipe: Optional[IO[bytes]],
+    output: _OutputReader,
+    events: "queue.SimpleQueue[_Event]",
+) -> None:
+    try:
+        if pipe is None:
+            return
+
+        loop = asyncio.get_running_loop()
+        stream = asyncio.StreamReader()
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(stream), pipe
+        )
+        try:
+            while True:
+                data = await stream.read(_ReadChunkSize)
+                if len(data) == 0:
+                    return
+                events.put((output, data))
+        finally:
+            # NOTE: this closes `pipe` as well
+            transport.close()
+    finally:
+        events.put((output, b""))
+
+
+def _open_pidfd(proc: _Process) -> Optional[int]:
+    if isinstance(proc, fork_server.ForkedProcess) or not hasattr(os, "pidfd_open"):
+        return None
+    try:
+        return os.pidfd_open(proc.pid)
+    except OSError:
+        # NOTE: pidfd requires linux >= 5.3
+        return None
+
+
+class _Supervisor:
+    """Reads the outputs of `proc`, reaps it and watches its timeout in the event loop.
+
+    The single thread of the shared loop (see `event_loop`) serves all the processes,
+    instead of a few threads for each process. The thread that runs `proc` decodes
+    and logs its outputs, so that a slow log handler never delays the others.
+    `proc` is reaped in the loop where pidfd is available, and in the calling thread
+    otherwise.
+    When `timeout` seconds have passed, the process tree of `proc` is terminated,
+    and killed if it is still running after `_KillGracePeriod` seconds.
+    """
+
+    def __init__(
+        self,
+        proc: _Process,
+        stdout: _OutputReader,
+        stderr: _OutputReader,
+        timeout: Optional[float],
+    ) -> None:
+        self._proc = proc
+        self._stdout = stdout
+        self._stderr = stderr
+        self._timeout = timeout
+        self._loop = event_loop.get_event_loop_thread()
+        self._readers: List["asyncio.Task[None]"] = []
+        self._reaper: Optional["asyncio.Task[None]"] = None
+        self._watchdog: Optional["asyncio.Task[None]"] = None
+        self._expired = False
+        self._events: "queue.SimpleQueue[_Event]" = queue.SimpleQueue()
+        self._max_rss: Optional[int] = None
+
+    @property
+    def expired(self) -> bool:
+        return self._expired
+
+    async def _start(self, pidfd: Optional[int]) -> None:
+        self._readers = [
+            asyncio.ensure_future(
+                _read_pipe(self._proc.stdout, self._stdout, self._events)
+            ),
+            asyncio.ensure_future(
+                _read_pipe(self._proc.stderr, self._stderr, self._events)
+            ),
+        ]
+        if pidfd is not None:
+            self._reaper = asyncio.ensure_future(self._reap(pidfd))
+        if self._timeout is not None:
+            self._watchdog = asyncio.ensure_future(self._watch(self._timeout))
+
+    async def _reap(self, pidfd: int) -> None:
+        loop = asyncio.get_running_loop()
+        exited = loop.create_future()
+
+        def on_exit() -> None:
+            if not exited.done():
+                exited.set_result(None)
+
+        loop.add_reader(pidfd, on_exit)
+        try:
+            await exited
+            # NOTE: reap the process with wait4 to learn its peak memory usage
+            # (see `_wait`)
+            pid, status, rusage = os.wait4(self._proc.pid, os.WNOHANG)
+            if pid != 0:
+                self._proc.returncode = os.waitstatus_to_exitcode(status)
+                self._max_rss = rusage.ru_maxrss
+        finally:
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+            # NOTE: the calling thread reaps the process if it is not reaped here
+            self._events.put((None, b""))
+
+    async def _watch(self, timeout: float) -> None:
+        await asyncio.sleep(max(0.0, timeout))
+        self._expired = True
+        _terminate_tree(self._proc)
+        await asyncio.sleep(_KillGracePeriod)
+        _terminate_tree(self._proc, _KillSignal)
+
+    async def _finish(self) -> None:
+        try:
+            await asyncio.gather(*self._readers)
+        finally:
+            await self._abort()
+
+    async def _abort(self) -> None:
+        tasks = list(self._readers)
+        if self._reaper is not None:
+            tasks.append(self._reaper)
+        if self._watchdog is not None:
+            tasks.append(self._watchdog)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def start(self) -> None:
+        pidfd = _open_pidfd(self._proc)
+        try:
+            self._loop.run(self._start(pidfd))
+        except BaseException:
+            if pidfd is not None and self._reaper is None:
+                os.close(pidfd)
+            raise
+
+    def wait(self, started: float) -> None:
+        """Logs the outputs until they are closed and waits for the process to exit.
+
+        The timeout is watched until both of them have happened.
+        """
+        pending = {self._stdout, self._stderr}
+        reaping = self._reaper is not None
+        while len(pending) > 0 or reaping:
+            output, data = self._events.get()
+            if output is None:
+                reaping = False
+            else:
+                output.feed(data, final=len(data) == 0)
+                if len(data) == 0:
+                    pending.discard(output)
+
+        if self._proc.returncode is None:
+            _wait(self._proc, started)
+        elif self._max_rss is not None:
+            memory_budget.record_peak_rss(self._max_rss, started)
+        self._loop.run(self._finish())
+
+    def abort(self) -> None:
+        """Stops reading the outputs, which are closed when this method returns."""
+        self._loop.run(self._abort())
+
+
+def _check_runnable(name: str) -> Optional[float]:
+    """Raises an error if `name` must not start, and returns the remaining time.
+
+    `CommandCancelledError` is raised when the target is cancelled or pysen is
+    interrupted, and `CommandTimeoutError` when the deadline of the context expired.
+    """
+    cancel = cancellation.get_cancellation()
+    if cancel is not None:
+        cancel.check()
+    interruption = cancellation.get_interruption()
+    if interruption is not None and interruption.cancelled:
+        raise CommandCancelledError("interrupted")
+
+    timeout = deadline.get_remaining()
+    if timeout is not None and timeout <= 0:
+        raise CommandTimeoutError(f"timed out before running {name}")
+    return timeout
+
+
+def _spawn(
+    cmd: Sequence[str], new_session: bool = False, cwd: Optional[pathlib.Path] = None
+) -> _Process:
+    client = fork_server.get_client()
+    if client is not None and client.supports(cmd):
+        try:
+            return client.spawn(cmd, cwd)
+        except OSError:
+            _logger.warning("fork server is not available", exc_info=True)
+
+    return subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=new_session,
+        cwd=cwd,
+    )
+
+
 def run(
     cmd: Sequence[str],
     reporter: Reporter,
-    stdout_loglevel: int = logging.INFO,
-    stderr_loglevel: int = logging.WARNING,
+    stdout_loglevel: Optional[int] = logging.INFO,
+    stderr_loglevel: Optional[int] = logging.WARNING,
     encoding: Optional[str] = None,
+    cwd: Optional[pathlib.Path] = None,
 ) -> Tuple[int, str, str]:
+    """Runs `cmd` in `cwd` and returns its exit code, stdout and stderr.
+
+    `cmd` runs in the current working directory if `cwd` is not specified.
+    Note that `cwd` must be passed instead of changing the working directory
+    of pysen, which is shared by the commands running concurrently.
+
+    Each line of the outputs is logged to `reporter.process_output` as it is read,
+    unless the corresponding loglevel is None.
+    When the target is cancellable, `cmd` is not started once the target is cancelled
+    and is terminated with its child processes when the target is cancelled,
+    in which case `CommandCancelledError` is raised.
+    Likewise, `cmd` is terminated with its child processes when the deadline of
+    the context (see `deadline.deadline_scope`) expires, and `CommandTimeoutError`
+    is raised.
+    """
     # NOTE: As pysen doesn't configure `sys.stdout` with `errors=ignore` option,
     # it may cause an error when unsupported characters in an environment are
     # going to be printed.
@@ -43,33 +383,381 @@ def run(
     stderr: str = ""
 
     with contextlib.ExitStack() as stack:
+        timeout = _check_runnable(f"`{' '.join(cmd[:3])}`")
+        cancel = cancellation.get_cancellation()
+        interruption = cancellation.get_interruption()
+
         reporter.report_command(" ".join(cmd))
-        proc = stack.enter_context(
-            subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                encoding=encoding,
-                universal_newlines=True,
-                errors="ignore",
-            )
-        )
-        try:
-            pool = stack.enter_context(ThreadPoolExecutor(max_workers=2))
-            stdout_task = pool.submit(
-                _read_stream, proc.stdout, reporter, stdout_loglevel
-            )
-            stderr_task = pool.submit(
-                _read_stream, proc.stderr, reporter, stderr_loglevel
+        # NOTE: a process that may be terminated by pysen runs in its own session,
+        # so that its child processes are terminated together
+        new_session = cancel is not None or timeout is not None
+        started = time.monotonic()
+        proc = _spawn(cmd, new_session=new_session, cwd=cwd)
+        stack.enter_context(proc)
+        # NOTE: the processes of the fork server run in their own process group too
+        own_group = new_session or isinstance(proc, fork_server.ForkedProcess)
+        if interruption is not None and own_group:
+            stack.enter_context(
+                interruption.register(lambda: _terminate_tree(proc, _KillSignal))
             )
+        terminated = threading.Event()
+
+        def terminate() -> None:
+            terminated.set()
+            _terminate_tree(proc)
 
-            proc.wait()
+        if cancel is not None:
+            stack.enter_context(cancel.register(terminate))
+        stdout_reader = _OutputReader(reporter, encoding, stdout_loglevel)
+        stderr_reader = _OutputReader(reporter, encoding, stderr_loglevel)
+        # NOTE: the watchdog keeps running until the process has exited and
+        # the outputs are closed, which happens after the child processes have exited
+        supervisor = _Supervisor(proc, stdout_reader, stderr_reader, timeout)
+        try:
+            supervisor.start()
+            supervisor.wait(started)
 
-            stdout = stdout_task.result()
-            stderr = stderr_task.result()
+            for reader in (stdout_reader, stderr_reader):
+                if reader.error is not None:
+                    raise reader.error
+            stdout = stdout_reader.getvalue()
+            stderr = stderr_reader.getvalue()
+            assert proc.returncode is not None
             returncode = proc.returncode
-        except Exception:
-            proc.kill()
+            if supervisor.expired:
+                raise CommandTimeoutError(
+                    f"`{' '.join(cmd[:3])}` was terminated after running "
+                    f"for {timeout:.1f} seconds"
+                )
+            # NOTE: a process that exits successfully despite the termination has
+            # completed its work
+            if terminated.is_set() and returncode != 0:
+                raise CommandCancelledError(
+                    f"`{' '.join(cmd[:3])}` was terminated by the cancellation"
+                )
+            if interruption is not None and interruption.cancelled and returncode != 0:
+                raise CommandCancelledError(
+                    f"`{' '.join(cmd[:3])}` was killed since pysen is interrupted"
+                )
+        except BaseException:
+            # NOTE: the process tree may not receive SIGINT from the terminal when it
+            # runs in its own process group
+            if own_group:
+                _terminate_tree(proc, _KillSignal)
+            else:
+                proc.kill()
+            supervisor.abort()
             raise
 
     return returncode, stdout, stderr
+
+
+_output_lock = threading.Lock()
+
+
+def log_output(
+    reporter: Reporter,
+    stdout: str,
+    stderr: str,
+    stdout_loglevel: int = logging.INFO,
+    stderr_loglevel: int = logging.WARNING,
+) -> None:
+    """Logs the outputs of a finished process to `reporter.process_output` at once.
+
+    The outputs are never interleaved with the ones of other processes logged
+    by this function, unlike the outputs logged by `run`.
+    """
+    with _output_lock:
+        for loglevel, output in [(stdout_loglevel, stdout), (stderr_loglevel, stderr)]:
+            for line in output.splitlines():
+                reporter.process_output.log(loglevel, line)
+
+
+def _get_arg_size(arg: str) -> int:
+    # each argument consumes a pointer and a NUL-terminated string
+    return len(os.fsencode(arg)) + 1 + _PointerSize
+
+
+def get_command_line_limit() -> int:
+    """Returns the maximum number of bytes for the arguments of a new process."""
+    try:
+        arg_max = os.sysconf("SC_ARG_MAX")
+    except (AttributeError, ValueError, OSError):
+        arg_max = -1
+    if arg_max <= 0:
+        arg_max = _DefaultCommandLineLimit
+
+    # NOTE: ARG_MAX is shared by the arguments and the environment variables
+    env_size = sum(_get_arg_size(f"{k}={v}") for k, v in os.environ.items())
+    return max(arg_max - env_size - _CommandLineMargin, _CommandLineMargin)
+
+
+def fits_command_line(cmd: Sequence[str], limit: Optional[int] = None) -> bool:
+    if limit is None:
+        limit = get_command_line_limit()
+    return sum(_get_arg_size(x) for x in cmd) <= limit
+
+
+def chunk_arguments(
+    cmd: Sequence[str], args: Sequence[str], limit: Optional[int] = None
+) -> List[List[str]]:
+    """Splits `args` so that `cmd` followed by each chunk fits into the command line.
+
+    Note:
+        A chunk contains at least one argument even if it exceeds the limit.
+    """
+    if limit is None:
+        limit = get_command_line_limit()
+
+    available = limit - sum(_get_arg_size(x) for x in cmd)
+    chunks: List[List[str]] = []
+    chunk: List[str] = []
+    chunk_size = 0
+    for arg in args:
+        size = _get_arg_size(arg)
+        if len(chunk) > 0 and chunk_size + size > available:
+            chunks.append(chunk)
+            chunk = []
+            chunk_size = 0
+        chunk.append(arg)
+        chunk_size += size
+
+    if len(chunk) > 0:
+        chunks.append(chunk)
+    return chunks
+
+
+def run_chunked(
+    cmd: Sequence[str],
+    args: Sequence[str],
+    reporter: Reporter,
+    stdout_loglevel: Optional[int] = logging.INFO,
+    stderr_loglevel: Optional[int] = logging.WARNING,
+    encoding: Optional[str] = None,
+    limit: Optional[int] = None,
+    cwd: Optional[pathlib.Path] = None,
+) -> Tuple[int, str, str]:
+    """Runs `cmd` with `args` split into chunks that fit into the command line.
+
+    It returns the first non-zero exit code and the concatenated outputs of the chunks.
+    Note that `cmd` must accept any subset of `args`, e.g., a list of files.
+    """
+    chunks = chunk_arguments(cmd, args, limit)
+    if len(chunks) > 1:
+        reporter.logger.info(f"Splitting {len(args)} arguments into {len(chunks)} runs")
+
+    returncode = 0
+    stdouts: List[str] = []
+    stderrs: List[str] = []
+    for chunk in chunks:
+        ret, stdout, stderr = run(
+            list(cmd) + chunk,
+            reporter,
+            stdout_loglevel,
+            stderr_loglevel,
+            encoding,
+            cwd,
+        )
+        if returncode == 0:
+            returncode = ret
+        stdouts.append(stdout)
+        stderrs.append(stderr)
+
+    return returncode, "".join(stdouts), "".join(stderrs)
+
+
+def get_file_size(path: str) -> int:
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+def split_shards(
+    args: Sequence[str], num_shards: int, cost: Callable[[str], int]
+) -> List[List[str]]:
+    """Splits `args` into at most `num_shards` shards with balanced total costs.
+
+    Arguments are assigned from the most expensive one to the least loaded shard.
+    Each shard keeps the original order of `args`.
+    """
+    num_shards = max(1, min(num_shards, len(args)))
+    costs = [cost(x) for x in args]
+    order = sorted(range(len(args)), key=lambda i: costs[i], reverse=True)
+
+    heap = [(0, i) for i in range(num_shards)]
+    assigned: List[List[int]] = [[] for _ in range(num_shards)]
+    for i in order:
+        load, shard = heapq.heappop(heap)
+        assigned[shard].append(i)
+        heapq.heappush(heap, (load + costs[i], shard))
+
+    return [[args[i] for i in sorted(indices)] for indices in assigned if indices]
+
+
+def run_sharded(
+    cmd: Sequence[str],
+    args: Sequence[str],
+    reporter: Reporter,
+    jobs: int,
+    cost: Callable[[str], int] = get_file_size,
+    stdout_loglevel: int = logging.INFO,
+    stderr_loglevel: int = logging.WARNING,
+    encoding: Optional[str] = None,
+    cwd: Optional[pathlib.Path] = None,
+) -> Tuple[int, str, str]:
+    """Runs `cmd` over shards of `args` concurrently on up to `jobs` processes.
+
+    Shards run in addition to the first one take tokens from the current jobserver.
+    As the parallelism of `cmd` is bounded by the jobs budget of pysen, `cmd` should
+    be configured not to start its own pool of `os.cpu_count()` workers.
+    `args` are split into shards of similar cost (the file size by default).
+    It returns the first non-zero exit code and the outputs concatenated in the order
+    of the shards. Note that `cmd` must accept any subset of `args`.
+    """
+    num_shards = min(jobs, math.ceil(len(args) / _MinArgsPerShard))
+    if num_shards <= 1:
+        return run_chunked(
+            cmd, args, reporter, stdout_loglevel, stderr_loglevel, encoding, cwd=cwd
+        )
+
+    shards = split_shards(args, num_shards, cost)
+    reporter.logger.info(f"Running {len(shards)} shards in parallel")
+
+    def run_shard(shard: List[str]) -> Tuple[int, str, str]:
+        result = run_chunked(cmd, shard, reporter, None, None, encoding, cwd=cwd)
+        # NOTE: the outputs of a shard are logged at once after the shard finishes
+        # so that the outputs of concurrent shards (e.g., diffs) are not interleaved
+        log_output(reporter, result[1], result[2], stdout_loglevel, stderr_loglevel)
+        return result
+
+    # NOTE: the first shard runs on the token held by the caller, and each of the
+    # others waits for a token of the jobserver
+    results = jobserver.parallel_map(run_shard, shards, len(shards))
+
+    returncode = next((r[0] for r in results if r[0] != 0), 0)
+    return (
+        returncode,
+        "".join(r[1] for r in results),
+        "".join(r[2] for r in results),
+    )
+
+
+def _run_shard(
+    func: Callable[[List[str]], List[R]], shard: List[str]
+) -> Tuple[List[R], int]:
+    """Applies `func` to `shard` in a worker process of `map_sharded`.
+
+    It returns the peak RSS of the worker as well, which is 0 when it is not available.
+    """
+    ret = func(shard)
+    max_rss = 0
+    if sys.platform != "win32":
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return ret, max_rss
+
+
+def map_sharded(
+    func: Callable[[List[str]], List[R]],
+    args: Sequence[str],
+    reporter: Reporter,
+    jobs: int,
+    cost: Callable[[str], int] = get_file_size,
+) -> List[R]:
+    """Applies `func` to shards of `args` concurrently on up to `jobs` worker processes.
+
+    This is the counterpart of `run_sharded` for tools driven through their python API.
+    `func` must be picklable (e.g., a module-level function) when `args` are split.
+    A small `args` is processed in the calling thread without starting any process.
+    It returns the results of the shards concatenated in the order of the shards.
+    Like `run`, the worker processes are killed when the target is cancelled or
+    pysen is interrupted, which raises `CommandCancelledError`, and when the deadline
+    of the context expires, which raises `CommandTimeoutError`.
+    """
+    name = f"the shards of {reporter.name}"
+    num_shards = min(jobs, math.ceil(len(args) / _MinArgsPerShard))
+    if num_shards <= 1:
+        # NOTE: `func` can't be stopped once it runs in the calling thread
+        _check_runnable(name)
+        memory_budget.record_in_process()
+        return func(list(args))
+
+    shards = split_shards(args, num_shards, cost)
+    reporter.logger.info(f"Running {len(shards)} shards in parallel")
+
+    # NOTE: worker processes are spawned instead of forked, since forking a process
+    # that runs other threads may deadlock the child. Each shard is submitted while
+    # its thread holds a token of the jobserver, like `run_sharded`.
+    context = multiprocessing.get_context("spawn")
+    with contextlib.ExitStack() as stack:
+        pool = stack.enter_context(
+            ProcessPoolExecutor(max_workers=len(shards), mp_context=context)
+        )
+        stopped = threading.Event()
+        # NOTE: submitting a shard may start a worker, which must not be missed by
+        # `stop` running concurrently
+        lock = threading.Lock()
+
+        def stop() -> None:
+            stopped.set()
+            # NOTE: the pool waits for the running shards on shutdown, so the workers
+            # are killed to stop them, which breaks the futures of the pool
+            with lock:
+                processes = list((pool._processes or {}).values())
+                pool.shutdown(wait=False, cancel_futures=True)
+            for proc in processes:
+                proc.kill()
+
+        cancel = cancellation.get_cancellation()
+        if cancel is not None:
+            stack.enter_context(cancel.register(stop))
+        interruption = cancellation.get_interruption()
+        if interruption is not None:
+            stack.enter_context(interruption.register(stop))
+
+        def run_shard(shard: List[str]) -> List[R]:
+            timeout = _check_runnable(name)
+            started = time.monotonic()
+            try:
+                with lock:
+                    future = pool.submit(_run_shard, func, shard)
+                ret, max_rss = future.result(timeout=timeout)
+            except concurrent.futures.TimeoutError:
+                stop()
+                raise CommandTimeoutError(
+                    f"{name} were terminated after running for {timeout:.1f} seconds"
+                ) from None
+            except (BrokenProcessPool, concurrent.futures.CancelledError, RuntimeError):
+                # NOTE: `submit` raises RuntimeError after the pool is shut down
+                if not stopped.is_set():
+                    raise
+                _check_runnable(name)
+                raise CommandCancelledError(
+                    f"{name} were stopped by the cancellation"
+                ) from None
+            if max_rss > 0:
+                memory_budget.record_peak_rss(max_rss, started)
+            return ret
+
+        results = jobserver.parallel_map(run_shard, shards, len(shards))
+
+    return [x for r in results for x in r]
+
+
+@contextlib.contextmanager
+def argument_file(args: Sequence[str]) -> Iterator[pathlib.Path]:
+    """Writes `args` to a temporary file, one argument per line.
+
+    It is intended for tools that accept `@file` arguments like `argparse` with
+    `fromfile_prefix_chars="@"`.
+    """
+    if any("\n" in x for x in args):
+        raise ValueError("arguments must not contain newlines")
+
+    fd, path = tempfile.mkstemp(prefix="pysen_", suffix=".args")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.writelines(f"{x}\n" for x in args)
+        yield pathlib.Path(path)
+    finally:
+        os.unlink(path)
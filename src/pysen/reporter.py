@@ -18,9 +18,12 @@ class Reporter:
         self._name = name
         self._success: Optional[bool] = None
         self._exit_code: Optional[int] = None
+        self._cancelled = False
+        self._timed_out = False
 
         self._commands: List[str] = []
         self._diagnostics: List[Diagnostic] = []
+        self._statistics: List[str] = []
         self._started: Optional[float] = None
         self._ended: Optional[float] = None
 
@@ -41,11 +44,23 @@ class Reporter:
         assert self._exit_code is not None
         return self._exit_code
 
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    @property
+    def timed_out(self) -> bool:
+        return self._timed_out
+
     @property
     def commands(self) -> List[str]:
         assert self._commands is not None
         return self._commands
 
+    @property
+    def started(self) -> bool:
+        return self._started is not None
+
     @property
     def elapsed_time(self) -> float:
         assert self._started is not None
@@ -56,6 +71,10 @@ class Reporter:
     def diagnostics(self) -> List[Diagnostic]:
         return self._diagnostics
 
+    @property
+    def statistics(self) -> List[str]:
+        return self._statistics
+
     def __enter__(self) -> "Reporter":
         self._started = time.time()
         self.logger.info(f"Running: {self.name}")
@@ -67,6 +86,10 @@ class Reporter:
     def report_diagnostics(self, diagnostics: Sequence[Diagnostic]) -> None:
         self._diagnostics.extend(diagnostics)
 
+    def report_statistics(self, statistics: str) -> None:
+        """Reports a short message shown next to the result in the summary."""
+        self._statistics.append(statistics)
+
     def report_command(self, cmd: str) -> None:
         self._logger.debug(f"> {cmd}")
         self._commands.append(cmd)
@@ -83,6 +106,18 @@ class Reporter:
         self._success = success
         self._exit_code = exit_code
 
+    def set_cancelled(self, exit_code: Optional[int] = None) -> None:
+        """Marks the command as cancelled because another command has failed."""
+        self._success = False
+        self._exit_code = exit_code
+        self._cancelled = True
+
+    def set_timed_out(self, exit_code: Optional[int] = None) -> None:
+        """Marks the command as terminated because it has run out of time."""
+        self._success = False
+        self._exit_code = exit_code
+        self._timed_out = True
+
 
 class ReporterFactory:
     def __init__(
@@ -120,14 +155,20 @@ class ReporterFactory:
         with io.StringIO() as buf:
             for r in self._reporters:
                 status_msg = "Failed"
-                if r.success:
+                if r.timed_out:
+                    status_msg = "Timeout"
+                elif r.cancelled:
+                    status_msg = "Cancelled"
+                elif r.success:
                     status_msg = "OK"
 
-                buf.write(
-                    "{} .......... {} ({:.2f} sec)\n".format(
-                        r.name, status_msg, r.elapsed_time
-                    )
-                )
+                buf.write("{} .......... {}".format(r.name, status_msg))
+                # NOTE: commands cancelled before they started have no elapsed time
+                if r.started:
+                    buf.write(" ({:.2f} sec)".format(r.elapsed_time))
+                if len(r.statistics) > 0:
+                    buf.write(" [{}]".format(", ".join(r.statistics)))
+                buf.write("\n")
 
             return buf.getvalue()
 
@@ -135,7 +176,11 @@ class ReporterFactory:
         with io.StringIO() as buf:
             buf.write("Error:\n")
             for r in self._reporters:
-                if not r.success:
+                if r.timed_out:
+                    buf.write(" - {} (timeout)\n".format(r.name))
+                elif r.cancelled:
+                    buf.write(" - {} (cancelled)\n".format(r.name))
+                elif not r.success:
                     buf.write(" - {}\n".format(r.name))
             return buf.getvalue()
 
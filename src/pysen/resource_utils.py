@@ -0,0 +1,181 @@
+import logging
+import math
+import os
+import pathlib
+import re
+from typing import List, Optional, Union
+
+_logger = logging.getLogger(__name__)
+
+_CGROUP_ROOT = pathlib.Path("/sys/fs/cgroup")
+_PROC_SELF_CGROUP = pathlib.Path("/proc/self/cgroup")
+# NOTE: cgroup v1 reports a huge value (e.g., 0x7FFFFFFFFFFFF000) when no limit is set
+_UNLIMITED_MEMORY_THRESHOLD = 1 << 60
+_MEMORY_SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*$", re.I)
+_MEMORY_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def _read_text(path: pathlib.Path) -> Optional[str]:
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return None
+
+
+def _get_cgroup_v2_dirs() -> List[pathlib.Path]:
+    # NOTE: /proc/self/cgroup contains a line like `0::/user.slice/foo.scope` on cgroup v2.
+    # Inside a container, the path is usually `/` and the controller files
+    # are available directly under the cgroup root.
+    dirs: List[pathlib.Path] = []
+    content = _read_text(_PROC_SELF_CGROUP)
+    if content is not None:
+        for line in content.splitlines():
+            hierarchy_id, _, path = line.split(":", 2)
+            if hierarchy_id == "0":
+                dirs.append(_CGROUP_ROOT / path.lstrip("/"))
+
+    dirs.append(_CGROUP_ROOT)
+    return dirs
+
+
+def _get_cgroup_cpu_quota() -> Optional[float]:
+    """Returns the number of CPUs available under the cgroup quota, if any."""
+    # cgroup v2: cpu.max contains "<quota> <period>" or "max <period>"
+    for d in _get_cgroup_v2_dirs():
+        content = _read_text(d / "cpu.max")
+        if content is None:
+            continue
+
+        quota, _, period = content.partition(" ")
+        if quota == "max" or not period:
+            return None
+        return int(quota) / int(period)
+
+    # cgroup v1: cpu.cfs_quota_us is -1 when no quota is set
+    for controller in ("cpu", "cpu,cpuacct"):
+        d = _CGROUP_ROOT / controller
+        quota_str = _read_text(d / "cpu.cfs_quota_us")
+        period_str = _read_text(d / "cpu.cfs_period_us")
+        if quota_str is None or period_str is None:
+            continue
+
+        quota_us = int(quota_str)
+        period_us = int(period_str)
+        if quota_us <= 0 or period_us <= 0:
+            return None
+        return quota_us / period_us
+
+    return None
+
+
+def _get_schedulable_cpu_count() -> int:
+    if hasattr(os, "process_cpu_count"):
+        count: Optional[int] = os.process_cpu_count()
+    elif hasattr(os, "sched_getaffinity"):
+        count = len(os.sched_getaffinity(0))
+    else:
+        count = os.cpu_count()
+
+    return count or 1
+
+
+def get_cpu_count() -> int:
+    """Returns the number of CPUs this process can actually use.
+
+    Unlike `os.cpu_count()`, it honors the CPU affinity mask and cgroup CPU quotas
+    so that pysen doesn't assume every host core is available in a container.
+    """
+    count = _get_schedulable_cpu_count()
+    try:
+        quota = _get_cgroup_cpu_quota()
+    except ValueError:
+        _logger.debug("failed to parse cgroup cpu quota", exc_info=True)
+        quota = None
+
+    if quota is not None:
+        count = min(count, max(1, math.ceil(quota)))
+
+    return count
+
+
+def get_num_jobs(jobs: Optional[int]) -> int:
+    if jobs is not None:
+        return jobs
+
+    return get_cpu_count()
+
+
+def parse_memory_size(value: Union[int, str]) -> int:
+    """Parses a memory size like `4G`, `512MiB` or `1073741824` into bytes.
+
+    Units are binary, i.e., `1K` is 1024 bytes.
+    """
+    if isinstance(value, int):
+        size = value
+    else:
+        m = _MEMORY_SIZE_PATTERN.match(value)
+        if m is None:
+            raise ValueError(f"invalid memory size: {value}")
+        size = int(float(m.group(1)) * _MEMORY_UNITS[m.group(2).upper()])
+
+    if size <= 0:
+        raise ValueError(f"memory size must be positive: {value}")
+    return size
+
+
+def _get_cgroup_memory_limit() -> Optional[int]:
+    # cgroup v2: memory.max contains "<bytes>" or "max"
+    for d in _get_cgroup_v2_dirs():
+        content = _read_text(d / "memory.max")
+        if content is None:
+            continue
+
+        if content == "max":
+            return None
+        return int(content)
+
+    # cgroup v1
+    content = _read_text(_CGROUP_ROOT / "memory" / "memory.limit_in_bytes")
+    if content is None:
+        return None
+
+    limit = int(content)
+    if limit <= 0 or limit >= _UNLIMITED_MEMORY_THRESHOLD:
+        return None
+    return limit
+
+
+def _get_physical_memory() -> Optional[int]:
+    try:
+        pages = os.sysconf("SC_PHYS_PAGES")
+        page_size = os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, OSError, ValueError):
+        return None
+
+    if pages <= 0 or page_size <= 0:
+        return None
+    return pages * page_size
+
+
+def get_memory_limit() -> Optional[int]:
+    """Returns the amount of memory in bytes this process and its children can use.
+
+    The cgroup memory limit is honored as well as the physical memory of the host.
+    """
+    limits: List[int] = []
+    physical = _get_physical_memory()
+    if physical is not None:
+        limits.append(physical)
+
+    try:
+        cgroup_limit = _get_cgroup_memory_limit()
+    except ValueError:
+        _logger.debug("failed to parse cgroup memory limit", exc_info=True)
+        cgroup_limit = None
+
+    if cgroup_limit is not None:
+        limits.append(cgroup_limit)
+
+    if len(limits) == 0:
+        return None
+    return min(limits)
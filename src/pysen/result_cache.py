@@ -0,0 +1,161 @@
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ._version import __version__
+from .diagnostic import Diagnostic
+from .dist_version import get_version
+from .exceptions import DistributionNotFound
+
+_logger = logging.getLogger(__name__)
+
+# NOTE: bump this value when the layout of cache entries changes
+_CacheFormatVersion = 1
+
+
+def _hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _hash_file(path: pathlib.Path) -> Optional[str]:
+    try:
+        return _hash_bytes(path.read_bytes())
+    except OSError:
+        return None
+
+
+def _dump_diagnostic(diagnostic: Diagnostic) -> Dict[str, Any]:
+    data = dataclasses.asdict(diagnostic)
+    data["file_path"] = str(diagnostic.file_path)
+    return data
+
+
+def _load_diagnostic(data: Dict[str, Any]) -> Diagnostic:
+    data = dict(data)
+    data["file_path"] = pathlib.Path(data["file_path"])
+    return Diagnostic(**data)
+
+
+class ResultCache:
+    """Stores the lint result of each file of a command.
+
+    An entry is valid only when the content of the file, the version of the tool and
+    the exported setting file are identical to those when the entry was stored.
+    """
+
+    def __init__(self, path: pathlib.Path, namespace: str) -> None:
+        self._path = path
+        self._namespace = namespace
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._file_keys: Dict[pathlib.Path, str] = {}
+        self._dirty = False
+        self._load()
+
+    @classmethod
+    def create(
+        cls,
+        cache_dir: pathlib.Path,
+        command_name: str,
+        tool_name: str,
+        setting_path: pathlib.Path,
+    ) -> Optional["ResultCache"]:
+        try:
+            tool_version = str(get_version(tool_name))
+        except DistributionNotFound:
+            _logger.debug(f"{tool_name} not found, result cache is disabled")
+            return None
+
+        setting_hash = _hash_file(setting_path)
+        namespace = _hash_bytes(
+            json.dumps(
+                [
+                    _CacheFormatVersion,
+                    __version__,
+                    tool_name,
+                    tool_version,
+                    setting_hash,
+                ]
+            ).encode()
+        )
+        file_name = f"{_hash_bytes(command_name.encode())[:16]}.json"
+        return cls(cache_dir / "results" / file_name, namespace)
+
+    def _load(self) -> None:
+        try:
+            with self._path.open() as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            _logger.warning(f"ignoring broken result cache: {self._path}")
+            return
+
+        if isinstance(data, dict) and data.get("version") == _CacheFormatVersion:
+            self._entries = data.get("entries", {})
+
+    def _get_key(self, file_path: pathlib.Path) -> Optional[str]:
+        key = self._file_keys.get(file_path)
+        if key is None:
+            content_hash = _hash_file(file_path)
+            if content_hash is None:
+                return None
+            key = _hash_bytes(f"{self._namespace}:{content_hash}".encode())
+            self._file_keys[file_path] = key
+
+        return key
+
+    def lookup(
+        self, files: Sequence[pathlib.Path]
+    ) -> Tuple[Dict[pathlib.Path, List[Diagnostic]], List[pathlib.Path]]:
+        """Returns the cached diagnostics of hit files, and a list of missed files."""
+        hits: Dict[pathlib.Path, List[Diagnostic]] = {}
+        misses: List[pathlib.Path] = []
+
+        for f in files:
+            entry = self._entries.get(str(f))
+            key = self._get_key(f)
+            if entry is None or key is None or entry.get("key") != key:
+                misses.append(f)
+                continue
+
+            try:
+                hits[f] = [_load_diagnostic(d) for d in entry["diagnostics"]]
+            except (KeyError, TypeError, ValueError):
+                misses.append(f)
+
+        return hits, misses
+
+    def store(self, file_path: pathlib.Path, diagnostics: Sequence[Diagnostic]) -> None:
+        key = self._get_key(file_path)
+        if key is None:
+            return
+
+        self._entries[str(file_path)] = {
+            "key": key,
+            "diagnostics": [_dump_diagnostic(d) for d in diagnostics],
+        }
+        self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+
+        data = {"version": _CacheFormatVersion, "entries": self._entries}
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            # NOTE: write to a temporary file and rename it so that concurrent pysen
+            # processes never read a partially written cache
+            fd, temp_path = tempfile.mkstemp(dir=self._path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self._path)
+        except OSError:
+            _logger.warning(f"failed to save result cache: {self._path}", exc_info=True)
+            return
+
+        self._dirty = False
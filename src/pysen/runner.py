@@ -1,21 +1,35 @@
 import argparse
-import concurrent.futures
 import contextlib
 import logging
 import pathlib
 import tempfile
 from typing import Dict, List, Optional, Sequence
 
-from . import path
-from .command import CommandBase
+from . import (
+    cancellation,
+    deadline,
+    fork_server,
+    jobserver,
+    memory_budget,
+    path,
+    probe_cache,
+    process_utils,
+    resource_utils,
+)
+from .command import CommandBase, check_command_installed
+from .dist_version import get_version
 from .exceptions import (
+    CommandCancelledError,
     CommandNotFoundError,
+    CommandTimeoutError,
+    DistributionNotFound,
     InvalidCommandNameError,
     RunTargetFileNotSupported,
 )
 from .manifest import ManifestBase, ParserType, TargetType
 from .reporter import ReporterFactory
 from .runner_options import PathContext, RunOptions
+from .source import resolution_cache_scope
 from .types import ComponentName, TargetName
 
 _logger = logging.getLogger(__name__)
@@ -30,15 +44,55 @@ def _has_side_effects(target: TargetType) -> bool:
     return any(cmd.has_side_effects for cmd in target)
 
 
+def _get_tools(target: TargetType) -> List[str]:
+    return sorted({tool for cmd in target for tool in cmd.tools})
+
+
+def _get_memory_budget(options: RunOptions) -> Optional[memory_budget.MemoryBudget]:
+    limit = options.memory_limit
+    if limit is None:
+        limit = resource_utils.get_memory_limit()
+    if limit is None:
+        return None
+    return memory_budget.MemoryBudget(limit)
+
+
 def run_target(
     target: TargetType,
     reporters: ReporterFactory,
     options: RunOptions,
     files: Optional[Sequence[pathlib.Path]] = None,
 ) -> None:
+    footprints: Optional[memory_budget.MemoryFootprints] = None
+    if options.cache_dir is not None:
+        footprints = memory_budget.MemoryFootprints.create(options.cache_dir)
+
+    def get_expected_memory(cmd: CommandBase) -> Optional[int]:
+        # NOTE: a footprint given by the user precedes the one measured in the previous
+        # run, which precedes the one declared by the command
+        expected = options.memory_footprints.get(cmd.name)
+        if expected is None and footprints is not None:
+            expected = footprints.get(cmd.name)
+        if expected is None:
+            expected = cmd.expected_memory
+        return expected
+
     def run_cmd(cmd: CommandBase) -> bool:
         _verify_command_name(cmd)
-        with reporters.create(cmd.name) as r:
+        interruption = cancellation.get_interruption()
+        if interruption is not None and interruption.cancelled:
+            reporters.create(cmd.name).set_cancelled()
+            return False
+        cancel = cancellation.get_cancellation()
+        if cancel is not None and cancel.cancelled:
+            reporters.create(cmd.name).set_cancelled()
+            return True
+
+        # NOTE: a timeout given to the command precedes the one given to all commands
+        timeout = options.command_timeouts.get(cmd.name, options.command_timeout)
+        timed_out = False
+        cancelled = False
+        with reporters.create(cmd.name) as r, deadline.deadline_scope(timeout):
             exit_code: int
             try:
                 if files is not None:
@@ -51,35 +105,131 @@ def run_target(
             except RunTargetFileNotSupported:
                 exit_code = 0
                 r.logger.info(f"{cmd.name} does not support target file execution")
+            except CommandCancelledError:
+                exit_code = -1
+                cancelled = True
+                r.logger.info("cancelled")
+            except CommandTimeoutError as e:
+                exit_code = 124
+                timed_out = True
+                r.logger.error(str(e))
             except KeyboardInterrupt:
                 exit_code = 130
                 r.logger.exception("interrupted")
+                # NOTE: the commands running on the other threads are killed
+                # regardless of `--fail-fast`
+                if interruption is not None:
+                    interruption.cancel()
+                if cancel is not None:
+                    cancel.cancel()
                 return False
             except BaseException:
                 exit_code = -1
                 r.logger.exception("unexpected exception")
             finally:
-                r.set_result(exit_code == 0, exit_code)
+                # NOTE: a command that fails by itself while the target is being
+                # cancelled is reported as a failure
+                if timed_out:
+                    r.set_timed_out(exit_code)
+                elif cancelled:
+                    r.set_cancelled(exit_code)
+                else:
+                    r.set_result(exit_code == 0, exit_code)
+
+        if cancel is not None and exit_code != 0 and not cancelled:
+            _logger.info(f"{cmd.name} failed, cancelling the other commands")
+            cancel.cancel()
         return True
 
+    def run_measured_cmd(cmd: CommandBase) -> bool:
+        with memory_budget.track_peak_memory() as peak:
+            ret = run_cmd(cmd)
+        # NOTE: the footprint of a run for specific files, of a run terminated
+        # by the cancellation or the interruption, or of a run that worked in pysen's
+        # own process is not representative, so the previous footprint (or the one
+        # declared by the command) is kept
+        for c in (cancellation.get_cancellation(), cancellation.get_interruption()):
+            if c is not None and c.cancelled:
+                return ret
+        if peak.partial:
+            return ret
+        if footprints is not None and files is None and peak.value is not None:
+            footprints.update(cmd.name, peak.value)
+        return ret
+
     if options.no_parallel:
         is_grouped = False
     else:
         is_grouped = not _has_side_effects(target)
 
-    with reporters.logging_handlers(is_grouped=is_grouped):
+    # NOTE: commands of a target usually share the same source, so the resolved files
+    # are cached while the target is running.
+    # NOTE: commands and their shards take tokens from a single jobserver, so that
+    # pysen never runs more processes than the budget (or the one of `make -j`).
+    with reporters.logging_handlers(
+        is_grouped=is_grouped
+    ), resolution_cache_scope(), jobserver.jobserver_scope(
+        options.jobs
+    ), fork_server.fork_server_scope(
+        options.fork_server
+    ), cancellation.cancellation_scope(
+        options.fail_fast
+    ), cancellation.interruption_scope(), deadline.deadline_scope(
+        options.timeout
+    ):
+        # NOTE: the probes of the tools are cached across runs. When the cache is
+        # stale, the tools are probed in parallel rather than one by one by
+        # the commands.
+        cache = probe_cache.get_probe_cache()
+        tools = _get_tools(target)
+        if cache is not None and not cache.loaded and len(tools) > 0:
+            probe_tools(tools)
+
         if is_grouped:
-            # TODO: control the maximum number of concurrent threads
-            _logger.info("Running commands concurrently...")
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                executor.map(run_cmd, target)
+            # NOTE: each command spawns a heavy subprocess (e.g., mypy), so the number of
+            # concurrent commands is bounded by the number of CPUs available to pysen.
+            max_workers = resource_utils.get_num_jobs(options.jobs)
+            budget = _get_memory_budget(options)
+
+            def run_admitted_cmd(cmd: CommandBase) -> bool:
+                expected = get_expected_memory(cmd)
+                if budget is None or expected is None:
+                    return run_measured_cmd(cmd)
+                # NOTE: wait until the command fits within the memory budget so that
+                # memory hungry commands (e.g., mypy) are not OOM killed
+                with budget.reserve(expected):
+                    return run_measured_cmd(cmd)
+
+            _logger.info(f"Running commands concurrently (jobs={max_workers})...")
+            jobserver.parallel_map(run_admitted_cmd, list(target), max_workers)
             _logger.info("... concurrent execution done")
         else:
             _logger.info("Running commands")
             for cmd in target:
-                if not run_cmd(cmd):
+                if not run_measured_cmd(cmd):
                     break
 
+    if footprints is not None:
+        footprints.save()
+
+
+def _probe_tool(tool: str) -> None:
+    try:
+        get_version(tool)
+        check_command_installed(*process_utils.add_python_executable(tool, "--version"))
+    except (DistributionNotFound, CommandNotFoundError):
+        # NOTE: the command using the tool reports the error if any
+        pass
+
+
+def probe_tools(tools: Sequence[str]) -> None:
+    """Probes the installation and the versions of `tools` in parallel.
+
+    The results are stored in the probe cache, so that the commands run later
+    find them without starting a new interpreter for each tool.
+    """
+    jobserver.parallel_map(_probe_tool, tools, len(tools))
+
 
 class Runner:
     def __init__(self, manifest: ManifestBase) -> None:
@@ -137,6 +287,8 @@ class Runner:
                 tempdir = stack.enter_context(tempfile.TemporaryDirectory())
                 settings_dir = pathlib.Path(tempdir)
 
+            stack.enter_context(probe_cache.probe_scope(options.cache_dir))
+
             paths = PathContext(base_dir, settings_dir)
             self.export_settings(paths.base_dir, paths.settings_dir, manifest_args)
             target = self._get_target(target_name, paths, options, manifest_args)
@@ -1,5 +1,7 @@
 import dataclasses
+import enum
 import pathlib
+from typing import Dict, Optional
 
 
 @dataclasses.dataclass(frozen=True)
@@ -8,7 +10,30 @@ class PathContext:
     settings_dir: pathlib.Path
 
 
+class ExecutionBackend(enum.Enum):
+    """How commands run the tools that support both ways."""
+
+    # run the tool in a new python interpreter
+    SUBPROCESS = "subprocess"
+    # call the python API of the tool in pysen, which saves the start-up time
+    IN_PROCESS = "in-process"
+
+
 @dataclasses.dataclass(frozen=True)
 class RunOptions:
     require_diagnostics: bool = True
     no_parallel: bool = False
+    jobs: Optional[int] = None
+    cache_dir: Optional[pathlib.Path] = None
+    memory_limit: Optional[int] = None
+    memory_footprints: Dict[str, int] = dataclasses.field(default_factory=dict)
+    mypy_cache_dir: Optional[pathlib.Path] = None
+    mypy_sqlite_cache: bool = False
+    mypy_fine_grained_cache: bool = False
+    backend: ExecutionBackend = ExecutionBackend.SUBPROCESS
+    fork_server: bool = False
+    fail_fast: bool = False
+    # NOTE: timeouts are in seconds
+    timeout: Optional[float] = None
+    command_timeout: Optional[float] = None
+    command_timeouts: Dict[str, float] = dataclasses.field(default_factory=dict)
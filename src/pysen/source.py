@@ -1,10 +1,33 @@
+import contextlib
+import contextvars
 import dataclasses
+import os
 import pathlib
-from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set
-
-from .git_utils import GitRepositoryNotFoundError, check_tracked, list_indexed_files
-from .path import PathLikeType, is_contained, resolve_path
+import threading
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from .git_utils import (
+    GitRepositoryNotFoundError,
+    InvalidGitIndexError,
+    check_tracked_files,
+    list_indexed_files,
+)
+from .glob_matcher import GlobMatcher, is_supported_pattern
+from .path import PathLikeType, PathPrefixTrie, resolve_path
 from .reporter import Reporter
+from .walker import is_walked, walk_files
 
 FilePredicateType = Callable[[pathlib.Path], bool]
 
@@ -19,6 +42,10 @@ def extension_filter(accept_extensions: Set[str]) -> FilePredicateType:
 PythonFileFilter = extension_filter({".py", ".pyi"})
 
 
+def _accept_all(path: pathlib.Path) -> bool:
+    return True
+
+
 @dataclasses.dataclass
 class SourceEntrySetting:
     glob: bool
@@ -52,6 +79,115 @@ def _resolve(
     return [resolve_path(base_dir, g) for g in base_dir.glob(p)]
 
 
+def _warn_invalid_index(reporter: Optional[Reporter], e: InvalidGitIndexError) -> None:
+    if reporter is not None:
+        reporter.logger.warning(
+            f"failed to read the git index ({e}). walking directories instead."
+        )
+
+
+def _find_matched_parent(matcher: GlobMatcher, relpath: str) -> Optional[pathlib.Path]:
+    """Returns the innermost parent directory of `relpath` matched by `matcher`."""
+    parts = relpath.split("/")
+    for i in reversed(range(len(parts))):
+        if matcher.match("/".join(parts[:i]), is_dir=True):
+            return matcher.base_dir.joinpath(*parts[:i])
+    return None
+
+
+def _is_walked_from_glob(
+    matcher: GlobMatcher,
+    relpath: str,
+    path: pathlib.Path,
+    excludes: Optional[PathPrefixTrie],
+    base_dir: pathlib.Path,
+    exclude_globs: Sequence[GlobMatcher],
+) -> bool:
+    """Checks if `path` is found by walking a directory matched by `matcher`
+    in the same way as included directories.
+    """
+    parent = _find_matched_parent(matcher, relpath)
+    if parent is None:
+        return False
+    return is_walked(parent, path, excludes, base_dir.resolve(), exclude_globs)
+
+
+def _compile_entries(
+    base_dir: pathlib.Path, entries: Dict[PathLikeType, SourceEntrySetting]
+) -> Tuple[List[pathlib.Path], List[GlobMatcher]]:
+    """Resolves non-glob entries, and compiles glob entries into a matcher per base_dir."""
+    paths: List[pathlib.Path] = []
+    globs: Dict[pathlib.Path, List[str]] = {}
+    for entry, setting in entries.items():
+        # NOTE: "." and unsupported patterns are resolved by pathlib.Path.glob
+        if (
+            setting.glob
+            and isinstance(entry, str)
+            and entry != "."
+            and is_supported_pattern(str(entry))
+        ):
+            glob_base_dir = (setting.base_dir or base_dir).resolve()
+            globs.setdefault(glob_base_dir, []).append(str(entry))
+        else:
+            paths.extend(_resolve(base_dir, entry, setting))
+
+    return paths, [GlobMatcher(d, patterns) for d, patterns in globs.items()]
+
+
+class _ResolutionCacheEntry:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.files: Optional[FrozenSet[pathlib.Path]] = None
+
+
+class SourceResolutionCache:
+    """Shares resolved files among commands that resolve the same source.
+
+    Commands of a target usually share a `Source`, and they run concurrently.
+    The first command resolves the files, and the others wait for and reuse the result.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, _ResolutionCacheEntry] = {}
+
+    def get_or_resolve(
+        self, key: Hashable, resolve: Callable[[], Set[pathlib.Path]]
+    ) -> Set[pathlib.Path]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _ResolutionCacheEntry()
+                self._entries[key] = entry
+
+        with entry.lock:
+            if entry.files is None:
+                entry.files = frozenset(resolve())
+            return set(entry.files)
+
+
+_resolution_cache: contextvars.ContextVar[
+    Optional[SourceResolutionCache]
+] = contextvars.ContextVar("pysen_source_resolution_cache", default=None)
+
+
+@contextlib.contextmanager
+def resolution_cache_scope() -> Iterator[SourceResolutionCache]:
+    """Caches the result of `Source.resolve_files` until the scope exits."""
+    cache = SourceResolutionCache()
+    token = _resolution_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _resolution_cache.reset(token)
+
+
+def _snapshot_entries(
+    entries: Dict[PathLikeType, SourceEntrySetting]
+) -> Tuple[Tuple[PathLikeType, bool, Optional[pathlib.Path]], ...]:
+    return tuple((k, v.glob, v.base_dir) for k, v in entries.items())
+
+
 class Source:
     def __init__(
         self,
@@ -135,28 +271,23 @@ class Source:
         filter_predicate: FilePredicateType,
         use_git: bool,
         reporter: Optional[Reporter] = None,
+        excludes: Optional[PathPrefixTrie] = None,
+        exclude_globs: Sequence[GlobMatcher] = (),
     ) -> Set[pathlib.Path]:
-        includes = self.iter_include_entries(base_dir)
+        includes, include_globs = _compile_entries(base_dir, self._includes)
 
         included_files: Set[pathlib.Path] = set()
+        include_files: List[pathlib.Path] = []
+
+        def warn_outside_repository(include: pathlib.Path) -> None:
+            if reporter is not None:
+                reporter.logger.warning(f"{include} is outside repository. ignored.")
 
         for include in includes:
             if not include.exists():
                 continue
             if include.is_file():
-                # NOTE(igarashi): include this file anyway even though it is
-                # not a .py file (e.g., script/command)
-                if use_git:
-                    try:
-                        if not check_tracked(include):
-                            continue
-                    except GitRepositoryNotFoundError:
-                        if reporter is not None:
-                            reporter.logger.warning(
-                                f"{include} is outside repository. ignored."
-                            )
-
-                included_files.add(include)
+                include_files.append(include)
             else:
                 if use_git:
                     try:
@@ -166,15 +297,78 @@ class Source:
                             if filter_predicate(x)
                         )
                     except GitRepositoryNotFoundError:
-                        if reporter is not None:
-                            reporter.logger.warning(
-                                f"{include} is outside repository. ignored."
-                            )
+                        warn_outside_repository(include)
                 else:
+                    # NOTE: excluded and ignored subtrees (e.g., virtualenvs) are
+                    # pruned while walking the directory
                     included_files.update(
-                        x for x in include.glob("**/*") if filter_predicate(x)
+                        x
+                        for x in walk_files(
+                            include, excludes, base_dir.resolve(), exclude_globs
+                        )
+                        if filter_predicate(x)
                     )
 
+        # NOTE: glob entries are matched against files listed by git or by a single
+        # traversal of their base directory instead of calling Path.glob for each entry.
+        # Files matched by a glob are included in the same way as includes,
+        # and files in matched directories in the same way as included directories.
+        for matcher in include_globs:
+            if use_git:
+                try:
+                    candidates = list_indexed_files(matcher.base_dir)
+                except GitRepositoryNotFoundError:
+                    # files outside repository are included with a warning
+                    # like `include_files`, while directories are ignored
+                    for x in walk_files(
+                        matcher.base_dir, excludes, None, exclude_globs, False
+                    ):
+                        relpath = matcher.relative(str(x))
+                        if relpath is not None and matcher.match(relpath):
+                            warn_outside_repository(x)
+                            included_files.add(x)
+                    continue
+
+                for x in candidates:
+                    relpath = matcher.relative(str(x))
+                    if relpath is None:
+                        continue
+                    if matcher.match(relpath) or (
+                        matcher.match_parent(relpath) and filter_predicate(x)
+                    ):
+                        included_files.add(x)
+            else:
+                # NOTE: files ignored by .gitignore are included if they are matched
+                # by a glob, so the base directory is walked without .gitignore
+                for x in walk_files(
+                    matcher.base_dir, excludes, None, exclude_globs, False
+                ):
+                    relpath = matcher.relative(str(x))
+                    if relpath is None:
+                        continue
+                    if matcher.match(relpath) or (
+                        matcher.match_parent(relpath)
+                        and filter_predicate(x)
+                        and _is_walked_from_glob(
+                            matcher, relpath, x, excludes, base_dir, exclude_globs
+                        )
+                    ):
+                        included_files.add(x)
+
+        # NOTE(igarashi): include these files anyway even though they are
+        # not .py files (e.g., script/command)
+        if use_git:
+            tracked, outside = check_tracked_files(include_files)
+            for include in include_files:
+                if include in outside:
+                    warn_outside_repository(include)
+                elif include not in tracked:
+                    continue
+
+                included_files.add(include)
+        else:
+            included_files.update(include_files)
+
         return included_files
 
     def resolve_files(
@@ -196,20 +390,176 @@ class Source:
             [PosixPath("foo/main.py"), PosixPath("foo/module.py"), PosixPath("bar/doc.md")]
         """
 
-        def _default(x: pathlib.Path) -> bool:
-            return True
+        assert base_dir.is_absolute()
 
-        filter_predicate = filter_predicate or _default
+        cache = _resolution_cache.get()
+        if cache is None:
+            return self._resolve_files(base_dir, filter_predicate, use_git, reporter)
+
+        # NOTE: the key is a snapshot since includes and excludes are mutable
+        key = (
+            _snapshot_entries(self._includes),
+            _snapshot_entries(self._excludes),
+            base_dir,
+            filter_predicate,
+            use_git,
+        )
+        return cache.get_or_resolve(
+            key,
+            lambda: self._resolve_files(base_dir, filter_predicate, use_git, reporter),
+        )
+
+    def supports_covered_files(self) -> bool:
+        """Returns whether `resolve_covered_files` agrees with `resolve_files`.
+
+        A subclass customizing `resolve_files` should return False unless it overrides
+        `resolve_covered_files` accordingly, so that `resolve_files` is used instead.
+        """
+        return True
 
+    def resolve_covered_files(
+        self,
+        base_dir: pathlib.Path,
+        files: Iterable[pathlib.Path],
+        filter_predicate: Optional[FilePredicateType],
+        use_git: bool = True,
+        reporter: Optional[Reporter] = None,
+    ) -> Set[pathlib.Path]:
+        """Returns files in `files` that `resolve_files` would return.
+        Note:
+            Unlike `resolve_files`, it checks each file against the includes, excludes
+            and the git index without listing all the files of the source.
+        """
+        predicate: FilePredicateType = filter_predicate or _accept_all
         assert base_dir.is_absolute()
+        ignore_root = base_dir.resolve()
 
-        included = self._resolve_include_files(
-            base_dir, filter_predicate, use_git, reporter
-        )
+        includes, include_globs = _compile_entries(base_dir, self._includes)
+        exclude_entries, exclude_globs = _compile_entries(base_dir, self._excludes)
+        excludes = PathPrefixTrie(exclude_entries)
 
-        exclude_entries = list(self.iter_exclude_entries(base_dir))
+        include_files: Set[pathlib.Path] = set()
+        include_dirs: Dict[str, pathlib.Path] = {}
+        for include in includes:
+            if include.is_file():
+                include_files.add(include)
+            elif include.is_dir():
+                include_dirs[str(include)] = include
+
+        def is_reachable(root: pathlib.Path, path: pathlib.Path) -> bool:
+            if use_git:
+                # NOTE: tracked files are checked later at once
+                return True
+            return is_walked(root, path, excludes, ignore_root, exclude_globs)
+
+        def is_included(path: pathlib.Path) -> bool:
+            path_str = str(path)
+            parent = os.path.dirname(path_str)
+            while True:
+                include_dir = include_dirs.get(parent)
+                if include_dir is not None:
+                    if predicate(path) and is_reachable(include_dir, path):
+                        return True
+                next_parent = os.path.dirname(parent)
+                if next_parent == parent:
+                    break
+                parent = next_parent
+
+            for m in include_globs:
+                relpath = m.relative(path_str)
+                if relpath is None or not m.match_parent(relpath):
+                    continue
+                if predicate(path) and (
+                    use_git
+                    or _is_walked_from_glob(
+                        m, relpath, path, excludes, base_dir, exclude_globs
+                    )
+                ):
+                    return True
+
+            return False
+
+        def is_glob_matched(path: pathlib.Path) -> bool:
+            path_str = str(path)
+            for m in include_globs:
+                relpath = m.relative(path_str)
+                if relpath is None or not m.match(relpath):
+                    continue
+                # NOTE: files matched by a glob are included even if they are
+                # ignored by .gitignore (see `_resolve_include_files`)
+                if use_git or is_walked(
+                    m.base_dir, path, excludes, None, exclude_globs, False
+                ):
+                    return True
+
+            return False
+
+        def is_excluded(path: pathlib.Path) -> bool:
+            if excludes.is_contained(path):
+                return True
+            path_str = str(path)
+            return any(m.contains(path_str) for m in exclude_globs)
+
+        # files explicitly included or matched by a glob are covered even if they are
+        # outside repository
+        candidates: Dict[pathlib.Path, bool] = {}
+        for f in files:
+            if is_excluded(f):
+                continue
+            if f in include_files or is_glob_matched(f):
+                candidates[f] = True
+            elif is_included(f):
+                candidates[f] = False
+
+        if not use_git:
+            return set(candidates.keys())
+
+        covered: Set[pathlib.Path] = set()
+        try:
+            tracked, outside = check_tracked_files(candidates.keys())
+        except InvalidGitIndexError as e:
+            _warn_invalid_index(reporter, e)
+            return self.resolve_covered_files(
+                base_dir, list(candidates.keys()), filter_predicate, False, reporter
+            )
+        for f, explicit in candidates.items():
+            if f in outside:
+                if reporter is not None:
+                    reporter.logger.warning(f"{f} is outside repository. ignored.")
+                if not explicit:
+                    continue
+            elif f not in tracked or not os.path.lexists(f):
+                continue
 
-        def exclude_filter(path: pathlib.Path) -> bool:
-            return not any(is_contained(exclude, path) for exclude in exclude_entries)
+            covered.add(f)
 
-        return set(filter(exclude_filter, included))
+        return covered
+
+    def _resolve_files(
+        self,
+        base_dir: pathlib.Path,
+        filter_predicate: Optional[FilePredicateType],
+        use_git: bool,
+        reporter: Optional[Reporter],
+    ) -> Set[pathlib.Path]:
+        filter_predicate = filter_predicate or _accept_all
+
+        exclude_entries, exclude_globs = _compile_entries(base_dir, self._excludes)
+        excludes = PathPrefixTrie(exclude_entries)
+        try:
+            included = self._resolve_include_files(
+                base_dir, filter_predicate, use_git, reporter, excludes, exclude_globs
+            )
+        except InvalidGitIndexError as e:
+            _warn_invalid_index(reporter, e)
+            included = self._resolve_include_files(
+                base_dir, filter_predicate, False, reporter, excludes, exclude_globs
+            )
+
+        def is_excluded(path: pathlib.Path) -> bool:
+            if excludes.is_contained(path):
+                return True
+            path_str = str(path)
+            return any(m.contains(path_str) for m in exclude_globs)
+
+        return {f for f in included if not is_excluded(f)}
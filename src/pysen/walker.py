@@ -0,0 +1,269 @@
+import logging
+import os
+import pathlib
+import re
+from typing import Iterator, List, NamedTuple, Optional, Pattern, Sequence, Tuple
+
+from .glob_matcher import GlobMatcher
+from .path import PathPrefixTrie
+
+_logger = logging.getLogger(__name__)
+
+GITIGNORE_FILENAME = ".gitignore"
+_GIT_DIRNAME = ".git"
+
+
+class IgnoreRule(NamedTuple):
+    regex: Pattern[str]
+    negated: bool
+    dir_only: bool
+
+
+class IgnoreFile(NamedTuple):
+    # an absolute path of the directory that contains the ignore file
+    base_dir: str
+    rules: Tuple[IgnoreRule, ...]
+
+
+def _translate_glob(pattern: str) -> str:
+    # NOTE: See https://git-scm.com/docs/gitignore#_pattern_format
+    ret: List[str] = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if (
+            pattern.startswith("**", i)
+            and (i == 0 or pattern[i - 1] == "/")
+            and (i + 2 == n or pattern[i + 2] == "/")
+        ):
+            if i + 2 == n:
+                # a trailing "/**" matches everything inside
+                ret.append(".*")
+                i += 2
+            else:
+                # a leading "**/" or "/**/" matches zero or more directories
+                ret.append("(?:.*/)?")
+                i += 3
+            continue
+
+        if c == "*":
+            ret.append("[^/]*")
+        elif c == "?":
+            ret.append("[^/]")
+        elif c == "[":
+            j = pattern.find("]", i + 2 if pattern.startswith("[!", i) else i + 1)
+            if j < 0:
+                ret.append(re.escape(c))
+            else:
+                content = pattern[i + 1 : j].replace("\\", "\\\\")
+                if content.startswith("!"):
+                    content = "^" + content[1:]
+                ret.append(f"[{content}]")
+                i = j
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            ret.append(re.escape(pattern[i]))
+        else:
+            ret.append(re.escape(c))
+        i += 1
+
+    return "".join(ret)
+
+
+def parse_ignore_rule(line: str) -> Optional[IgnoreRule]:
+    line = line.rstrip("\n")
+    if len(line) == 0 or line.startswith("#"):
+        return None
+
+    # trailing spaces are ignored unless they are escaped
+    stripped = line.rstrip(" ")
+    if stripped.endswith("\\") and len(stripped) < len(line):
+        stripped += " "
+    line = stripped
+
+    negated = line.startswith("!")
+    if negated:
+        line = line[1:]
+
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if len(line) == 0:
+        return None
+
+    # a pattern with a separator is relative to the directory of the ignore file
+    if "/" in line:
+        regex = _translate_glob(line.lstrip("/"))
+    else:
+        regex = "(?:.*/)?" + _translate_glob(line)
+
+    return IgnoreRule(re.compile(f"^{regex}$"), negated, dir_only)
+
+
+def load_ignore_file(base_dir: str) -> Optional[IgnoreFile]:
+    try:
+        with open(os.path.join(base_dir, GITIGNORE_FILENAME)) as f:
+            lines = f.readlines()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    except (OSError, UnicodeDecodeError):
+        _logger.warning(f"failed to read {GITIGNORE_FILENAME} in {base_dir}")
+        return None
+
+    rules = tuple(r for r in map(parse_ignore_rule, lines) if r is not None)
+    if len(rules) == 0:
+        return None
+
+    return IgnoreFile(base_dir, rules)
+
+
+def is_ignored(path: str, is_dir: bool, ignore_files: Tuple[IgnoreFile, ...]) -> bool:
+    """Checks if `path` is ignored by `ignore_files` ordered from the outermost one."""
+    ignored = False
+    for ignore_file in ignore_files:
+        relpath = path[len(ignore_file.base_dir) + 1 :]
+        if os.sep != "/":
+            relpath = relpath.replace(os.sep, "/")
+        # the last matching rule takes precedence
+        for rule in ignore_file.rules:
+            if (not rule.dir_only or is_dir) and rule.regex.match(relpath):
+                ignored = not rule.negated
+
+    return ignored
+
+
+def _load_parent_ignore_files(
+    root: str, ignore_root: Optional[pathlib.Path]
+) -> Tuple[IgnoreFile, ...]:
+    if ignore_root is None:
+        return ()
+
+    top = str(ignore_root)
+    if root != top and not root.startswith(os.path.join(top, "")):
+        return ()
+
+    dirs: List[str] = []
+    d = os.path.dirname(root)
+    while len(d) >= len(top):
+        dirs.append(d)
+        if d == top:
+            break
+        d = os.path.dirname(d)
+
+    loaded = (load_ignore_file(d) for d in reversed(dirs))
+    return tuple(f for f in loaded if f is not None)
+
+
+def walk_files(
+    root: pathlib.Path,
+    excludes: Optional[PathPrefixTrie] = None,
+    ignore_root: Optional[pathlib.Path] = None,
+    exclude_globs: Sequence[GlobMatcher] = (),
+    honor_gitignore: bool = True,
+) -> Iterator[pathlib.Path]:
+    """Yields files under `root` like `root.glob("**/*")`, pruning excluded subtrees.
+
+    Paths contained in `excludes` or matched by `exclude_globs`, `.git` directories
+    and paths ignored by `.gitignore` files are skipped without being traversed.
+    `.gitignore` files in the ancestors of `root` up to `ignore_root` are also honored.
+    `.gitignore` files are not read at all if `honor_gitignore` is False.
+    Symbolic links to directories are not followed.
+    """
+    root_str = str(root)
+    if not honor_gitignore:
+        ignore_root = None
+    stack: List[Tuple[str, Tuple[IgnoreFile, ...]]] = [
+        (root_str, _load_parent_ignore_files(root_str, ignore_root))
+    ]
+
+    while len(stack) > 0:
+        dir_path, ignore_files = stack.pop()
+        ignore_file = load_ignore_file(dir_path) if honor_gitignore else None
+        if ignore_file is not None:
+            ignore_files = ignore_files + (ignore_file,)
+
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError:
+            _logger.debug(f"failed to scan {dir_path}", exc_info=True)
+            continue
+
+        subdirs: List[str] = []
+        for entry in entries:
+            if entry.name == _GIT_DIRNAME:
+                continue
+            if excludes is not None and excludes.is_contained(entry.path):
+                continue
+
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                # NOTE: skip symbolic links to directories to avoid infinite loops
+                if not is_dir and entry.is_symlink() and entry.is_dir():
+                    continue
+            except OSError:
+                continue
+
+            if len(ignore_files) > 0 and is_ignored(entry.path, is_dir, ignore_files):
+                continue
+            if any(m.contains(entry.path, is_dir) for m in exclude_globs):
+                continue
+
+            if is_dir:
+                subdirs.append(entry.path)
+            else:
+                yield pathlib.Path(entry.path)
+
+        # NOTE: push in the reverse order so that directories are visited in order
+        stack.extend((d, ignore_files) for d in sorted(subdirs, reverse=True))
+
+
+def is_walked(
+    root: pathlib.Path,
+    path: pathlib.Path,
+    excludes: Optional[PathPrefixTrie] = None,
+    ignore_root: Optional[pathlib.Path] = None,
+    exclude_globs: Sequence[GlobMatcher] = (),
+    honor_gitignore: bool = True,
+) -> bool:
+    """Checks if `walk_files` yields `path` without walking the whole `root`.
+
+    Only the ancestors of `path` below `root` are examined.
+    """
+    root_str = str(root)
+    path_str = str(path)
+    root_prefix = os.path.join(root_str, "")
+    if not path_str.startswith(root_prefix):
+        return False
+
+    if not honor_gitignore:
+        ignore_root = None
+    names = path_str[len(root_prefix) :].split(os.sep)
+    ignore_files = _load_parent_ignore_files(root_str, ignore_root)
+    dir_path = root_str
+    for i, name in enumerate(names):
+        ignore_file = load_ignore_file(dir_path) if honor_gitignore else None
+        if ignore_file is not None:
+            ignore_files = ignore_files + (ignore_file,)
+
+        entry_path = os.path.join(dir_path, name)
+        if name == _GIT_DIRNAME:
+            return False
+        if excludes is not None and excludes.is_contained(entry_path):
+            return False
+
+        is_dir = i + 1 < len(names)
+        # NOTE: symbolic links to directories are neither followed nor yielded
+        if is_dir:
+            if os.path.islink(entry_path) or not os.path.isdir(entry_path):
+                return False
+        elif not os.path.lexists(entry_path) or os.path.isdir(entry_path):
+            return False
+
+        if len(ignore_files) > 0 and is_ignored(entry_path, is_dir, ignore_files):
+            return False
+        if any(m.contains(entry_path, is_dir) for m in exclude_globs):
+            return False
+
+        dir_path = entry_path
+
+    return True
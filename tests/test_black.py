@@ -1,6 +1,11 @@
+import pathlib
+import tempfile
 from pathlib import Path
+from unittest import mock
 
+from pysen.ext import black_wrapper
 from pysen.ext.black_wrapper import _parse_file_path
+from pysen.reporter import Reporter
 
 
 def test__parse_file_path() -> None:
@@ -8,3 +13,63 @@ def test__parse_file_path() -> None:
         "path/test_error_line_parser.py      2020-06-01 07:19:58.515112 +0000"
     )
     assert _parse_file_path(black_format) == Path("path/test_error_line_parser.py")
+
+
+def test_run_in_process() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        base_dir = pathlib.Path(d)
+        setting_path = base_dir / "pyproject.toml"
+        setting_path.write_text(
+            '[tool.black]\nline-length = 88\ntarget-version = ["py38"]\n'
+        )
+        source = base_dir / "foo.py"
+        source.write_text("import os\ndef foo( x ):\n  return x\n")
+        stub = base_dir / "bar.pyi"
+        stub.write_text("def bar() -> None: ...\n")
+
+        # diagnostics are the same as the ones of the black command
+        expected = Reporter("black")
+        with expected, mock.patch("os.chdir", side_effect=AssertionError):
+            ret = black_wrapper.run(
+                expected, base_dir, setting_path, [source, stub], False
+            )
+            assert ret == 1
+        reporter = Reporter("black")
+        # the working directory shared by the threads of pysen is never changed
+        with reporter, mock.patch("os.chdir", side_effect=AssertionError):
+            ret = black_wrapper.run_in_process(
+                reporter, base_dir, setting_path, [source, stub], False
+            )
+            assert ret == 1
+        assert len(reporter.diagnostics) > 0
+        assert reporter.diagnostics == expected.diagnostics
+
+        reporter = Reporter("black")
+        with reporter:
+            ret = black_wrapper.run_in_process(
+                reporter, base_dir, setting_path, [source, stub], True
+            )
+            assert ret == 0
+        assert reporter.diagnostics == []
+        assert source.read_text() == "import os\n\n\ndef foo(x):\n    return x\n"
+        assert stub.read_text() == "def bar() -> None: ...\n"
+
+        source.write_text("def foo(:\n")
+        with reporter:
+            ret = black_wrapper.run_in_process(
+                reporter, base_dir, setting_path, [source], False
+            )
+            assert ret == 123
+
+        # unsupported options fall back to the black command
+        setting_path.write_text("[tool.black]\nforce-exclude = 'foo'\n")
+        with mock.patch("pysen.ext.black_wrapper.run", return_value=0) as run:
+            assert (
+                black_wrapper.run_in_process(
+                    reporter, base_dir, setting_path, [source], False
+                )
+                == 0
+            )
+            run.assert_called_once_with(
+                reporter, base_dir, setting_path, [source], False, 1
+            )
@@ -0,0 +1,74 @@
+import contextlib
+from typing import List
+
+import pytest
+
+from pysen.cancellation import (
+    Cancellation,
+    cancellation_scope,
+    get_cancellation,
+    get_interruption,
+    interruption_scope,
+)
+from pysen.exceptions import CommandCancelledError
+
+
+def test_cancellation() -> None:
+    cancellation = Cancellation()
+    terminated: List[str] = []
+    # never raises before the cancellation
+    cancellation.check()
+
+    with cancellation.register(lambda: terminated.append("foo")):
+        with cancellation.register(lambda: terminated.append("bar")):
+            pass
+        cancellation.cancel()
+        assert cancellation.cancelled
+        assert terminated == ["foo"]
+
+        # cancelled only once
+        cancellation.cancel()
+        assert terminated == ["foo"]
+
+    with pytest.raises(CommandCancelledError):
+        cancellation.check()
+
+    # processes started after the cancellation are terminated immediately
+    with cancellation.register(lambda: terminated.append("baz")):
+        assert terminated == ["foo", "baz"]
+
+
+def test_cancellation_scope() -> None:
+    assert get_cancellation() is None
+    with cancellation_scope(False) as cancellation:
+        assert cancellation is None
+        assert get_cancellation() is None
+
+    with cancellation_scope(True) as cancellation:
+        assert cancellation is not None
+        assert get_cancellation() is cancellation
+    assert get_cancellation() is None
+
+
+def test_interruption_scope() -> None:
+    assert get_interruption() is None
+    terminated: List[str] = []
+    with interruption_scope() as interruption:
+        assert get_interruption() is interruption
+        with interruption.register(lambda: terminated.append("foo")):
+            pass
+    assert get_interruption() is None
+    assert terminated == []
+    assert not interruption.cancelled
+
+    # the processes (e.g., the ones of the other threads) are killed when pysen
+    # is interrupted
+    with contextlib.ExitStack() as stack:
+        with pytest.raises(KeyboardInterrupt):
+            with interruption_scope() as interruption:
+                stack.enter_context(
+                    interruption.register(lambda: terminated.append("bar"))
+                )
+                raise KeyboardInterrupt
+        assert terminated == ["bar"]
+    assert interruption.cancelled
@@ -1,6 +1,18 @@
+import argparse
+import pathlib
+import tempfile
 from unittest import mock
 
-from pysen.cli import _use_pretty_logging
+import git
+import pytest
+
+from pysen.cli import _get_changed_files, _use_pretty_logging
+from pysen.flake8 import Flake8Command
+from pysen.isort import IsortCommand
+from pysen.lint_command import LintCommandBase
+from pysen.reporter import Reporter
+from pysen.runner_options import PathContext
+from pysen.source import Source
 
 
 def test__use_pretty_logging() -> None:
@@ -9,3 +21,46 @@ def test__use_pretty_logging() -> None:
 
     with mock.patch("sys.stderr.isatty", return_value=False):
         assert not _use_pretty_logging()
+
+
+@pytest.mark.parametrize("command_type", ["flake8", "isort"])
+def test_changed_files_excluded(command_type: str) -> None:
+    with tempfile.TemporaryDirectory() as d:
+        base_dir = pathlib.Path(d).resolve()
+        settings_dir = base_dir / "settings"
+        settings_dir.mkdir()
+        (settings_dir / "setup.cfg").write_text("[flake8]\n")
+        (settings_dir / "pyproject.toml").write_text("[tool.isort]\n")
+        included = base_dir / "foo.py"
+        excluded = base_dir / "vendor" / "bar.py"
+        excluded.parent.mkdir()
+        for f in (included, excluded):
+            f.write_text("import sys\n")
+
+        repo = git.Repo.init(base_dir)
+        repo.index.add([str(included), str(excluded)])
+        repo.index.commit("initial commit")
+        repo.create_head("base")
+        # both files violate the settings of flake8 and isort
+        for f in (included, excluded):
+            f.write_text("import sys\nimport os\n")
+
+        args = argparse.Namespace(changed_since="base", staged=False)
+        files = _get_changed_files(base_dir, args)
+        assert files is not None and set(files) == {included, excluded}
+
+        paths = PathContext(base_dir, settings_dir)
+        source = Source(includes=[base_dir], excludes=[excluded.parent])
+        command: LintCommandBase
+        if command_type == "flake8":
+            command = Flake8Command("flake8", paths, source, base_dir / "cache")
+        else:
+            command = IsortCommand("isort", paths, source, False, base_dir / "cache")
+        reporter = Reporter(f"changed_files_{command_type}")
+        with reporter:
+            assert command.run_files(reporter, files) == 1
+        # files excluded from the source are neither checked nor cached
+        assert {d.file_path for d in reporter.diagnostics} == {included}
+        assert str(excluded) not in "".join(
+            p.read_text() for p in (base_dir / "cache").rglob("*.json")
+        )
@@ -1,6 +1,10 @@
 import pathlib
 
-from pysen.cli_config import parse
+import pytest
+
+from pysen.cli_config import _parse_dict, parse
+from pysen.exceptions import InvalidConfigurationError
+from pysen.runner_options import ExecutionBackend
 
 BASE_DIR = pathlib.Path(__file__).resolve().parent
 CONFIG_DIR = BASE_DIR / "fakes/configs"
@@ -12,8 +16,81 @@ def test_example() -> None:
     assert config.settings_dir is not None
     assert config.settings_dir == CONFIG_DIR / "hoge"
     assert config.settings_dir.is_absolute()
+    assert config.jobs == 4
 
 
 def test_parse() -> None:
     assert parse(CONFIG_DIR / "example.toml") is not None
     assert parse(CONFIG_DIR / "simple_source.toml") is None
+
+
+def test_invalid_jobs() -> None:
+    assert _parse_dict({"jobs": 1}, BASE_DIR).jobs == 1
+    with pytest.raises(InvalidConfigurationError):
+        _parse_dict({"jobs": 0}, BASE_DIR)
+
+
+def test_memory_options() -> None:
+    config = _parse_dict(
+        {"memory_limit": "8G", "memory_footprints": {"mypy": "3G", "flake8": 1024}},
+        BASE_DIR,
+    )
+    assert config.memory_limit == 8 << 30
+    assert config.memory_footprints == {"mypy": 3 << 30, "flake8": 1024}
+
+    assert _parse_dict({}, BASE_DIR).memory_limit is None
+    with pytest.raises(InvalidConfigurationError):
+        _parse_dict({"memory_limit": "foo"}, BASE_DIR)
+    with pytest.raises(InvalidConfigurationError):
+        _parse_dict({"memory_footprints": {"mypy": 0}}, BASE_DIR)
+
+
+def test_mypy_cache_options() -> None:
+    config = _parse_dict(
+        {"mypy_cache_dir": "cache", "mypy_sqlite_cache": True}, BASE_DIR
+    )
+    assert config.mypy_cache_dir == BASE_DIR / "cache"
+    assert config.mypy_sqlite_cache
+    assert not config.mypy_fine_grained_cache
+
+
+def test_backend() -> None:
+    assert _parse_dict({}, BASE_DIR).backend is None
+    config = _parse_dict({"backend": "in-process"}, BASE_DIR)
+    assert config.backend == ExecutionBackend.IN_PROCESS
+    with pytest.raises(InvalidConfigurationError):
+        _parse_dict({"backend": "foo"}, BASE_DIR)
+
+
+def test_fail_fast() -> None:
+    assert not _parse_dict({}, BASE_DIR).fail_fast
+    assert _parse_dict({"fail_fast": True}, BASE_DIR).fail_fast
+
+
+def test_timeout() -> None:
+    config = _parse_dict({}, BASE_DIR)
+    assert config.timeout is None
+    assert config.command_timeout is None
+    assert config.command_timeouts == {}
+
+    config = _parse_dict(
+        {"timeout": 600, "command_timeout": 1.5, "command_timeouts": {"mypy": 300}},
+        BASE_DIR,
+    )
+    assert config.timeout == 600.0
+    assert config.command_timeout == 1.5
+    assert config.command_timeouts == {"mypy": 300.0}
+
+    with pytest.raises(InvalidConfigurationError):
+        _parse_dict({"timeout": 0}, BASE_DIR)
+    with pytest.raises(InvalidConfigurationError):
+        _parse_dict({"command_timeouts": {"mypy": -1}}, BASE_DIR)
+    with pytest.raises(InvalidConfigurationError):
+        _parse_dict({"command_timeout": "1m"}, BASE_DIR)
+
+
+def test_fork_server() -> None:
+    assert not _parse_dict({}, BASE_DIR).fork_server
+    assert _parse_dict({"fork_server": True}, BASE_DIR).fork_server
+    with pytest.raises(InvalidConfigurationError):
+        _parse_dict({"fork_server": "yes"}, BASE_DIR)
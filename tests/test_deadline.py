@@ -0,0 +1,33 @@
+import time
+
+import pytest
+
+from pysen.deadline import deadline_scope, get_deadline, get_remaining
+
+
+def test_deadline_scope() -> None:
+    assert get_deadline() is None
+    assert get_remaining() is None
+
+    with deadline_scope(None) as deadline:
+        assert deadline is None
+        assert get_remaining() is None
+
+    started = time.monotonic()
+    with deadline_scope(10) as outer:
+        assert outer is not None
+        assert outer == pytest.approx(started + 10, abs=1)
+        remaining = get_remaining()
+        assert remaining is not None and 0 < remaining <= 10
+
+        # inner scopes never extend the deadline
+        with deadline_scope(100) as inner:
+            assert inner == outer
+        with deadline_scope(None) as inner:
+            assert inner == outer
+        with deadline_scope(1) as inner:
+            assert inner is not None and inner < outer
+            assert get_deadline() == inner
+        assert get_deadline() == outer
+
+    assert get_deadline() is None
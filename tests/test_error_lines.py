@@ -1,7 +1,13 @@
+import difflib
 from pathlib import Path
 from unittest import mock
 
-from pysen.error_lines import parse_error_diffs, parse_error_lines
+from pysen.error_lines import (
+    diff_diagnostics,
+    format_error_lines,
+    parse_error_diffs,
+    parse_error_lines,
+)
 from pysen.ext.black_wrapper import _parse_file_path
 
 std_err1 = "/path/to/file1.py:70:5: error: Missing return statement [return]\n"
@@ -165,3 +171,50 @@ def test_diff_parser() -> None:
     assert err1.start_line == 3
     assert err1.end_line == 6
     assert err1.diff == "-\n-\n     bar: [],\n-\n"
+
+
+def test_diff_diagnostics() -> None:
+    source = "".join(f"line{i}\n" for i in range(50))
+    formatted = source.replace("line3\n", "").replace("line20\n", "line20\n\n")
+    formatted = formatted.replace("line21\n", "LINE21\n") + "line50\n"
+    path = Path("/tmp/tmp.py")
+
+    errors = list(diff_diagnostics(path, source, formatted))
+    assert len(errors) == 3
+    assert errors[0].start_line == 4
+    assert errors[0].end_line == 4
+    assert errors[0].diff == "-line3\n"
+    assert errors[1].start_line == 22
+    assert errors[1].end_line == 22
+    assert errors[1].diff == "-line21\n+\n+LINE21\n"
+    # has only target diff
+    assert errors[2].start_line == 51
+    assert errors[2].end_line == 51
+    assert errors[2].diff == "+line50\n"
+
+    # compatible with the diagnostics parsed from the unified diff
+    diff = difflib.unified_diff(
+        source.splitlines(keepends=True),
+        formatted.splitlines(keepends=True),
+        str(path),
+        str(path),
+        n=5,
+    )
+    assert errors == list(parse_error_diffs("".join(diff), Path))
+    assert list(diff_diagnostics(path, source, source)) == []
+
+
+def test_format_error_lines() -> None:
+    source = "".join(f"line{i}\n" for i in range(50))
+    formatted = source.replace("line3\n", "").replace("line20\n", "line20\n\n")
+    formatted = formatted.replace("line21\n", "LINE21\n") + "line50\n"
+    path = Path("/tmp/tmp.py")
+
+    diffs = list(diff_diagnostics(path, source, formatted))
+    output = format_error_lines(diffs)
+    assert output.startswith(f"--- {path}\n+++ {path}\n@@ -4 +3,0 @@\n-line3\n")
+    assert list(parse_error_diffs(output, Path)) == diffs
+
+    errors = "/tmp/foo.py:3:4: E101 foo\n/tmp/bar.py:5: error: bar\n"
+    messages = list(parse_error_lines(errors))
+    assert format_error_lines(messages) == errors
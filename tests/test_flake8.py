@@ -1,6 +1,17 @@
-from typing import Any, Dict
+import logging
+import pathlib
+import tempfile
+from typing import Any, Dict, List
+from unittest import mock
 
+from flake8.main import application
+
+from pysen.ext import flake8_wrapper
 from pysen.ext.flake8_wrapper import Flake8Setting
+from pysen.flake8 import Flake8Command
+from pysen.reporter import Reporter
+from pysen.runner_options import PathContext
+from pysen.source import Source
 
 
 def test_flake8_setting_comment() -> None:
@@ -12,3 +23,106 @@ def test_flake8_setting_comment() -> None:
     assert len(comments) > 0
     # check that each comment entry doesn't have a value
     assert all(x is None for x in comments.values())
+
+
+def test_run_in_process() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        base_dir = pathlib.Path(d)
+        setting_path = base_dir / "setup.cfg"
+        setting_path.write_text("[flake8]\nignore = E226\nmax-line-length = 40\n")
+        source = base_dir / "foo.py"
+        source.write_text(
+            "import os\nx=1*2\ny = 1  # this line is longer than forty characters\n"
+        )
+        clean = base_dir / "bar.py"
+        clean.write_text("import os  # noqa\n")
+
+        # diagnostics are the same as the ones of the flake8 command
+        expected = Reporter("flake8")
+        with expected, mock.patch("os.chdir", side_effect=AssertionError):
+            ret = flake8_wrapper.run(expected, base_dir, setting_path, [source, clean])
+            assert ret == 1
+
+        flake8_wrapper._get_application.cache_clear()
+        initialize = mock.patch.object(
+            application.Application,
+            "initialize",
+            autospec=True,
+            side_effect=application.Application.initialize,
+        )
+        with initialize as initialize_mock:
+            reporter = Reporter("flake8")
+            # the working directory shared by the threads of pysen is never changed
+            with reporter, mock.patch("os.chdir", side_effect=AssertionError):
+                ret = flake8_wrapper.run_in_process(
+                    reporter, base_dir, setting_path, [source, clean]
+                )
+                assert ret == 1
+            assert len(reporter.diagnostics) == 3
+            assert reporter.diagnostics == expected.diagnostics
+
+            reporter = Reporter("flake8")
+            with reporter:
+                ret = flake8_wrapper.run_in_process(
+                    reporter, base_dir, setting_path, [clean]
+                )
+                assert ret == 0
+            assert reporter.diagnostics == []
+
+            # plugins are loaded only once for the same setting
+            assert initialize_mock.call_count == 1
+
+        # invalid settings are reported as a failure
+        setting_path.write_text("[flake8]\nmax-line-length = foo\n")
+        with reporter:
+            ret = flake8_wrapper.run_in_process(
+                reporter, base_dir, setting_path, [clean]
+            )
+            assert ret == 1
+
+    with mock.patch(
+        "pysen.ext.flake8_wrapper._load_flake8_api", return_value=None
+    ), mock.patch("pysen.ext.flake8_wrapper.run", return_value=0) as run:
+        assert flake8_wrapper.run_in_process(reporter, base_dir, setting_path, []) == 0
+        run.assert_called_once_with(reporter, base_dir, setting_path, [], 1)
+
+
+class MessageHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.messages: List[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.getMessage())
+
+
+def test_flake8_command_cached_output() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        base_dir = pathlib.Path(d)
+        settings_dir = base_dir / "settings"
+        settings_dir.mkdir()
+        (settings_dir / "setup.cfg").write_text("[flake8]\n")
+        source = base_dir / "foo.py"
+        source.write_text("import os\n")
+
+        command = Flake8Command(
+            "flake8",
+            PathContext(base_dir, settings_dir),
+            Source(includes=[base_dir]),
+            cache_dir=base_dir / "cache",
+        )
+        outputs: List[List[str]] = []
+        for _ in range(2):
+            reporter = Reporter("flake8_cached_output")
+            handler = MessageHandler()
+            reporter.process_output.setLevel(logging.INFO)
+            reporter.process_output.handlers.clear()
+            reporter.process_output.addHandler(handler)
+            with reporter:
+                assert command(reporter) == 1
+            assert len(reporter.diagnostics) == 1
+            outputs.append(handler.messages)
+
+        # the cached result is shown like the output of flake8
+        assert outputs[0] == [f"{source}:1:1: F401 'os' imported but unused"]
+        assert outputs[1] == outputs[0]
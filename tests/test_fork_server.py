@@ -0,0 +1,231 @@
+import json
+import os
+import pathlib
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Iterator
+from unittest import mock
+
+import pytest
+
+from pysen import fork_server
+from pysen.command import check_command_installed
+from pysen.exceptions import CommandNotFoundError
+from pysen.fork_server import ForkServerClient, fork_server_scope, get_client
+from pysen.process_utils import run
+from pysen.reporter import Reporter
+
+pytestmark = pytest.mark.skipif(
+    not fork_server.is_supported(), reason="fork server is not supported"
+)
+
+SCRIPT = """import os
+import sys
+
+print("out")
+print("err", file=sys.stderr)
+print(os.getcwd())
+print(os.environ.get("PYSEN_FORK_SERVER_TEST"))
+print(sys.argv[1:])
+sys.exit(int(sys.argv[1]))
+"""
+
+
+@pytest.fixture
+def client() -> Iterator[ForkServerClient]:
+    with tempfile.TemporaryDirectory() as td:
+        socket_path = pathlib.Path(td) / "server.sock"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "pysen.fork_server", str(socket_path), "json"]
+        )
+        try:
+            deadline = time.monotonic() + 30
+            while not socket_path.exists():
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+
+            yield ForkServerClient(socket_path, ["json", "fork_server_test"])
+        finally:
+            server.terminate()
+            server.wait()
+        # the server removes its socket on exit
+        assert not socket_path.exists()
+
+
+def test_supports(client: ForkServerClient) -> None:
+    assert client.supports([sys.executable, "-m", "json.tool"])
+    assert client.supports([sys.executable, "-m", "json"])
+    assert not client.supports([sys.executable, "-m", "jsonschema"])
+    assert not client.supports([sys.executable, "json"])
+    assert not client.supports(["python3", "-m", "json"])
+
+
+def test_spawn(client: ForkServerClient) -> None:
+    with tempfile.TemporaryDirectory() as td:
+        temp_dir = pathlib.Path(td)
+        data = temp_dir / "data.json"
+        data.write_text(json.dumps({"b": 1, "a": [2]}))
+
+        with client.spawn(
+            [sys.executable, "-m", "json.tool", "--sort-keys", str(data)]
+        ) as proc:
+            assert proc.pid > 0
+            stdout = proc.stdout.read().decode()
+            stderr = proc.stderr.read().decode()
+            assert proc.wait() == 0
+            assert proc.returncode == 0
+        assert json.loads(stdout) == {"a": [2], "b": 1}
+        assert stdout.startswith('{\n    "a"')
+        assert stderr == ""
+
+        with client.spawn(
+            [sys.executable, "-m", "json.tool", str(temp_dir / "missing.json")]
+        ) as proc:
+            assert proc.stdout.read() == b""
+            assert b"missing.json" in proc.stderr.read()
+            assert proc.wait() != 0
+
+        assert client.call([sys.executable, "-m", "json.tool", str(data)]) == 0
+        assert client.call([sys.executable, "-m", "json.tool", "missing"]) != 0
+
+
+def test_spawn_environment(client: ForkServerClient) -> None:
+    with tempfile.TemporaryDirectory() as td:
+        temp_dir = pathlib.Path(td).resolve()
+        (temp_dir / "fork_server_test.py").write_text(SCRIPT)
+        cwd = os.getcwd()
+        os.chdir(temp_dir)
+        os.environ["PYSEN_FORK_SERVER_TEST"] = "foo"
+        try:
+            # modules are imported from the working directory like `python -m`
+            with client.spawn(
+                [sys.executable, "-m", "fork_server_test", "3", "a b"]
+            ) as proc:
+                stdout = proc.stdout.read().decode()
+                stderr = proc.stderr.read().decode()
+                assert proc.wait() == 3
+        finally:
+            os.chdir(cwd)
+            del os.environ["PYSEN_FORK_SERVER_TEST"]
+
+        assert stdout.splitlines() == [
+            "out",
+            str(temp_dir),
+            "foo",
+            "['3', 'a b']",
+        ]
+        assert stderr == "err\n"
+
+        # the process runs in `cwd` without changing the working directory
+        with client.spawn(
+            [sys.executable, "-m", "fork_server_test", "0"], cwd=temp_dir
+        ) as proc:
+            stdout = proc.stdout.read().decode()
+            assert proc.wait() == 0
+        assert stdout.splitlines()[1] == str(temp_dir)
+        assert os.getcwd() == cwd
+
+
+def test_kill(client: ForkServerClient) -> None:
+    with tempfile.TemporaryDirectory() as td:
+        script = pathlib.Path(td) / "fork_server_test.py"
+        script.write_text("import time\nprint('start', flush=True)\ntime.sleep(60)\n")
+        cwd = os.getcwd()
+        os.chdir(td)
+        try:
+            with client.spawn([sys.executable, "-m", "fork_server_test"]) as proc:
+                assert proc.stdout.readline() == b"start\n"
+                proc.kill()
+                assert proc.wait() == -9
+        finally:
+            os.chdir(cwd)
+
+
+def test_run(client: ForkServerClient) -> None:
+    with tempfile.TemporaryDirectory() as td:
+        data = pathlib.Path(td) / "data.json"
+        data.write_text('{"a": 1}')
+        cmd = [sys.executable, "-m", "json.tool", str(data)]
+
+        expected = run(cmd, Reporter("fork_server"))
+        with pytest.MonkeyPatch.context() as m:
+            # route the commands to the server started by the fixture
+            m.setattr(fork_server, "get_socket_path", lambda *_: client.socket_path)
+            m.setattr(ForkServerClient, "_start_server", None)
+            with fork_server_scope(True, ["json"]) as scope:
+                assert scope is not None
+                assert get_client() is scope
+                assert run(cmd, Reporter("fork_server")) == expected
+                check_command_installed(sys.executable, "-m", "json.tool", str(data))
+                # other commands run in subprocesses
+                assert run(["echo", "a"], Reporter("fork_server"))[1] == "a\n"
+                with pytest.raises(CommandNotFoundError):
+                    check_command_installed("this_command_does_not_exist")
+        assert get_client() is None
+
+
+def test_fork_server_scope() -> None:
+    with fork_server_scope(False) as client:
+        assert client is None
+        assert get_client() is None
+
+    with fork_server_scope(True, ["json", "this_module_does_not_exist"]) as client:
+        assert client is not None
+        assert client.supports([sys.executable, "-m", "json"])
+        assert not client.supports([sys.executable, "-m", "this_module_does_not_exist"])
+
+
+def test_get_state_dir() -> None:
+    with mock.patch.dict(os.environ, {"XDG_RUNTIME_DIR": "/run/user/1000"}):
+        assert fork_server.get_state_dir() == pathlib.Path(
+            "/run/user/1000/pysen-forkserver"
+        )
+
+    with mock.patch.dict(os.environ, {"XDG_RUNTIME_DIR": ""}):
+        state_dir = fork_server.get_state_dir()
+        assert state_dir.parent == pathlib.Path(tempfile.gettempdir())
+        assert state_dir.name == f"pysen-forkserver-{os.getuid()}"
+
+
+def test_ensure_private_dir() -> None:
+    with tempfile.TemporaryDirectory() as td:
+        state_dir = pathlib.Path(td) / "parent" / "state"
+        fork_server._ensure_private_dir(state_dir)
+        assert stat.S_IMODE(os.stat(state_dir).st_mode) & 0o077 == 0
+        # NOTE: an existing private directory is reused
+        fork_server._ensure_private_dir(state_dir)
+
+        os.chmod(state_dir, 0o777)
+        with pytest.raises(PermissionError):
+            fork_server._ensure_private_dir(state_dir)
+
+        link = pathlib.Path(td) / "link"
+        os.chmod(state_dir, 0o700)
+        link.symlink_to(state_dir)
+        with pytest.raises(PermissionError):
+            fork_server._ensure_private_dir(link)
+
+        with mock.patch("os.getuid", return_value=os.getuid() + 1):
+            with pytest.raises(PermissionError):
+                fork_server._ensure_private_dir(state_dir)
+
+        client = ForkServerClient(link / "server.sock", ["json"])
+        with pytest.raises(PermissionError):
+            client.connect()
+        assert not (state_dir / "server.sock").exists()
+
+
+@pytest.mark.skipif(
+    not hasattr(socket, "SO_PEERCRED"), reason="SO_PEERCRED is not supported"
+)
+def test_check_peer(client: ForkServerClient) -> None:
+    conn = client.connect()
+    conn.close()
+
+    with mock.patch("os.getuid", return_value=os.getuid() + 1):
+        with pytest.raises(PermissionError):
+            client._connect()
@@ -1,4 +1,5 @@
 import pathlib
+import struct
 import tempfile
 from typing import Sequence
 
@@ -112,3 +113,236 @@ def test_check_tracked() -> None:
         repo.index.add([str(test_file)])
 
         assert git_utils.check_tracked(test_file)
+
+
+def test_list_changed_files() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        tempdir = pathlib.Path(d).resolve()
+
+        with pytest.raises(GitRepositoryNotFoundError):
+            git_utils.list_changed_files(tempdir, staged=True)
+
+        repo = git.Repo.init(tempdir)
+        with pytest.raises(ValueError):
+            git_utils.list_changed_files(tempdir)
+        with pytest.raises(ValueError):
+            git_utils.list_changed_files(tempdir, since="HEAD", staged=True)
+
+        base = tempdir / "base.py"
+        deleted = tempdir / "deleted.py"
+        for f in (base, deleted):
+            f.write_text("base\n")
+        repo.index.add([str(base), str(deleted)])
+        repo.index.commit("initial commit")
+        repo.create_head("base")
+
+        assert git_utils.list_changed_files(tempdir, staged=True) == []
+        assert git_utils.list_changed_files(tempdir, since="base") == []
+
+        added = tempdir / "foo" / "added.py"
+        added.parent.mkdir()
+        added.write_text("added\n")
+        repo.index.add([str(added)])
+        repo.index.remove([str(deleted)], working_tree=True)
+
+        assert git_utils.list_changed_files(tempdir, staged=True) == [added]
+        assert git_utils.list_changed_files(tempdir / "foo", staged=True) == [added]
+
+        repo.index.commit("second commit")
+        base.write_text("modified\n")
+
+        assert git_utils.list_changed_files(tempdir, staged=True) == []
+        assert set(git_utils.list_changed_files(tempdir, since="base")) == {
+            added,
+            base,
+        }
+
+        with pytest.raises(git_utils.GitRevisionNotFoundError):
+            git_utils.list_changed_files(tempdir, since="unknown-branch")
+
+
+@pytest.mark.parametrize("version", [2, 3, 4])
+def test_read_index(version: int) -> None:
+    with tempfile.TemporaryDirectory() as d:
+        tempdir = pathlib.Path(d).resolve()
+        repo = git.Repo.init(tempdir)
+
+        paths = ["a.py", "foo/bar.py", "foo/baz.py", "foo_2/c.py"]
+        for p in paths:
+            (tempdir / p).parent.mkdir(parents=True, exist_ok=True)
+            (tempdir / p).write_text(p)
+        repo.git.add(*paths)
+        if version == 3:
+            # intent-to-add entries use the extended flags
+            (tempdir / "intent.py").touch()
+            repo.git.add("-N", "intent.py")
+            paths.append("intent.py")
+        repo.git.update_index("--index-version", str(version))
+
+        entries = git_utils.read_index(tempdir / ".git" / "index")
+        assert [e.path for e in entries] == sorted(paths)
+        for e in entries:
+            if e.path == "intent.py":
+                continue
+            st = (tempdir / e.path).stat()
+            assert e.size == st.st_size
+            assert e.mtime_ns // 1_000_000_000 == int(st.st_mtime)
+
+        git_utils.list_indexed_files.cache_clear()
+        assert set(git_utils.list_indexed_files(tempdir / "foo")) == {
+            tempdir / "foo" / "bar.py",
+            tempdir / "foo" / "baz.py",
+        }
+        git_utils.list_indexed_files.cache_clear()
+
+
+def test_read_index_long_path() -> None:
+    # a path longer than 0xFFF bytes doesn't fit into the name length field
+    long_path = ("x" * 5000).encode()
+    entry = struct.pack(">10I20sH", 0, 0, 1, 2, 0, 0, 0o100644, 0, 0, 3, b"", 0xFFF)
+    entry += long_path
+    entry += b"\0" * (8 - len(entry) % 8)
+    data = struct.pack(">4sII", b"DIRC", 2, 2) + entry + entry
+
+    with tempfile.TemporaryDirectory() as d:
+        index_path = pathlib.Path(d) / "index"
+        index_path.write_bytes(data)
+        assert (
+            git_utils.read_index(index_path)
+            == (git_utils.IndexEntry("x" * 5000, 0o100644, 3, 1_000_000_002),) * 2
+        )
+
+
+def test_read_invalid_index() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        index_path = pathlib.Path(d) / "index"
+        index_path.write_bytes(b"")
+        assert git_utils.read_index(index_path) == ()
+
+        index_path.write_bytes(b"XXXX\x00\x00\x00\x02\x00\x00\x00\x00")
+        with pytest.raises(git_utils.InvalidGitIndexError):
+            git_utils.read_index(index_path)
+
+        index_path.write_bytes(b"DIRC\x00\x00\x00\x02\x00\x00\x00\x01")
+        with pytest.raises(git_utils.InvalidGitIndexError):
+            git_utils.read_index(index_path)
+
+
+def test_check_git_available_worktree() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        tempdir = pathlib.Path(d).resolve()
+        repo = git.Repo.init(tempdir / "main")
+        test_file = tempdir / "main" / "a.py"
+        test_file.touch()
+        repo.index.add([str(test_file)])
+        repo.index.commit("initial commit")
+        repo.git.worktree("add", str(tempdir / "wt"))
+
+        assert git_utils.check_git_available(tempdir / "wt")
+        assert git_utils.check_tracked(tempdir / "wt" / "a.py")
+        git_utils.list_indexed_files.cache_clear()
+        assert list(git_utils.list_indexed_files(tempdir / "wt")) == [
+            tempdir / "wt" / "a.py"
+        ]
+        git_utils.list_indexed_files.cache_clear()
+
+
+def test_check_tracked_files() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        tempdir = pathlib.Path(d).resolve()
+        outside_file = tempdir / "outside"
+        outside_file.touch()
+
+        repo = git.Repo.init(tempdir / "repo")
+        tracked = [tempdir / "repo" / "a", tempdir / "repo" / "foo" / "b"]
+        untracked = [tempdir / "repo" / "c", tempdir / "repo" / "foo" / "d"]
+        (tempdir / "repo" / "foo").mkdir()
+        for f in tracked + untracked:
+            f.touch()
+        repo.index.add([str(f) for f in tracked])
+
+        assert git_utils.check_tracked_files(tracked + untracked + [outside_file]) == (
+            set(tracked),
+            {outside_file},
+        )
+        assert git_utils.check_tracked_files([]) == (set(), set())
+
+
+def _init_repository(tempdir: pathlib.Path, paths: Sequence[str]) -> git.Repo:
+    repo = git.Repo.init(tempdir)
+    for p in paths:
+        (tempdir / p).parent.mkdir(parents=True, exist_ok=True)
+        (tempdir / p).write_text(p)
+    repo.git.add(*paths)
+    return repo
+
+
+def test_split_index() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        tempdir = pathlib.Path(d).resolve()
+        paths = ["a.py", "foo/bar.py", "foo/baz.py"]
+        repo = _init_repository(tempdir, paths)
+        repo.git.update_index("--split-index")
+        (tempdir / "foo" / "new.py").touch()
+        repo.git.add("foo/new.py")
+
+        with pytest.raises(git_utils.UnsupportedGitIndexError):
+            git_utils.read_index(tempdir / ".git" / "index")
+
+        # entries in the shared index are listed by git ls-files
+        git_utils.list_indexed_files.cache_clear()
+        assert set(git_utils.list_indexed_files(tempdir / "foo")) == {
+            tempdir / "foo" / "bar.py",
+            tempdir / "foo" / "baz.py",
+            tempdir / "foo" / "new.py",
+        }
+        assert git_utils.check_tracked(tempdir / "a.py")
+        git_utils.list_indexed_files.cache_clear()
+
+
+def test_sparse_index() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        tempdir = pathlib.Path(d).resolve()
+        repo = _init_repository(tempdir, ["a.py", "foo/bar.py", "baz/c.py"])
+        repo.index.commit("initial commit")
+        repo.git.sparse_checkout("set", "--cone", "--sparse-index", "foo")
+
+        with pytest.raises(git_utils.UnsupportedGitIndexError):
+            git_utils.read_index(tempdir / ".git" / "index")
+
+        git_utils.list_indexed_files.cache_clear()
+        assert set(git_utils.list_indexed_files(tempdir)) == {
+            tempdir / "a.py",
+            tempdir / "foo" / "bar.py",
+        }
+        git_utils.list_indexed_files.cache_clear()
+
+
+def test_git_index_file(monkeypatch: MonkeyPatch) -> None:
+    with tempfile.TemporaryDirectory() as d:
+        tempdir = pathlib.Path(d).resolve()
+        repo = _init_repository(tempdir, ["a.py"])
+        (tempdir / "b.py").touch()
+        monkeypatch.setenv("GIT_INDEX_FILE", str(tempdir / ".git" / "other_index"))
+        repo.git.add("b.py")
+
+        git_utils.list_indexed_files.cache_clear()
+        assert list(git_utils.list_indexed_files(tempdir)) == [tempdir / "b.py"]
+        assert not git_utils.check_tracked(tempdir / "a.py")
+        git_utils.list_indexed_files.cache_clear()
+
+
+def test_corrupt_index() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        tempdir = pathlib.Path(d).resolve()
+        _init_repository(tempdir, ["a.py"])
+        (tempdir / ".git" / "index").write_bytes(
+            b"DIRC\x00\x00\x00\x02\x00\x00\x00\x01"
+        )
+
+        git_utils.list_indexed_files.cache_clear()
+        with pytest.raises(git_utils.InvalidGitIndexError):
+            git_utils.list_indexed_files(tempdir)
+        with pytest.raises(git_utils.InvalidGitIndexError):
+            git_utils.check_tracked(tempdir / "a.py")
+        git_utils.list_indexed_files.cache_clear()
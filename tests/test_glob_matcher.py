@@ -0,0 +1,100 @@
+import pathlib
+import tempfile
+
+import pytest
+
+from pysen.glob_matcher import GlobMatcher, is_supported_pattern
+
+FILES = [
+    "a.py",
+    "b.pyi",
+    ".hidden.py",
+    "foo/c.py",
+    "foo/d.txt",
+    "foo/bar/e.py",
+    "foo/bar/baz/f.template",
+    "foo_2/g.py",
+    "x[1]/h.py",
+    "tests/i_grpc.py",
+    "tests/fakes/j_grpc.py",
+]
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        "*.py",
+        "**/*.py",
+        "**/*.template",
+        "**/*_grpc.py",
+        "foo/*",
+        "foo/**",
+        "foo/**/*.py",
+        "foo/**/baz",
+        "foo*/*.py",
+        "foo/?.py",
+        "[ab].py",
+        "[!a].py",
+        "x[[]1]/*",
+        "foo/bar/",
+        "./foo/c.py",
+        "**",
+        "tests",
+        "missing/*",
+    ],
+)
+def test_glob_matcher(pattern: str) -> None:
+    with tempfile.TemporaryDirectory() as d:
+        base_dir = pathlib.Path(d).resolve()
+        for f in FILES:
+            path = base_dir / f
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch()
+
+        globbed = set(base_dir.glob(pattern))
+        matcher = GlobMatcher(base_dir, [pattern])
+        paths = [base_dir / f for f in FILES]
+        paths.extend({p.parent for p in paths if p.parent != base_dir})
+
+        for path in paths:
+            relpath = matcher.relative(str(path))
+            assert relpath is not None
+            assert matcher.match(relpath, path.is_dir()) == (path in globbed), path
+
+            # NOTE: a path is contained if it or its parent directory is globbed
+            expected = any(p in globbed for p in [path, *path.parents])
+            assert matcher.contains(str(path), path.is_dir()) == expected, path
+
+
+def test_glob_matcher_multiple_patterns() -> None:
+    base_dir = pathlib.Path("/opt/pysen")
+    matcher = GlobMatcher(base_dir, ["**/*_grpc.py", "build/**", "docs"])
+
+    assert matcher.relative("/opt/pysen/a/b.py") == "a/b.py"
+    assert matcher.relative("/opt/pysen_2/a/b.py") is None
+    assert matcher.relative("/opt/pysen") is None
+
+    assert matcher.match("a/b_grpc.py")
+    assert matcher.match("docs")
+    assert not matcher.match("build")
+    assert matcher.match("build", is_dir=True)
+    assert not matcher.match("a/b.py")
+
+    assert matcher.match_parent("build/a.py")
+    assert matcher.match_parent("docs/a/b.md")
+    assert not matcher.match_parent("docs")
+    assert not matcher.match_parent("a/b_grpc.py")
+
+    assert not GlobMatcher(base_dir, []).contains("/opt/pysen/a.py")
+
+
+def test_is_supported_pattern() -> None:
+    assert is_supported_pattern("**/*.py")
+    assert is_supported_pattern("foo/")
+    assert not is_supported_pattern("")
+    assert not is_supported_pattern("/opt/*.py")
+    assert not is_supported_pattern("../*.py")
+    assert not is_supported_pattern("foo**/*.py")
+
+    with pytest.raises(ValueError):
+        GlobMatcher(pathlib.Path("/opt"), ["../*.py"])
@@ -1,3 +1,5 @@
+import pathlib
+import tempfile
 from importlib.metadata import PackageNotFoundError
 from pathlib import Path
 from unittest import mock
@@ -9,6 +11,7 @@ from pysen.exceptions import (
     IncompatibleVersionError,
     UnexpectedErrorFormat,
 )
+from pysen.ext import isort_wrapper
 from pysen.ext.isort_wrapper import (
     IsortSectionName,
     IsortSetting,
@@ -17,6 +20,7 @@ from pysen.ext.isort_wrapper import (
     _parse_file_path,
 )
 from pysen.py_version import VersionRepresentation
+from pysen.reporter import Reporter
 
 
 def test_export() -> None:
@@ -117,3 +121,54 @@ def test__get_isort_version() -> None:
         with mock.patch(distro, side_effect=PackageNotFoundError("req", "requires")):
             get_version()
     assert "Expected isort to be installed" in str(e)
+
+
+def test_run_in_process() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        base_dir = pathlib.Path(d)
+        setting_path = base_dir / "pyproject.toml"
+        setting_path.write_text(
+            "[tool.isort]\nknown_first_party = ['foo']\nline_length = 88\n"
+        )
+        source = base_dir / "foo.py"
+        source.write_text("import sys\nimport foo\nimport os\n\nprint(os, sys)\n")
+        crlf = base_dir / "bar.py"
+        crlf.write_bytes(b"import sys\r\nimport os\r\n")
+
+        # diagnostics are the same as the ones of the isort command
+        expected = Reporter("isort")
+        with expected, mock.patch("os.chdir", side_effect=AssertionError):
+            ret = isort_wrapper.run(
+                expected, base_dir, setting_path, [source, crlf], False
+            )
+            assert ret == 1
+        reporter = Reporter("isort")
+        # the working directory shared by the threads of pysen is never changed
+        with reporter, mock.patch("os.chdir", side_effect=AssertionError):
+            ret = isort_wrapper.run_in_process(
+                reporter, base_dir, setting_path, [source, crlf], False
+            )
+            assert ret == 1
+        assert len(reporter.diagnostics) == 2
+        assert reporter.diagnostics == expected.diagnostics
+
+        reporter = Reporter("isort")
+        with reporter:
+            ret = isort_wrapper.run_in_process(
+                reporter, base_dir, setting_path, [source, crlf], True
+            )
+            assert ret == 0
+        assert reporter.diagnostics == []
+        assert source.read_text() == (
+            "import os\nimport sys\n\nimport foo\n\nprint(os, sys)\n"
+        )
+        assert crlf.read_bytes() == b"import os\r\nimport sys\r\n"
+
+    with mock.patch(
+        "pysen.ext.isort_wrapper._load_isort_api", return_value=None
+    ), mock.patch("pysen.ext.isort_wrapper.run", return_value=0) as run:
+        assert (
+            isort_wrapper.run_in_process(reporter, base_dir, setting_path, [], True)
+            == 0
+        )
+        run.assert_called_once_with(reporter, base_dir, setting_path, [], True, 1)
@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+from typing import List
+from unittest import mock
+
+import pytest
+
+from pysen import jobserver
+from pysen.jobserver import (
+    LocalJobServer,
+    PipeJobServer,
+    get_jobserver,
+    jobserver_scope,
+    parallel_map,
+    parse_jobserver_auth,
+)
+
+
+def test_parse_jobserver_auth() -> None:
+    assert parse_jobserver_auth("") is None
+    assert parse_jobserver_auth("-j4") is None
+    assert parse_jobserver_auth(" -j4 --jobserver-auth=3,4") == ("fds", "3,4")
+    assert parse_jobserver_auth(" -j4 --jobserver-fds=5,6 -j") == ("fds", "5,6")
+    assert parse_jobserver_auth("-j4 --jobserver-auth=fifo:/tmp/GMfifo1") == (
+        "fifo",
+        "/tmp/GMfifo1",
+    )
+    assert parse_jobserver_auth("--jobserver-fds=3,4 --jobserver-auth=5,6") == (
+        "fds",
+        "5,6",
+    )
+
+
+def test_local_jobserver() -> None:
+    server = LocalJobServer(2)
+    assert server.jobs == 2
+    assert server.acquire(0)
+    assert not server.acquire(0)
+    server.release()
+    assert server.acquire(0)
+    server.release()
+
+    server = LocalJobServer(0)
+    assert server.jobs == 1
+    assert not server.acquire(0)
+
+
+def test_pipe_jobserver() -> None:
+    read_fd, write_fd = os.pipe()
+    try:
+        os.write(write_fd, b"+-")
+        server = PipeJobServer(read_fd, write_fd)
+        assert server.acquire(0)
+        assert server.acquire(0)
+        assert not server.acquire(0.01)
+        server.release()
+        server.release()
+        # tokens are written back as is
+        assert os.read(read_fd, 2) == b"-+"
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+
+
+def test_create_client() -> None:
+    assert jobserver._create_client("-j4") is None
+    # closed fds
+    assert jobserver._create_client("--jobserver-auth=1000,1001") is None
+    assert jobserver._create_client("--jobserver-auth=foo") is None
+    assert jobserver._create_client("--jobserver-auth=fifo:/nonexistent") is None
+
+    read_fd, write_fd = os.pipe()
+    try:
+        os.write(write_fd, b"+")
+        client = jobserver._create_client(f"--jobserver-auth={read_fd},{write_fd}")
+        assert isinstance(client, PipeJobServer)
+        assert client.acquire(0.1)
+        assert not client.acquire(0)
+        client.release()
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+
+
+def test_jobserver_scope() -> None:
+    with mock.patch("pysen.jobserver.get_make_jobserver", return_value=None):
+        assert get_jobserver() is None
+        with jobserver_scope(3) as server:
+            assert isinstance(server, LocalJobServer)
+            assert server.jobs == 3
+            assert get_jobserver() is server
+            with jobserver_scope(5) as inner:
+                assert inner is server
+        assert get_jobserver() is None
+
+    make_server = LocalJobServer(2)
+    with mock.patch("pysen.jobserver.get_make_jobserver", return_value=make_server):
+        with jobserver_scope(3) as server:
+            assert server is make_server
+
+
+def test_parallel_map() -> None:
+    with mock.patch("pysen.jobserver.get_make_jobserver", return_value=None):
+        assert parallel_map(lambda x: x * 2, [], 4) == []
+        assert parallel_map(lambda x: x * 2, [1, 2, 3], 1) == [2, 4, 6]
+        assert parallel_map(lambda x: x * 2, list(range(10)), 4) == [
+            x * 2 for x in range(10)
+        ]
+
+        with jobserver_scope(3):
+            lock = threading.Lock()
+            running = 0
+            max_running = 0
+
+            def func(x: int) -> int:
+                nonlocal running, max_running
+                with lock:
+                    running += 1
+                    max_running = max(max_running, running)
+                time.sleep(0.01)
+                with lock:
+                    running -= 1
+                return x
+
+            assert parallel_map(func, list(range(20)), 8) == list(range(20))
+            assert max_running <= 3
+
+            # nested calls share the same budget without deadlocks
+            max_running = 0
+            ret = parallel_map(
+                lambda x: sum(parallel_map(func, [x, x], 2)), list(range(8)), 8
+            )
+            assert ret == [2 * x for x in range(8)]
+            assert max_running <= 3
+
+            # no tokens are leaked
+            server = get_jobserver()
+            assert server is not None
+            assert server.acquire(0) and server.acquire(0)
+            assert not server.acquire(0)
+            server.release()
+            server.release()
+
+
+def test_parallel_map_error() -> None:
+    called: List[int] = []
+
+    def func(x: int) -> int:
+        called.append(x)
+        if x == 0:
+            raise ValueError(x)
+        return x
+
+    with mock.patch("pysen.jobserver.get_make_jobserver", return_value=None):
+        with jobserver_scope(1):
+            with pytest.raises(ValueError):
+                parallel_map(func, list(range(10)), 4)
+            assert called == [0]
@@ -1,7 +1,7 @@
 import logging
 import pathlib
 from tempfile import TemporaryDirectory
-from typing import List, Optional, Set
+from typing import List, Optional, Sequence, Set
 from unittest import mock
 
 from pysen.diagnostic import Diagnostic
@@ -10,6 +10,7 @@ from pysen.lint_command import (
     SingleFileFormatCommandBase,
     SingleFileLintCommandBase,
 )
+from pysen.py_version import VersionRepresentation
 from pysen.reporter import Reporter
 from pysen.source import FilePredicateType, Source
 
@@ -53,6 +54,9 @@ class FakeSource(Source):
         )
         return {base_dir / f for f in files}
 
+    def supports_covered_files(self) -> bool:
+        return False
+
 
 class FakeSingleFileLintCommand(SingleFileLintCommandBase):
     @property
@@ -93,6 +97,34 @@ def test_lint_command_base() -> None:
         assert not command.git_enabled()
 
 
+def test_lint_command_base_covered_files() -> None:
+    with TemporaryDirectory() as t:
+        base_dir = pathlib.Path(t)
+        files = [base_dir / "foo.py", base_dir / "baz.txt", base_dir / "qux.py"]
+        reporter = Reporter("covered_files")
+
+        # sources customizing resolve_files are resolved entirely
+        command = FakeLintCommand(base_dir, FakeSource())
+        with mock.patch.object(Source, "resolve_covered_files") as resolve_covered:
+            assert command._get_covered_files(
+                reporter, files, lambda x: x.suffix == ".py"
+            ) == [base_dir / "foo.py"]
+            resolve_covered.assert_not_called()
+
+        # subclasses that don't customize resolve_files keep the fast path
+        class DerivedSource(Source):
+            pass
+
+        command = FakeLintCommand(base_dir, DerivedSource(includes=["."]))
+        with mock.patch.object(
+            Source, "resolve_files", side_effect=AssertionError
+        ), mock.patch("pysen.git_utils.check_git_available", return_value=False):
+            (base_dir / "foo.py").touch()
+            assert command._get_covered_files(
+                reporter, files, lambda x: x.suffix == ".py"
+            ) == [base_dir / "foo.py"]
+
+
 def test_single_file_lint_command_base() -> None:
     with TemporaryDirectory() as t:
         base_dir = pathlib.Path(t)
@@ -192,3 +224,69 @@ def test_single_file_format_command_base() -> None:
                 assert f.read() == "diff"
             with (base_dir / "bar.pyi").open() as f:
                 assert f.read() == "diff"
+
+
+def test_lint_command_base_run_cached() -> None:
+    with TemporaryDirectory() as d, mock.patch(
+        "pysen.result_cache.get_version", return_value=VersionRepresentation(1, 0)
+    ):
+        temp_dir = pathlib.Path(d)
+        setting_path = temp_dir / "setup.cfg"
+        setting_path.touch()
+        foo = temp_dir / "foo.py"
+        foo.write_text("foo\n")
+        bar = temp_dir / "bar.py"
+        bar.write_text("bar\n")
+        files = [bar, foo]
+
+        called: List[List[pathlib.Path]] = []
+
+        def run(reporter: Reporter, targets: Sequence[pathlib.Path]) -> int:
+            called.append(list(targets))
+            if foo in targets:
+                reporter.report_diagnostics([Diagnostic(foo, message="error")])
+                return 1
+            return 0
+
+        command = FakeLintCommand(temp_dir, Source(), temp_dir / "cache")
+        reporter = Reporter("fake")
+        ret = command._run_cached(
+            reporter, files, lambda x: run(reporter, x), "fake", setting_path
+        )
+        assert ret == 1
+        assert called == [[bar, foo]]
+        assert len(reporter.diagnostics) == 1
+
+        # only foo is cached since the command failed
+        reporter = Reporter("fake")
+        ret = command._run_cached(
+            reporter, files, lambda x: run(reporter, x), "fake", setting_path
+        )
+        assert ret == 1
+        assert called[-1] == [bar]
+        assert reporter.diagnostics == [Diagnostic(foo, message="error")]
+
+        # every file is cached
+        called.clear()
+        reporter = Reporter("fake")
+        ret = command._run_cached(
+            reporter, files, lambda x: run(reporter, x), "fake", setting_path
+        )
+        assert ret == 1
+        assert called == []
+        assert reporter.diagnostics == [Diagnostic(foo, message="error")]
+
+        # files with cached diagnostics must be formatted in inplace_edit mode
+        reporter = Reporter("fake")
+        ret = command._run_cached(
+            reporter, files, lambda x: run(reporter, x), "fake", setting_path, True
+        )
+        assert called == [[foo]]
+
+        # cache is disabled
+        called.clear()
+        command = FakeLintCommand(temp_dir, Source())
+        ret = command._run_cached(
+            reporter, files, lambda x: run(reporter, x), "fake", setting_path
+        )
+        assert called == [files]
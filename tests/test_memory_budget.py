@@ -0,0 +1,138 @@
+import contextvars
+import json
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+from typing import List
+
+from pysen import process_utils
+from pysen.memory_budget import (
+    MemoryBudget,
+    MemoryFootprints,
+    PeakMemory,
+    record_peak_rss,
+    track_peak_memory,
+)
+from pysen.reporter import Reporter
+
+
+def test_memory_budget() -> None:
+    budget = MemoryBudget(10)
+    assert budget.limit == 10
+
+    with budget.reserve(6):
+        assert budget.used == 6
+        with budget.reserve(4):
+            assert budget.used == 10
+    assert budget.used == 0
+
+    # a command larger than the budget runs alone
+    with budget.reserve(20):
+        assert budget.used == 20
+    assert budget.used == 0
+
+
+def test_memory_budget_wait() -> None:
+    budget = MemoryBudget(10)
+    events: List[str] = []
+    started = threading.Event()
+
+    def run() -> None:
+        started.set()
+        with budget.reserve(6):
+            events.append("second")
+
+    with budget.reserve(6):
+        t = threading.Thread(target=run)
+        t.start()
+        started.wait()
+        time.sleep(0.05)
+        events.append("first")
+    t.join()
+
+    assert events == ["first", "second"]
+    assert budget.used == 0
+
+
+def test_peak_memory() -> None:
+    peak = PeakMemory()
+    assert peak.value is None
+    peak.add(0.0, 1.0, 10)
+    # subprocesses running one after another don't add up
+    peak.add(1.0, 2.0, 20)
+    assert peak.value == 20
+    # overlapping subprocesses add up
+    peak.add(1.5, 3.0, 5)
+    peak.add(2.5, 4.0, 15)
+    assert peak.value == 25
+
+
+def test_track_peak_memory() -> None:
+    # no-op outside of the context
+    record_peak_rss(1, time.monotonic())
+
+    with track_peak_memory() as peak:
+        record_peak_rss(2, time.monotonic())
+        record_peak_rss(1, time.monotonic())
+        value = peak.value
+        assert value is not None
+        assert value in (2, 2048)
+
+    reporter = Reporter("peak_memory")
+    cmd = [sys.executable, "-c", "import time; x = bytearray(64 << 20); time.sleep(1)"]
+    with track_peak_memory() as peak:
+        ret, _, _ = process_utils.run(cmd, reporter)
+        assert ret == 0
+        value = peak.value
+        assert value is not None
+        assert 64 << 20 <= value < 128 << 20
+
+    # the peaks of concurrent subprocesses (e.g., shards) add up
+    with track_peak_memory() as peak:
+        threads = [
+            threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(process_utils.run, cmd, reporter),
+            )
+            for _ in range(2)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        value = peak.value
+        assert value is not None
+        assert value >= 128 << 20
+
+
+def test_memory_footprints() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        cache_dir = pathlib.Path(d) / "cache"
+        footprints = MemoryFootprints.create(cache_dir)
+        assert footprints.get("mypy") is None
+        # nothing is written unless updated
+        footprints.save()
+        assert not cache_dir.exists()
+
+        footprints.update("mypy", 3 << 30)
+        assert footprints.get("mypy") == 3 << 30
+        footprints.save()
+
+        footprints = MemoryFootprints.create(cache_dir)
+        assert footprints.get("mypy") == 3 << 30
+        assert footprints.get("flake8") is None
+
+        # a smaller peak (e.g., of a run skipping cached files) decays the footprint
+        footprints.update("mypy", 1 << 20)
+        assert footprints.get("mypy") == int((3 << 30) * 0.9)
+        footprints.update("mypy", 4 << 30)
+        assert footprints.get("mypy") == 4 << 30
+
+        path = cache_dir / "memory.json"
+        path.write_text(json.dumps({"version": 0, "entries": {"mypy": 1}}))
+        assert MemoryFootprints.create(cache_dir).get("mypy") is None
+
+        path.write_text("{")
+        assert MemoryFootprints.create(cache_dir).get("mypy") is None
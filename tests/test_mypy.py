@@ -1,13 +1,15 @@
 import collections
 import pathlib
-from typing import DefaultDict, Iterator
+import threading
+from typing import Any, DefaultDict, Iterator, Sequence, Tuple
 from unittest import mock
 
 import pytest
 
-from pysen import mypy
+from pysen import jobserver, mypy
 from pysen.mypy import _get_differences_from_base
 from pysen.process_utils import add_python_executable
+from pysen.py_version import PythonVersion
 from pysen.reporter import Reporter
 from pysen.runner_options import PathContext, RunOptions
 from pysen.setting import SettingFile
@@ -95,6 +97,8 @@ def test_commands(reporter: Reporter) -> None:
         "--no-color-output",
         "--show-column-numbers",
         "--no-error-summary",
+        "--cache-dir",
+        "/foo/.mypy_cache",
         "--config-file",
         "/setting/setup.cfg",
         "/bar",
@@ -106,10 +110,9 @@ def test_commands(reporter: Reporter) -> None:
         RunOptions(),
     )
 
-    with mock.patch("os.chdir", return_value=None):
-        with mock.patch("pysen.process_utils.run", return_value=(0, "", "")) as patch:
-            assert cmd(reporter=reporter) == 0
-            patch.assert_called_with(expected_cmds, reporter)
+    with mock.patch("pysen.process_utils.run", return_value=(0, "", "")) as patch:
+        assert cmd(reporter=reporter) == 0
+        patch.assert_called_with(expected_cmds, reporter, cwd=pathlib.Path("/foo"))
 
 
 def test_export_settings() -> None:
@@ -156,3 +159,199 @@ def test_export_settings() -> None:
     }
 
     assert setting_file.as_dict() == expected
+
+
+def test_commands_daemon(reporter: Reporter) -> None:
+    target = mypy.MypyTarget([pathlib.Path("/foo/bar")])
+    m = mypy.Mypy(mypy_targets=[target], daemon=True)
+    assert m.daemon
+    paths = PathContext(pathlib.Path("/foo"), pathlib.Path("/setting"))
+    cmd = m.create_command("lint", paths, RunOptions(cache_dir=pathlib.Path("/cache")))
+    assert isinstance(cmd, mypy.MypyCommand)
+    assert cmd.daemon
+
+    with mock.patch(
+        "pysen.ext.mypy_wrapper.run_daemon", return_value=0
+    ) as run_daemon, mock.patch("pysen.ext.mypy_wrapper.run") as run:
+        assert cmd(reporter=reporter) == 0
+        run_daemon.assert_called_with(
+            reporter,
+            pathlib.Path("/foo"),
+            pathlib.Path("/setting/setup.cfg"),
+            target,
+            True,
+            pathlib.Path("/cache/dmypy"),
+            None,
+            mypy.MypyCacheSetting(pathlib.Path("/cache/mypy")),
+            False,
+            None,
+        )
+
+        # the daemon checks the whole target and reports only the given files
+        assert cmd.run_files(reporter, [pathlib.Path("/foo/bar/a.py")]) == 0
+        assert run_daemon.call_args[0][3] == target
+        assert run_daemon.call_args[0][6] == {pathlib.Path("/foo/bar/a.py")}
+
+        run_daemon.reset_mock()
+        assert cmd.run_files(reporter, [pathlib.Path("/foo/baz.py")]) == 0
+        run_daemon.assert_not_called()
+        run.assert_not_called()
+
+
+def test_commands_parallel_targets(reporter: Reporter) -> None:
+    targets = [
+        mypy.MypyTarget([pathlib.Path("/foo/a")]),
+        mypy.MypyTarget([pathlib.Path("/foo/b")], namespace_packages=True),
+    ]
+    m = mypy.Mypy(mypy_targets=targets)
+    paths = PathContext(pathlib.Path("/foo"), pathlib.Path("/setting"))
+    cmd = m.create_command("lint", paths, RunOptions())
+    assert cmd.expected_memory == 2 * mypy._ExpectedMemory
+
+    started = threading.Barrier(2, timeout=5)
+
+    def fake_run(
+        cmd: Sequence[str], reporter: Reporter, *args: Any, **kwargs: Any
+    ) -> Tuple[int, str, str]:
+        # both targets must be running at the same time
+        started.wait()
+        if "/foo/a" in cmd:
+            return 0, "", ""
+        return 1, "/foo/b/x.py:1:1: error: foo\n", ""
+
+    with jobserver.jobserver_scope(2), mock.patch(
+        "pysen.process_utils.run", side_effect=fake_run
+    ) as run:
+        assert cmd(reporter=reporter) == 1
+
+    cache_dirs = set()
+    for call in run.call_args_list:
+        args = list(call[0][0])
+        # outputs are logged after each process finishes
+        assert call[0][2:] == (None, None)
+        # the processes run in the base directory without changing that of pysen
+        assert call[1] == {"cwd": pathlib.Path("/foo")}
+        cache_dirs.add(args[args.index("--cache-dir") + 1])
+    assert len(cache_dirs) == 2
+    assert all(
+        pathlib.Path(d).parent == pathlib.Path("/foo/.mypy_cache") for d in cache_dirs
+    )
+    assert len(reporter.diagnostics) == 1
+    assert reporter.diagnostics[0].file_path == pathlib.Path("/foo/b/x.py")
+
+    cmd = m.create_command("lint", paths, RunOptions(cache_dir=pathlib.Path("/cache")))
+    assert isinstance(cmd, mypy.MypyCommand)
+    cache = cmd._get_target_cache(targets[0])
+    assert cache.cache_dir.parent == pathlib.Path("/cache/mypy")
+
+
+def test_commands_py_versions(reporter: Reporter) -> None:
+    target = mypy.MypyTarget([pathlib.Path("/foo/a")])
+    py_versions = [PythonVersion(3, 8), PythonVersion(3, 10)]
+    m = mypy.Mypy(
+        mypy_targets=[target],
+        setting=mypy.MypySetting(python_version=PythonVersion(3, 8)),
+        module_settings={"foo.*": mypy.MypySetting(ignore_errors=True)},
+        py_versions=py_versions,
+    )
+    assert m.py_versions == py_versions
+
+    files: DefaultDict[str, SettingFile] = collections.defaultdict(SettingFile)
+    m.export_settings(PathContext(BASE_DIR, BASE_DIR), files)
+    assert files.keys() == {"setup.cfg", "mypy_py38.cfg", "mypy_py310.cfg"}
+    assert files["setup.cfg"].as_dict() == files["mypy_py38.cfg"].as_dict()
+    assert files["mypy_py310.cfg"].as_dict() == {
+        "mypy": {"python_version": "3.10"},
+        "mypy-foo.*": {"ignore_errors": True},
+    }
+
+    paths = PathContext(pathlib.Path("/foo"), pathlib.Path("/setting"))
+    cmd = m.create_command("lint", paths, RunOptions())
+    assert isinstance(cmd, mypy.MypyCommand)
+    assert cmd.expected_memory == 2 * mypy._ExpectedMemory
+
+    started = threading.Barrier(2, timeout=5)
+
+    def fake_run(
+        cmd: Sequence[str], reporter: Reporter, *args: Any, **kwargs: Any
+    ) -> Tuple[int, str, str]:
+        # all the versions must be running at the same time
+        started.wait()
+        if "/setting/mypy_py38.cfg" in cmd:
+            return 0, "", ""
+        return 1, "/foo/a/x.py:1:1: error: foo\n", ""
+
+    with jobserver.jobserver_scope(2), mock.patch(
+        "pysen.process_utils.run", side_effect=fake_run
+    ) as run:
+        assert cmd(reporter=reporter) == 1
+
+    cache_dirs = set()
+    for call in run.call_args_list:
+        args = list(call[0][0])
+        cache_dirs.add(args[args.index("--cache-dir") + 1])
+    assert cache_dirs == {"/foo/.mypy_cache/py38", "/foo/.mypy_cache/py310"}
+    # diagnostics are tagged with the version that produced them
+    assert len(reporter.diagnostics) == 1
+    assert reporter.diagnostics[0].message == "[py310] error: foo"
+
+    # a single version is neither tagged nor checked with `setup.cfg`
+    m = mypy.Mypy(mypy_targets=[target], py_versions=[PythonVersion(3, 10)])
+    cmd = m.create_command("lint", paths, RunOptions())
+    with mock.patch("pysen.ext.mypy_wrapper.run", return_value=0) as run:
+        assert cmd.run_files(reporter, [pathlib.Path("/foo/a/x.py")]) == 0
+        run.assert_called_once_with(
+            reporter,
+            pathlib.Path("/foo"),
+            pathlib.Path("/setting/mypy_py310.cfg"),
+            mypy.MypyTarget([pathlib.Path("/foo/a/x.py")]),
+            True,
+            mypy.MypyCacheSetting(pathlib.Path("/foo/.mypy_cache/py310")),
+            False,
+            None,
+        )
+
+
+def test_mypy_cache(reporter: Reporter) -> None:
+    m = mypy.Mypy(mypy_targets=[mypy.MypyTarget([pathlib.Path("/foo/a")])])
+    paths = PathContext(pathlib.Path("/foo"), pathlib.Path("/setting"))
+
+    def create(options: RunOptions) -> mypy.MypyCacheSetting:
+        cmd = m.create_command("lint", paths, options)
+        assert isinstance(cmd, mypy.MypyCommand)
+        return cmd.mypy_cache
+
+    assert create(RunOptions()) == mypy.MypyCacheSetting(
+        pathlib.Path("/foo/.mypy_cache")
+    )
+    assert create(RunOptions(cache_dir=pathlib.Path("/cache"))) == (
+        mypy.MypyCacheSetting(pathlib.Path("/cache/mypy"))
+    )
+    assert create(
+        RunOptions(
+            cache_dir=pathlib.Path("/cache"),
+            mypy_cache_dir=pathlib.Path("/mypy_cache"),
+            mypy_sqlite_cache=True,
+            mypy_fine_grained_cache=True,
+        )
+    ) == mypy.MypyCacheSetting(pathlib.Path("/mypy_cache"), True, True)
+
+    cmd = m.create_command("lint", paths, RunOptions())
+    snapshots = [{}, {"a": 1.0, "b": 1.0}]
+    with mock.patch("pysen.process_utils.run", return_value=(0, "", "")), mock.patch(
+        "pysen.ext.mypy_wrapper.snapshot_cache", side_effect=snapshots
+    ):
+        assert cmd(reporter) == 0
+    assert reporter.statistics == ["cache: 0 hits, 2 misses"]
+
+    # the cache of the python version of the setting is inspected
+    m = mypy.Mypy(
+        mypy_targets=[mypy.MypyTarget([pathlib.Path("/foo/a")])],
+        setting=mypy.MypySetting(python_version=PythonVersion(3, 8)),
+    )
+    cmd = m.create_command("lint", paths, RunOptions())
+    with mock.patch("pysen.process_utils.run", return_value=(0, "", "")), mock.patch(
+        "pysen.ext.mypy_wrapper.snapshot_cache", return_value={}
+    ) as snapshot:
+        assert cmd(reporter) == 0
+    snapshot.assert_called_with(pathlib.Path("/foo/.mypy_cache"), PythonVersion(3, 8))
@@ -1,8 +1,25 @@
 import pathlib
+import sys
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple
+from unittest import mock
 
 import pytest
 
-from pysen.ext.mypy_wrapper import MypyPlugin, MypyTarget, run
+from pysen import process_utils
+from pysen.ext.mypy_wrapper import (
+    MypyCacheSetting,
+    MypyCacheStatistics,
+    MypyPlugin,
+    MypyTarget,
+    get_daemon_dir,
+    get_daemon_state_dir,
+    run,
+    run_daemon,
+    snapshot_cache,
+)
+from pysen.process_utils import add_python_executable
+from pysen.py_version import PythonVersion
 from pysen.reporter import Reporter
 
 BASE_DIR = pathlib.Path(__file__).resolve().parent
@@ -39,3 +56,168 @@ def test_mypy_plugin() -> None:
     base_dir = pathlib.Path("/hoge")
     assert script_plugin.as_config(base_dir) == "../foo/bar/baz"
     assert script_plugin2.as_config(base_dir) == "bar/baz"
+
+
+def test_run_argument_file() -> None:
+    reporter = Reporter("mypy")
+    target = MypyTarget([BASE_DIR / "foo.py", BASE_DIR / "bar.py"])
+    commands: List[List[str]] = []
+
+    def fake_run(
+        cmd: Sequence[str], reporter: Reporter, cwd: Optional[pathlib.Path] = None
+    ) -> Tuple[int, str, str]:
+        assert cwd == BASE_DIR
+        commands.append(list(cmd))
+        if cmd[-1].startswith("@"):
+            with open(cmd[-1][1:]) as f:
+                assert f.read() == f"{BASE_DIR / 'foo.py'}\n{BASE_DIR / 'bar.py'}\n"
+        return 0, "", ""
+
+    with mock.patch("pysen.process_utils.run", side_effect=fake_run):
+        assert run(reporter, BASE_DIR, BASE_DIR / "setup.cfg", target, True) == 0
+        assert commands[-1][-2:] == [str(BASE_DIR / "foo.py"), str(BASE_DIR / "bar.py")]
+
+        with mock.patch("pysen.process_utils.fits_command_line", return_value=False):
+            assert run(reporter, BASE_DIR, BASE_DIR / "setup.cfg", target, True) == 0
+            assert commands[-1][-1].startswith("@")
+
+
+def test_get_daemon_dir() -> None:
+    state_dir = pathlib.Path("/state")
+    target = MypyTarget([BASE_DIR / "foo.py"])
+    daemon_dir = get_daemon_dir(state_dir, BASE_DIR, target, True)
+    assert daemon_dir.parent == state_dir
+    assert daemon_dir == get_daemon_dir(state_dir, BASE_DIR, target, True)
+    assert daemon_dir != get_daemon_dir(state_dir, BASE_DIR, target, False)
+    assert daemon_dir != get_daemon_dir(state_dir, BASE_DIR.parent, target, True)
+    assert daemon_dir != get_daemon_dir(
+        state_dir, BASE_DIR, MypyTarget([BASE_DIR / "foo.py"], True), True
+    )
+
+    assert get_daemon_state_dir(pathlib.Path("/cache")) == pathlib.Path("/cache/dmypy")
+    assert get_daemon_state_dir(None).name.startswith("pysen-dmypy-")
+
+
+def test_run_daemon() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        base_dir = pathlib.Path(d)
+        state_dir = base_dir / "state"
+        setting_path = base_dir / "setup.cfg"
+        setting_path.write_text("[mypy]\n")
+        error = base_dir / "error.py"
+        error.write_text('x: int = "a"\n')
+        ok = base_dir / "ok.py"
+        ok.write_text("x: int = 1\n")
+        target = MypyTarget([error, ok])
+        daemon_dir = get_daemon_dir(state_dir, base_dir, target, True)
+        dmypy = add_python_executable(
+            "mypy.dmypy", "--status-file", str(daemon_dir / "status.json")
+        )
+
+        try:
+            reporter = Reporter("dmypy")
+            assert (
+                run_daemon(reporter, base_dir, setting_path, target, True, state_dir)
+                == 1
+            )
+            assert len(reporter.diagnostics) == 1
+            assert reporter.diagnostics[0].file_path == error
+            assert (daemon_dir / "setup.cfg").read_text() == "[mypy]\n"
+
+            # only the diagnostics of the given files are reported
+            reporter = Reporter("dmypy")
+            assert (
+                run_daemon(
+                    reporter, base_dir, setting_path, target, True, state_dir, {ok}
+                )
+                == 0
+            )
+            assert reporter.diagnostics == []
+
+            # the daemon restarts when the setting changes
+            setting_path.write_text("[mypy]\nignore_errors = True\n")
+            reporter = Reporter("dmypy")
+            with mock.patch(
+                "pysen.process_utils.run", side_effect=process_utils.run
+            ) as run:
+                assert (
+                    run_daemon(
+                        reporter, base_dir, setting_path, target, True, state_dir
+                    )
+                    == 0
+                )
+                assert run.call_args_list[0][0][0] == [*dmypy, "kill"]
+            assert reporter.diagnostics == []
+            assert "ignore_errors" in (daemon_dir / "setup.cfg").read_text()
+        finally:
+            process_utils.run([*dmypy, "kill"], Reporter("dmypy"), None, None)
+
+
+def test_mypy_cache_setting() -> None:
+    cache_dir = pathlib.Path("/cache")
+    assert MypyCacheSetting(cache_dir).as_options() == ["--cache-dir", "/cache"]
+    assert MypyCacheSetting(cache_dir, True, True).as_options() == [
+        "--cache-dir",
+        "/cache",
+        "--sqlite-cache",
+        "--cache-fine-grained",
+    ]
+
+
+def test_mypy_cache_statistics() -> None:
+    before = {"a": 1.0, "b": 1.0, "c": 1.0}
+    after = {"a": 1.0, "b": 2.0, "d": 1.0}
+    stats = MypyCacheStatistics.compare(before, after)
+    assert stats == MypyCacheStatistics(hits=1, misses=2)
+    assert stats + MypyCacheStatistics(1, 1) == MypyCacheStatistics(2, 3)
+
+
+def test_snapshot_cache_version_dir() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        cache_dir = pathlib.Path(d)
+        current = "{}.{}".format(*sys.version_info[:2])
+        files = [
+            f"{current}/foo/a.meta.json",
+            "3.7/b.meta.json",
+            f"pysen-0123456789abcdef/{current}/c.meta.json",
+            "py38/3.8/d.meta.json",
+        ]
+        for f in files:
+            (cache_dir / f).parent.mkdir(parents=True, exist_ok=True)
+            (cache_dir / f).write_text("{}")
+
+        # caches of other python versions, targets or projects are not counted
+        assert list(snapshot_cache(cache_dir)) == [str(cache_dir / files[0])]
+        assert list(snapshot_cache(cache_dir, PythonVersion(3, 7))) == [
+            str(cache_dir / files[1])
+        ]
+        assert snapshot_cache(cache_dir, PythonVersion(3, 6)) == {}
+
+
+@pytest.mark.parametrize("sqlite", [False, True])
+def test_snapshot_cache(sqlite: bool) -> None:
+    with tempfile.TemporaryDirectory() as d:
+        base_dir = pathlib.Path(d)
+        (base_dir / "foo.py").write_text("import bar\n")
+        (base_dir / "bar.py").write_text("x = 1\n")
+        (base_dir / "setup.cfg").write_text("[mypy]\n")
+        cache = MypyCacheSetting(base_dir / "cache", sqlite=sqlite)
+        assert snapshot_cache(cache.cache_dir) == {}
+
+        def check() -> Dict[str, float]:
+            reporter = Reporter("mypy_cache")
+            target = MypyTarget([base_dir / "foo.py"])
+            ret = run(reporter, base_dir, base_dir / "setup.cfg", target, True, cache)
+            assert ret == 0
+            return snapshot_cache(cache.cache_dir)
+
+        first = check()
+        assert any(k.endswith("bar.meta.json") for k in first)
+        assert not any("@" in k for k in first)
+        second = check()
+        assert MypyCacheStatistics.compare(first, second).misses == 0
+
+        (base_dir / "bar.py").write_text("x = 2\n")
+        third = check()
+        stats = MypyCacheStatistics.compare(second, third)
+        assert stats.misses >= 1 and stats.hits > 0
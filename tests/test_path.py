@@ -1,6 +1,15 @@
 import pathlib
 
-from pysen.path import change_dir, get_relative_path, is_contained, is_covered
+import pytest
+
+from pysen.path import (
+    PathPrefixTrie,
+    change_dir,
+    get_relative_path,
+    is_contained,
+    is_covered,
+    is_covered_resolved,
+)
 
 BASE_DIR = pathlib.Path(__file__).resolve().parent
 
@@ -49,6 +58,17 @@ def test_is_covered() -> None:
     assert not is_covered(hoge, [hoge / "subdir"])
 
 
+def test_is_covered_resolved() -> None:
+    hoge = pathlib.Path("/hoge")
+    bar = pathlib.Path("/bar")
+    assert is_covered_resolved(hoge, {hoge})
+    assert is_covered_resolved(hoge / "foo" / "bar", {hoge, bar})
+
+    assert not is_covered_resolved(hoge, set())
+    assert not is_covered_resolved(hoge, {hoge / "subdir"})
+    assert not is_covered_resolved(pathlib.Path("/hoge_2"), {hoge})
+
+
 def test_is_contained() -> None:
     foo = pathlib.Path("foo").resolve()
     bar = pathlib.Path("bar")
@@ -63,3 +83,38 @@ def test_is_contained() -> None:
 
     # user expansion not supported
     assert not is_contained(ufoo, ufooo)
+
+
+def test_path_prefix_trie() -> None:
+    parents = [
+        pathlib.Path("/opt/foo"),
+        pathlib.Path("/opt/bar/baz"),
+        pathlib.Path("/home/user/.venv"),
+    ]
+    children = [
+        pathlib.Path("/opt"),
+        pathlib.Path("/opt/foo"),
+        pathlib.Path("/opt/foo/a.py"),
+        pathlib.Path("/opt/foo_2/a.py"),
+        pathlib.Path("/opt/fo/a.py"),
+        pathlib.Path("/opt/bar/a.py"),
+        pathlib.Path("/opt/bar/baz/a.py"),
+        pathlib.Path("/home/user/.venv/lib/a.py"),
+        pathlib.Path("/home/user/a.py"),
+        pathlib.Path("/"),
+    ]
+
+    trie = PathPrefixTrie(parents)
+    for child in children:
+        # NOTE: the result must be consistent with is_contained
+        expected = any(is_contained(p, child) for p in parents)
+        assert trie.is_contained(child) == expected
+        assert trie.is_contained(str(child)) == expected
+
+    assert not PathPrefixTrie().is_contained(pathlib.Path("/opt"))
+    assert PathPrefixTrie([pathlib.Path("/")]).is_contained(pathlib.Path("/opt/a"))
+
+    with pytest.raises(ValueError):
+        trie.add(pathlib.Path("foo"))
+    with pytest.raises(ValueError):
+        trie.is_contained(pathlib.Path("foo"))
@@ -0,0 +1,121 @@
+import pathlib
+import sys
+import tempfile
+import unittest.mock
+
+import pytest
+
+from pysen.command import check_command_installed
+from pysen.dist_version import get_version
+from pysen.exceptions import CommandNotFoundError, DistributionNotFound
+from pysen.probe_cache import (
+    ProbeCache,
+    get_environment_key,
+    get_probe_cache,
+    probe_scope,
+)
+from pysen.py_version import VersionRepresentation
+
+
+def test_environment_key() -> None:
+    key = get_environment_key()
+    assert key == get_environment_key()
+
+    with tempfile.TemporaryDirectory() as td:
+        temp_dir = pathlib.Path(td)
+        with unittest.mock.patch("sys.path", sys.path + [td]):
+            assert get_environment_key() == key
+            # installing a distribution changes the key
+            (temp_dir / "foo-1.0.dist-info").mkdir()
+            installed = get_environment_key()
+            assert installed != key
+            (temp_dir / "foo.py").touch()
+            assert get_environment_key() == installed
+
+
+def test_probe_cache() -> None:
+    cmd = [sys.executable, "-m", "foo", "--version"]
+    with tempfile.TemporaryDirectory() as td:
+        path = pathlib.Path(td) / "cache" / "probes.json"
+        cache = ProbeCache(path, "key")
+        assert not cache.loaded
+        assert not cache.is_installed(cmd)
+        assert cache.get_version("foo") is None
+        cache.set_installed(cmd)
+        cache.set_version("foo", "1.2.3")
+        cache.save()
+
+        cache = ProbeCache(path, "key")
+        assert cache.loaded
+        assert cache.is_installed(cmd)
+        assert not cache.is_installed(cmd[:-1])
+        assert cache.get_version("foo") == "1.2.3"
+
+        # results of another environment are discarded
+        cache = ProbeCache(path, "other")
+        assert not cache.loaded
+        assert not cache.is_installed(cmd)
+        assert cache.get_version("foo") is None
+
+        path.write_text("{")
+        cache = ProbeCache(path, "key")
+        assert not cache.loaded
+
+
+def test_probe_scope() -> None:
+    assert get_probe_cache() is None
+    with probe_scope(None) as cache:
+        assert cache is None
+        assert get_probe_cache() is None
+
+    with tempfile.TemporaryDirectory() as td:
+        cache_dir = pathlib.Path(td)
+        with probe_scope(cache_dir) as cache:
+            assert cache is not None
+            assert get_probe_cache() is cache
+            assert not cache.loaded
+            cache.set_version("foo", "1.0")
+        assert get_probe_cache() is None
+
+        with probe_scope(cache_dir) as cache:
+            assert cache is not None
+            assert cache.loaded
+            assert get_version("foo") == VersionRepresentation(1, 0)
+
+
+def test_get_version() -> None:
+    with tempfile.TemporaryDirectory() as td:
+        with probe_scope(pathlib.Path(td)) as cache:
+            assert cache is not None
+            version = get_version("pytest")
+            assert cache.get_version("pytest") == str(version)
+
+            with unittest.mock.patch("pysen.dist_version._get_distro") as get_distro:
+                assert get_version("pytest") == version
+                get_distro.assert_not_called()
+
+            with pytest.raises(DistributionNotFound):
+                get_version("this_distribution_does_not_exist")
+
+
+def test_check_command_installed() -> None:
+    cmd = [sys.executable, "-m", "pytest", "--version"]
+    with tempfile.TemporaryDirectory() as td:
+        with probe_scope(pathlib.Path(td)) as cache:
+            assert cache is not None
+            with unittest.mock.patch("subprocess.call", return_value=0) as call:
+                check_command_installed(*cmd)
+                check_command_installed(*cmd)
+                assert call.call_count == 1
+                assert cache.is_installed(cmd)
+
+                # commands found in PATH are not cached
+                check_command_installed("echo", "a")
+                check_command_installed("echo", "a")
+                assert call.call_count == 3
+                assert not cache.is_installed(["echo", "a"])
+
+            with unittest.mock.patch("subprocess.call", return_value=127):
+                with pytest.raises(CommandNotFoundError):
+                    check_command_installed(sys.executable, "-m", "foo")
+            assert not cache.is_installed([sys.executable, "-m", "foo"])
@@ -1,14 +1,31 @@
-import io
 import logging
 import os
 import pathlib
 import sys
 import tempfile
-from typing import List
+import threading
+import time
+from typing import Any, Callable, List, Tuple, cast
 
 import pytest
 
-from pysen.process_utils import _read_stream, run
+from pysen import process_utils
+from pysen.cancellation import cancellation_scope
+from pysen.deadline import deadline_scope
+from pysen.exceptions import CommandCancelledError, CommandTimeoutError
+from pysen.memory_budget import track_peak_memory
+from pysen.process_utils import (
+    _OutputReader,
+    argument_file,
+    chunk_arguments,
+    fits_command_line,
+    get_command_line_limit,
+    map_sharded,
+    run,
+    run_chunked,
+    run_sharded,
+    split_shards,
+)
 from pysen.reporter import Reporter
 
 SAMPLE_DATA = """BytesIO example string.
@@ -68,31 +85,55 @@ class FailingHandler(logging.Handler):
     [SAMPLE_DATA, SAMPLE_SCRIPT],
     ids=["sample", "sample_with_trailing_newlines"],
 )
-def test__read_stream(sample_str: str) -> None:
-    # NOTE(igarashi): Since BytesIO does not inherit RawIOBase but BufferedIOBase,
-    # we cannot instantiate BufferedReader from bytes directly.
-    # We use FileIOBase instead.
-    with tempfile.TemporaryDirectory() as td:
-        temp_dir = pathlib.Path(td)
-        temp_path = temp_dir / "file"
-        temp_path.write_text(sample_str)
-
-        reporter = Reporter("foo")
-        handler = FakeHandler()
-        reporter.process_output.setLevel(logging.INFO)
-        reporter.process_output.handlers.clear()
-        reporter.process_output.addHandler(handler)
-
-        ret = _read_stream(io.StringIO(temp_path.read_text()), reporter, logging.INFO)
-        expected = sample_str
-        assert ret == expected
-        assert handler.messages == expected.splitlines()
-
+def test__output_reader(sample_str: str) -> None:
+    reporter = Reporter("foo")
+    handler = FakeHandler()
+    reporter.process_output.setLevel(logging.INFO)
+    reporter.process_output.handlers.clear()
+    reporter.process_output.addHandler(handler)
+
+    data = sample_str.encode()
+    for loglevel in (logging.INFO, logging.DEBUG, None):
         handler.messages.clear()
-        ret = _read_stream(io.StringIO(temp_path.read_text()), reporter, logging.DEBUG)
-
-        assert ret == expected
-        assert handler.messages == []
+        reader = _OutputReader(reporter, "utf-8", loglevel)
+        # lines span several chunks
+        for i in range(0, len(data), 7):
+            reader.feed(data[i : i + 7])
+        reader.feed(b"", final=True)
+
+        assert reader.getvalue() == sample_str
+        assert reader.error is None
+        if loglevel == logging.INFO:
+            assert handler.messages == sample_str.splitlines()
+        else:
+            assert handler.messages == []
+
+
+def test__output_reader_decode() -> None:
+    reporter = Reporter("output_reader")
+    handler = FakeHandler()
+    reporter.process_output.setLevel(logging.INFO)
+    reporter.process_output.handlers.clear()
+    reporter.process_output.addHandler(handler)
+
+    reader = _OutputReader(reporter, "utf-8", logging.INFO)
+    # a character and a CRLF split across chunks
+    data = TEST_UNICODE + b"\r\nfoo\rbar\r"
+    for i in range(len(data)):
+        reader.feed(data[i : i + 1])
+    reader.feed(b"", final=True)
+
+    expected = TEST_UNICODE.decode("utf-8") + "\nfoo\nbar\n"
+    assert reader.getvalue() == expected
+    assert handler.messages == expected.splitlines()
+
+    # logging failures are raised after the whole output is read
+    reporter.process_output.addHandler(FailingHandler())
+    reader = _OutputReader(reporter, "utf-8", logging.INFO)
+    reader.feed(b"foo\nbar\n")
+    reader.feed(b"baz\n", final=True)
+    assert isinstance(reader.error, HandlerException)
+    assert reader.getvalue() == "foo\nbar\nbaz\n"
 
 
 def test_run_encoding() -> None:
@@ -147,6 +188,13 @@ def test_run() -> None:
         assert stderr == ""
         assert len(handler.messages) == 0
 
+        # the process runs in `cwd` while the working directory of pysen is kept
+        cwd = os.getcwd()
+        ret, stdout, stderr = run(["ls"], reporter, cwd=temp_dir)
+        assert ret == 0
+        assert stdout == "file\n"
+        assert os.getcwd() == cwd
+
         handler.messages.clear()
         ret, stdout, stderr = run(["ls", str(temp_dir / "invalid")], reporter)
         assert ret != 0
@@ -181,7 +229,264 @@ def test_run() -> None:
             assert stdout_lines[x + 1] == f"out{x}"
             assert stderr_lines[x + 1] == f"err{x}"
 
-        # exceptions encountered in sub-threads shall be raised
+        # exceptions encountered in the event loop shall be raised
         reporter.process_output.addHandler(FailingHandler())
         with pytest.raises(HandlerException):
             ret, stdout, stderr = run(["echo", "mashimashi"], reporter)
+
+
+def test_chunk_arguments() -> None:
+    cmd = ["cmd", "--option"]
+    args = [f"file{i}.py" for i in range(10)]
+    # each argument takes len(arg) + 1 (NUL) + 8 (pointer) bytes
+    cmd_size = sum(len(x) + 9 for x in cmd)
+
+    assert chunk_arguments(cmd, args, limit=1 << 20) == [args]
+    assert chunk_arguments(cmd, [], limit=1 << 20) == []
+
+    chunks = chunk_arguments(cmd, args, limit=cmd_size + 3 * 17)
+    assert chunks == [args[0:3], args[3:6], args[6:9], args[9:10]]
+
+    # an argument longer than the limit is still passed alone
+    assert chunk_arguments(cmd, ["x" * 100, "y"], limit=cmd_size) == [
+        ["x" * 100],
+        ["y"],
+    ]
+
+    assert fits_command_line(cmd + args, limit=cmd_size + 10 * 17)
+    assert not fits_command_line(cmd + args, limit=cmd_size + 10 * 17 - 1)
+    assert get_command_line_limit() > 0
+
+
+def test_run_chunked() -> None:
+    reporter = Reporter("chunked")
+    args = [str(i) for i in range(20)]
+    script = 'echo "$@"; [ "$1" != "5" ] || exit 3'
+    cmd = ["bash", "-c", script, "bash"]
+    cmd_size = sum(len(x) + 9 for x in cmd)
+
+    ret, stdout, _ = run_chunked(cmd, args, reporter, limit=1 << 20)
+    assert ret == 0
+    assert stdout == " ".join(args) + "\n"
+
+    # NOTE: each argument takes at most 11 bytes, so the arguments are split by 5
+    ret, stdout, _ = run_chunked(cmd, args, reporter, limit=cmd_size + 5 * 11)
+    assert ret == 3
+    assert stdout.splitlines() == [
+        " ".join(args[i : i + 5]) for i in range(0, len(args), 5)
+    ]
+
+
+def test_argument_file() -> None:
+    args = ["foo.py", "bar baz.py"]
+    with argument_file(args) as path:
+        assert path.read_text() == "foo.py\nbar baz.py\n"
+    assert not path.exists()
+
+    with pytest.raises(ValueError):
+        with argument_file(["foo\nbar"]):
+            pass
+
+
+def test_split_shards() -> None:
+    costs = {"a": 10, "b": 7, "c": 5, "d": 4, "e": 3, "f": 1}
+    args = list(costs.keys())
+
+    shards = split_shards(args, 2, costs.__getitem__)
+    assert sorted(sum(costs[x] for x in s) for s in shards) == [15, 15]
+    # each shard keeps the original order
+    assert all(s == sorted(s) for s in shards)
+    assert sorted(x for s in shards for x in s) == args
+
+    assert split_shards(args, 1, costs.__getitem__) == [args]
+    assert len(split_shards(args, 10, costs.__getitem__)) == len(args)
+    assert split_shards([], 4, costs.__getitem__) == []
+
+
+def test_run_sharded() -> None:
+    reporter = Reporter("sharded")
+    handler = FakeHandler()
+    reporter.process_output.addHandler(handler)
+    log_handler = FakeHandler()
+    reporter.logger.addHandler(log_handler)
+    reporter.logger.setLevel(logging.INFO)
+
+    args = [str(i) for i in range(64)]
+    script = 'for x in "$@"; do echo "out$x"; done; [[ " $* " != *" 5 "* ]] || exit 3'
+    cmd = ["bash", "-c", script, "bash"]
+
+    ret, stdout, _ = run_sharded(cmd, args, reporter, jobs=4, cost=lambda x: 1)
+    assert ret == 3
+    assert sorted(stdout.splitlines()) == sorted(f"out{x}" for x in args)
+    assert len(handler.messages) == len(args)
+    assert "Running 4 shards in parallel" in log_handler.messages
+
+    # a small list of arguments is not split
+    ret, stdout, _ = run_sharded(cmd, args[:3], reporter, jobs=4)
+    assert ret == 0
+    assert stdout == "out0\nout1\nout2\n"
+
+
+def test_map_sharded() -> None:
+    reporter = Reporter("sharded")
+    log_handler = FakeHandler()
+    reporter.logger.addHandler(log_handler)
+    reporter.logger.setLevel(logging.INFO)
+
+    # `sorted` is picklable, and sorts each shard in a worker process
+    args = [f"{i:02}" for i in reversed(range(64))]
+    func = cast(Callable[[List[str]], List[str]], sorted)
+    with track_peak_memory() as peak:
+        ret = map_sharded(func, args, reporter, jobs=4, cost=lambda x: 1)
+    assert sorted(ret) == sorted(args)
+    assert ret != sorted(args)
+    assert "Running 4 shards in parallel" in log_handler.messages
+    # the peak memory of the workers is recorded
+    assert peak.value is not None and peak.value > 0
+
+    assert not peak.partial
+
+    # a small list of arguments is processed in the calling thread, which is not
+    # measured
+    with track_peak_memory() as peak:
+        ret = map_sharded(lambda x: x[::-1], args[:3], reporter, jobs=4)
+    assert ret == args[2::-1]
+    assert peak.partial
+
+
+def _sleep_shard(shard: List[str]) -> List[str]:
+    time.sleep(60)
+    return shard
+
+
+def test_map_sharded_stop() -> None:
+    reporter = Reporter("sharded_stop")
+    args = [str(i) for i in range(64)]
+    with deadline_scope(2.0):
+        started = time.monotonic()
+        # the workers are killed when the deadline expires
+        with pytest.raises(CommandTimeoutError):
+            map_sharded(_sleep_shard, args, reporter, jobs=2)
+        assert time.monotonic() - started < 10
+
+        # no shards start after the deadline, even in the calling thread
+        with pytest.raises(CommandTimeoutError):
+            map_sharded(_sleep_shard, args[:1], reporter, jobs=2)
+
+    with cancellation_scope(True) as cancellation:
+        assert cancellation is not None
+        timer = threading.Timer(2.0, cancellation.cancel)
+        timer.start()
+        started = time.monotonic()
+        with pytest.raises(CommandCancelledError):
+            map_sharded(_sleep_shard, args, reporter, jobs=2)
+        timer.join()
+        assert time.monotonic() - started < 10
+
+        with pytest.raises(CommandCancelledError):
+            map_sharded(_sleep_shard, args[:1], reporter, jobs=2)
+
+
+def test_run_cancellation() -> None:
+    reporter = Reporter("cancellation")
+    with cancellation_scope(True) as cancellation:
+        assert cancellation is not None
+        timer = threading.Timer(0.2, cancellation.cancel)
+        timer.start()
+        started = time.monotonic()
+        # the grandchild (sleep) is terminated together
+        with pytest.raises(CommandCancelledError):
+            run(["bash", "-c", "echo start; sleep 30 & wait"], reporter)
+        timer.join()
+        assert time.monotonic() - started < 10
+
+        with pytest.raises(CommandCancelledError):
+            run(["echo", "a"], reporter)
+
+
+def test_run_timeout() -> None:
+    reporter = Reporter("timeout")
+    with deadline_scope(0.2):
+        started = time.monotonic()
+        # the grandchild (sleep) is terminated together
+        with pytest.raises(CommandTimeoutError):
+            run(["bash", "-c", "echo start; sleep 30 & wait"], reporter)
+        assert time.monotonic() - started < 10
+
+        # no commands start after the deadline
+        with pytest.raises(CommandTimeoutError):
+            run(["echo", "a"], reporter)
+
+    with deadline_scope(30):
+        assert run(["echo", "a"], reporter) == (0, "a\n", "")
+
+
+def test_run_timeout_kill(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(process_utils, "_KillGracePeriod", 0.1)
+    reporter = Reporter("timeout")
+    with deadline_scope(0.2):
+        started = time.monotonic()
+        # processes ignoring SIGTERM are killed after the grace period
+        with pytest.raises(CommandTimeoutError):
+            run(["bash", "-c", "trap '' TERM; echo start; sleep 30"], reporter)
+        assert time.monotonic() - started < 10
+
+
+def test_run_threads(monkeypatch: pytest.MonkeyPatch) -> None:
+    reporter = Reporter("threads")
+    # starts the event loop shared by the process
+    assert run(["echo", "a"], reporter) == (0, "a\n", "")
+
+    started: List[threading.Thread] = []
+    start = threading.Thread.start
+
+    def start_thread(self: threading.Thread) -> None:
+        started.append(self)
+        start(self)
+
+    monkeypatch.setattr(threading.Thread, "start", start_thread)
+    # no threads are started to read the outputs or to watch the timeout
+    with deadline_scope(30):
+        assert run(["echo", "b"], reporter) == (0, "b\n", "")
+    assert run(["bash", "-c", "echo c >&2"], reporter) == (0, "", "c\n")
+    assert started == []
+
+
+class ThreadHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.threads: List[threading.Thread] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.threads.append(threading.current_thread())
+
+
+def test_run_logging_thread() -> None:
+    reporter = Reporter("logging_thread")
+    handler = ThreadHandler()
+    reporter.process_output.setLevel(logging.INFO)
+    reporter.process_output.handlers.clear()
+    reporter.process_output.addHandler(handler)
+
+    # the outputs are logged by the calling thread rather than the event loop,
+    # so that a slow handler never delays the outputs of the other processes
+    assert run(["bash", "-c", "echo a; echo b >&2"], reporter) == (0, "a\n", "b\n")
+    assert handler.threads == [threading.current_thread()] * 2
+
+
+@pytest.mark.skipif(not hasattr(os, "pidfd_open"), reason="pidfd is not supported")
+def test_run_reap(monkeypatch: pytest.MonkeyPatch) -> None:
+    reporter = Reporter("reap")
+    calls: List[Tuple[str, int]] = []
+    wait4 = os.wait4
+
+    def fake_wait4(pid: int, options: int) -> Tuple[int, int, Any]:
+        calls.append((threading.current_thread().name, options))
+        return wait4(pid, options)
+
+    monkeypatch.setattr(os, "wait4", fake_wait4)
+    with track_peak_memory() as peak:
+        assert run(["bash", "-c", "exit 3"], reporter) == (3, "", "")
+    # the process is reaped by the event loop
+    assert calls == [("pysen-event-loop", os.WNOHANG)]
+    assert peak.value is not None
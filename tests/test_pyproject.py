@@ -13,6 +13,7 @@ from pysen.isort import Isort, IsortSectionName
 from pysen.manifest import Manifest
 from pysen.mypy import Mypy, MypyFollowImports, MypyPreset
 from pysen.path import change_dir
+from pysen.py_version import PythonVersion
 from pysen.pyproject_model import Config, LintConfig
 from pysen.source import Source
 
@@ -103,6 +104,9 @@ def test_load_manifest() -> None:
     components = manifest.components
     assert len(components) == 1
     assert {x.name for x in components} == {"mypy"}
+    mypy = manifest.get_component("mypy")
+    assert isinstance(mypy, Mypy)
+    assert mypy.py_versions == [PythonVersion(3, 8), PythonVersion(3, 10)]
 
     manifest = pyproject.load_manifest(BASE_DIR / "fakes/configs/builder.toml")
     assert manifest is not None
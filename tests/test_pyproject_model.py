@@ -338,6 +338,7 @@ def test_simple_source() -> None:
     assert lint.enable_mypy
     assert lint.line_length == 80
     assert lint.py_version == PythonVersion(2, 7)
+    assert lint.mypy_py_versions == [PythonVersion(3, 8), PythonVersion(3, 10)]
     assert lint.source is not None
     source = lint.source
     assert source.includes == {
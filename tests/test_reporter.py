@@ -74,9 +74,32 @@ def test_reporter_factory() -> None:
     assert factory.has_error()
     out = factory.format_summary()
     assert "foo" in out and "bar" in out
+    assert "[" not in out
+
+    factory.reporters[0].report_statistics("cache: 1 hits")
+    factory.reporters[0].report_statistics("2 misses")
+    out = factory.format_summary()
+    assert "foo .......... OK" in out and "sec) [cache: 1 hits, 2 misses]\n" in out
 
     err_summary = factory.format_error_summary()
     assert "\n - bar\n" in err_summary and "foo" not in err_summary
 
+    cancelled = factory.create("baz")
+    cancelled.set_cancelled()
+    assert cancelled.cancelled and not cancelled.success
+    with factory.create("qux") as r:
+        r.set_cancelled(-15)
+    out = factory.format_summary()
+    assert "baz .......... Cancelled\n" in out
+    assert "qux .......... Cancelled (" in out
+    err_summary = factory.format_error_summary()
+    assert "\n - baz (cancelled)\n - qux (cancelled)\n" in err_summary
+
+    with factory.create("quux") as r:
+        r.set_timed_out(124)
+    assert r.timed_out and not r.success and r.exit_code == 124
+    assert "quux .......... Timeout (" in factory.format_summary()
+    assert "\n - quux (timeout)\n" in factory.format_error_summary()
+
     out = factory.format_diagnostic_summary(FLCMFormatter)
     assert f"{BASE_DIR / 'hoge.py'}:1:3:foo: error" in out
@@ -0,0 +1,149 @@
+import pathlib
+import tempfile
+from typing import Optional, Union
+from unittest import mock
+
+import pytest
+
+from pysen import resource_utils
+
+
+def _setup_cgroup(
+    root: pathlib.Path, cpu_max: Optional[str], self_cgroup: str = "0::/"
+) -> None:
+    (root / "proc").mkdir()
+    (root / "proc" / "cgroup").write_text(self_cgroup)
+    cgroup = root / "cgroup"
+    cgroup.mkdir()
+    if cpu_max is not None:
+        (cgroup / "cpu.max").write_text(cpu_max)
+
+
+@pytest.mark.parametrize(
+    "cpu_max,expected",
+    [("max 100000", None), ("200000 100000", 2.0), ("150000 100000", 1.5)],
+)
+def test__get_cgroup_cpu_quota_v2(cpu_max: str, expected: Optional[float]) -> None:
+    with tempfile.TemporaryDirectory() as d:
+        root = pathlib.Path(d)
+        _setup_cgroup(root, cpu_max)
+        with mock.patch.object(
+            resource_utils, "_CGROUP_ROOT", root / "cgroup"
+        ), mock.patch.object(resource_utils, "_PROC_SELF_CGROUP", root / "proc/cgroup"):
+            assert resource_utils._get_cgroup_cpu_quota() == expected
+
+
+def test__get_cgroup_cpu_quota_v1() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        root = pathlib.Path(d)
+        _setup_cgroup(root, None, self_cgroup="4:cpu,cpuacct:/")
+        cpu = root / "cgroup" / "cpu"
+        cpu.mkdir()
+        (cpu / "cpu.cfs_quota_us").write_text("300000\n")
+        (cpu / "cpu.cfs_period_us").write_text("100000\n")
+        with mock.patch.object(
+            resource_utils, "_CGROUP_ROOT", root / "cgroup"
+        ), mock.patch.object(resource_utils, "_PROC_SELF_CGROUP", root / "proc/cgroup"):
+            assert resource_utils._get_cgroup_cpu_quota() == 3.0
+
+            (cpu / "cpu.cfs_quota_us").write_text("-1\n")
+            assert resource_utils._get_cgroup_cpu_quota() is None
+
+
+def test_get_cpu_count() -> None:
+    with mock.patch.object(
+        resource_utils, "_get_schedulable_cpu_count", return_value=16
+    ):
+        with mock.patch.object(
+            resource_utils, "_get_cgroup_cpu_quota", return_value=None
+        ):
+            assert resource_utils.get_cpu_count() == 16
+
+        with mock.patch.object(
+            resource_utils, "_get_cgroup_cpu_quota", return_value=3.5
+        ):
+            assert resource_utils.get_cpu_count() == 4
+
+        with mock.patch.object(
+            resource_utils, "_get_cgroup_cpu_quota", return_value=0.5
+        ):
+            assert resource_utils.get_cpu_count() == 1
+
+        with mock.patch.object(
+            resource_utils, "_get_cgroup_cpu_quota", return_value=64.0
+        ):
+            assert resource_utils.get_cpu_count() == 16
+
+
+def test_get_num_jobs() -> None:
+    assert resource_utils.get_num_jobs(3) == 3
+    with mock.patch.object(resource_utils, "get_cpu_count", return_value=5):
+        assert resource_utils.get_num_jobs(None) == 5
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        (1024, 1024),
+        ("1024", 1024),
+        ("4K", 4096),
+        ("512MiB", 512 << 20),
+        ("1.5G", 3 << 29),
+        ("2gb", 2 << 30),
+        (" 1 T ", 1 << 40),
+    ],
+)
+def test_parse_memory_size(value: Union[int, str], expected: int) -> None:
+    assert resource_utils.parse_memory_size(value) == expected
+
+
+@pytest.mark.parametrize("value", [0, -1, "", "0", "foo", "1X", "1.5.0G"])
+def test_parse_memory_size_invalid(value: Union[int, str]) -> None:
+    with pytest.raises(ValueError):
+        resource_utils.parse_memory_size(value)
+
+
+def test__get_cgroup_memory_limit() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        root = pathlib.Path(d)
+        _setup_cgroup(root, None)
+        cgroup = root / "cgroup"
+        with mock.patch.object(
+            resource_utils, "_CGROUP_ROOT", cgroup
+        ), mock.patch.object(resource_utils, "_PROC_SELF_CGROUP", root / "proc/cgroup"):
+            assert resource_utils._get_cgroup_memory_limit() is None
+
+            # cgroup v1
+            (cgroup / "memory").mkdir()
+            (cgroup / "memory" / "memory.limit_in_bytes").write_text(
+                "9223372036854771712\n"
+            )
+            assert resource_utils._get_cgroup_memory_limit() is None
+            (cgroup / "memory" / "memory.limit_in_bytes").write_text("8589934592\n")
+            assert resource_utils._get_cgroup_memory_limit() == 8 << 30
+
+            # cgroup v2
+            (cgroup / "memory.max").write_text("max\n")
+            assert resource_utils._get_cgroup_memory_limit() is None
+            (cgroup / "memory.max").write_text("4294967296\n")
+            assert resource_utils._get_cgroup_memory_limit() == 4 << 30
+
+
+def test_get_memory_limit() -> None:
+    with mock.patch.object(
+        resource_utils, "_get_physical_memory", return_value=16 << 30
+    ):
+        with mock.patch.object(
+            resource_utils, "_get_cgroup_memory_limit", return_value=None
+        ):
+            assert resource_utils.get_memory_limit() == 16 << 30
+
+        with mock.patch.object(
+            resource_utils, "_get_cgroup_memory_limit", return_value=8 << 30
+        ):
+            assert resource_utils.get_memory_limit() == 8 << 30
+
+    with mock.patch.object(
+        resource_utils, "_get_physical_memory", return_value=None
+    ), mock.patch.object(resource_utils, "_get_cgroup_memory_limit", return_value=None):
+        assert resource_utils.get_memory_limit() is None
@@ -0,0 +1,77 @@
+import pathlib
+import tempfile
+from unittest import mock
+
+from pysen.diagnostic import Diagnostic
+from pysen.py_version import VersionRepresentation
+from pysen.result_cache import ResultCache
+
+
+def test_result_cache() -> None:
+    with tempfile.TemporaryDirectory() as d, mock.patch(
+        "pysen.result_cache.get_version", return_value=VersionRepresentation(1, 0)
+    ) as get_version:
+        temp_dir = pathlib.Path(d)
+        cache_dir = temp_dir / "cache"
+        setting_path = temp_dir / "setup.cfg"
+        setting_path.write_text("[flake8]\n")
+        foo = temp_dir / "foo.py"
+        foo.write_text("import os\n")
+        bar = temp_dir / "bar.py"
+        bar.write_text("print('bar')\n")
+
+        cache = ResultCache.create(cache_dir, "flake8", "flake8", setting_path)
+        assert cache is not None
+        hits, misses = cache.lookup([foo, bar])
+        assert hits == {} and misses == [foo, bar]
+
+        diagnostic = Diagnostic(foo, 1, 1, 1, message="F401 'os' imported but unused")
+        cache.store(foo, [diagnostic])
+        cache.store(bar, [])
+        cache.save()
+
+        cache = ResultCache.create(cache_dir, "flake8", "flake8", setting_path)
+        assert cache is not None
+        hits, misses = cache.lookup([foo, bar])
+        assert hits == {foo: [diagnostic], bar: []} and misses == []
+
+        # entries are isolated for each command
+        cache = ResultCache.create(cache_dir, "flake8_2", "flake8", setting_path)
+        assert cache is not None
+        assert cache.lookup([foo, bar])[1] == [foo, bar]
+
+        # content change
+        bar.write_text("print('updated')\n")
+        cache = ResultCache.create(cache_dir, "flake8", "flake8", setting_path)
+        assert cache is not None
+        assert cache.lookup([foo, bar]) == ({foo: [diagnostic]}, [bar])
+
+        # setting change
+        setting_path.write_text("[flake8]\nmax-line-length = 100\n")
+        cache = ResultCache.create(cache_dir, "flake8", "flake8", setting_path)
+        assert cache is not None
+        assert cache.lookup([foo, bar]) == ({}, [foo, bar])
+
+        # tool version change
+        setting_path.write_text("[flake8]\n")
+        get_version.return_value = VersionRepresentation(1, 1)
+        cache = ResultCache.create(cache_dir, "flake8", "flake8", setting_path)
+        assert cache is not None
+        assert cache.lookup([foo, bar]) == ({}, [foo, bar])
+
+
+def test_result_cache_broken_file() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        temp_dir = pathlib.Path(d)
+        cache_path = temp_dir / "cache.json"
+        cache_path.write_text("{broken")
+        foo = temp_dir / "foo.py"
+        foo.touch()
+
+        cache = ResultCache(cache_path, "namespace")
+        assert cache.lookup([foo]) == ({}, [foo])
+        cache.store(foo, [])
+        cache.save()
+
+        cache = ResultCache(cache_path, "namespace")
+        assert cache.lookup([foo]) == ({foo: []}, [])
@@ -1,20 +1,28 @@
 import math
 import pathlib
+import tempfile
 import threading
+import time
 import unittest.mock
-from typing import Any, Callable, List, Optional, cast
+from typing import Any, Callable, Dict, List, Optional, cast
 
 import pytest
 from _pytest.capture import CaptureFixture
 
 from fakes.component import FakeCommand, FakeComponent, Operation
 from fakes.manifest import FakeManifest
+from pysen import process_utils
+from pysen.cancellation import get_cancellation
 from pysen.command import CommandBase
 from pysen.exceptions import CommandNotFoundError, InvalidCommandNameError
+from pysen.jobserver import JobServer, LocalJobServer, get_jobserver
 from pysen.manifest import Manifest, ManifestBase
+from pysen.memory_budget import MemoryFootprints
+from pysen.probe_cache import probe_scope
 from pysen.reporter import Reporter, ReporterFactory
-from pysen.runner import Runner, _has_side_effects, _verify_command_name
+from pysen.runner import Runner, _has_side_effects, _verify_command_name, run_target
 from pysen.runner_options import PathContext, RunOptions
+from pysen.source import SourceResolutionCache, _resolution_cache
 
 FAKE_PATH = pathlib.Path(__file__)
 FixtureType = Callable[..., ManifestBase]
@@ -421,3 +429,315 @@ def test__has_side_effects() -> None:
     assert _has_side_effects([pfc, pfc, pfc, mc])
     assert _has_side_effects([mc, mc, mc, mc])
     assert not _has_side_effects([pfc, pfc, pfc, pfc])
+
+
+class ResolutionCacheCommand(PurelyFunctionalCommand):
+    def __init__(self, caches: List[Optional[SourceResolutionCache]]) -> None:
+        self._caches = caches
+
+    @property
+    def name(self) -> str:
+        return "resolution_cache"
+
+    def __call__(self, reporter: Reporter) -> int:
+        self._caches.append(_resolution_cache.get())
+        return 0
+
+
+@pytest.mark.parametrize("no_parallel", [True, False])
+def test_run_target_resolution_cache(no_parallel: bool) -> None:
+    caches: List[Optional[SourceResolutionCache]] = []
+    target: List[CommandBase] = [
+        ResolutionCacheCommand(caches),
+        ResolutionCacheCommand(caches),
+    ]
+    run_target(target, ReporterFactory(), RunOptions(no_parallel=no_parallel))
+
+    assert len(caches) == 2
+    assert caches[0] is not None
+    assert caches[0] is caches[1]
+    assert _resolution_cache.get() is None
+
+
+class ToolCommand(PurelyFunctionalCommand):
+    def __init__(self, tools: List[str]) -> None:
+        self._tools = tools
+
+    @property
+    def name(self) -> str:
+        return "tool"
+
+    @property
+    def tools(self) -> List[str]:
+        return self._tools
+
+
+def test_run_target_probe_tools() -> None:
+    target: List[CommandBase] = [
+        ToolCommand(["mypy"]),
+        ToolCommand(["black", "mypy"]),
+        ToolCommand([]),
+    ]
+    jobservers: List[Optional[JobServer]] = []
+
+    def probe_tools(tools: List[str]) -> None:
+        jobservers.append(get_jobserver())
+
+    with tempfile.TemporaryDirectory() as td:
+        options = RunOptions(cache_dir=pathlib.Path(td), jobs=3)
+        with unittest.mock.patch(
+            "pysen.runner.probe_tools", side_effect=probe_tools
+        ) as mock:
+            with probe_scope(options.cache_dir):
+                run_target(target, ReporterFactory(), options)
+            # the tools of the target are probed in the jobserver of the run
+            mock.assert_called_once_with(["black", "mypy"])
+            assert isinstance(jobservers[0], LocalJobServer)
+            assert jobservers[0].jobs == 3
+
+            # the tools are probed only when the cache is stale
+            with probe_scope(options.cache_dir):
+                run_target(target, ReporterFactory(), options)
+            mock.assert_called_once()
+
+            with probe_scope(pathlib.Path(td) / "stale"):
+                run_target([ToolCommand([])], ReporterFactory(), options)
+            mock.assert_called_once()
+
+        with unittest.mock.patch("pysen.runner.probe_tools") as mock:
+            run_target(target, ReporterFactory(), RunOptions())
+            mock.assert_not_called()
+
+
+class MemoryCommand(PurelyFunctionalCommand):
+    def __init__(
+        self,
+        name: str,
+        expected_memory: Optional[int],
+        running: List[str],
+        overlapped: List[List[str]],
+        lock: threading.Lock,
+    ) -> None:
+        self._name = name
+        self._expected_memory = expected_memory
+        self._running = running
+        self._overlapped = overlapped
+        self._lock = lock
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def expected_memory(self) -> Optional[int]:
+        return self._expected_memory
+
+    def __call__(self, reporter: Reporter) -> int:
+        with self._lock:
+            self._running.append(self.name)
+            self._overlapped.append(list(self._running))
+        time.sleep(0.05)
+        with self._lock:
+            self._running.remove(self.name)
+        return 0
+
+
+def test_run_target_memory_budget() -> None:
+    running: List[str] = []
+    overlapped: List[List[str]] = []
+    lock = threading.Lock()
+
+    def run(options: RunOptions) -> None:
+        running.clear()
+        overlapped.clear()
+        target: List[CommandBase] = [
+            MemoryCommand("heavy", 6, running, overlapped, lock),
+            MemoryCommand("heavy2", 6, running, overlapped, lock),
+            MemoryCommand("unknown", None, running, overlapped, lock),
+        ]
+        run_target(target, ReporterFactory(), options)
+
+    run(RunOptions(jobs=3, memory_limit=10))
+    assert all(not {"heavy", "heavy2"} <= set(x) for x in overlapped)
+
+    run(RunOptions(jobs=3, memory_limit=12))
+    assert any({"heavy", "heavy2"} <= set(x) for x in overlapped)
+
+    # footprints given by the user take precedence
+    run(RunOptions(jobs=3, memory_limit=12, memory_footprints={"heavy2": 7}))
+    assert all(not {"heavy", "heavy2"} <= set(x) for x in overlapped)
+
+
+def test_run_target_memory_footprints() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        cache_dir = pathlib.Path(d)
+        target: List[CommandBase] = [ResolutionCacheCommand([])]
+        options = RunOptions(cache_dir=cache_dir)
+
+        with unittest.mock.patch(
+            "pysen.memory_budget.PeakMemory.value",
+            new_callable=unittest.mock.PropertyMock,
+            return_value=123,
+        ):
+            run_target(target, ReporterFactory(), options, files=[FAKE_PATH])
+            assert MemoryFootprints.create(cache_dir).get("resolution_cache") is None
+
+            run_target(target, ReporterFactory(), options)
+            assert MemoryFootprints.create(cache_dir).get("resolution_cache") == 123
+
+        # the footprint is kept when the command works in the process of pysen
+        with unittest.mock.patch(
+            "pysen.memory_budget.PeakMemory.partial",
+            new_callable=unittest.mock.PropertyMock,
+            return_value=True,
+        ), unittest.mock.patch(
+            "pysen.memory_budget.PeakMemory.value",
+            new_callable=unittest.mock.PropertyMock,
+            return_value=1,
+        ):
+            run_target(target, ReporterFactory(), options)
+            assert MemoryFootprints.create(cache_dir).get("resolution_cache") == 123
+
+
+class ProcessCommand(CommandBase):
+    def __init__(self, name: str, cmd: List[str]) -> None:
+        self._name = name
+        self._cmd = cmd
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def has_side_effects(self) -> bool:
+        return False
+
+    def __call__(self, reporter: Reporter) -> int:
+        ret, _, _ = process_utils.run(self._cmd, reporter)
+        return ret
+
+
+@pytest.mark.parametrize("no_parallel", [False, True])
+def test_run_target_fail_fast(no_parallel: bool) -> None:
+    def run(fail_fast: bool) -> ReporterFactory:
+        # NOTE: the sleep runs in a grandchild, which is terminated with its parent
+        sleep = "sleep 30 & wait" if fail_fast else "sleep 0.1"
+        target: List[CommandBase] = [
+            ProcessCommand("fail", ["bash", "-c", "sleep 0.1; exit 1"]),
+            ProcessCommand("sleep", ["bash", "-c", sleep]),
+            ProcessCommand("ok", ["true"]),
+        ]
+        reporters = ReporterFactory()
+        options = RunOptions(jobs=2, no_parallel=no_parallel, fail_fast=fail_fast)
+        run_target(target, reporters, options)
+        return reporters
+
+    started = time.monotonic()
+    reporters = run(fail_fast=True)
+    # the outputs are closed only after the grandchild is terminated
+    assert time.monotonic() - started < 10
+    results = {r.name: r for r in reporters.reporters}
+    assert not results["fail"].success and not results["fail"].cancelled
+    assert not results["sleep"].success and results["sleep"].cancelled
+    # pending commands never start
+    assert results["ok"].cancelled and not results["ok"].started
+
+    summary = reporters.format_summary()
+    assert "fail .......... Failed" in summary
+    assert "sleep .......... Cancelled" in summary
+    error_summary = reporters.format_error_summary()
+    assert " - fail\n" in error_summary
+    assert " - sleep (cancelled)\n" in error_summary
+
+    reporters = run(fail_fast=False)
+    results = {r.name: r for r in reporters.reporters}
+    assert not results["fail"].success
+    assert results["sleep"].success and results["ok"].success
+    assert not any(r.cancelled for r in reporters.reporters)
+
+
+class FailAfterCancelCommand(PurelyFunctionalCommand):
+    @property
+    def name(self) -> str:
+        return "fail_after_cancel"
+
+    def __call__(self, reporter: Reporter) -> int:
+        cancel = get_cancellation()
+        assert cancel is not None
+        deadline = time.monotonic() + 10
+        while not cancel.cancelled and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return 2
+
+
+def test_run_target_fail_fast_failure() -> None:
+    target: List[CommandBase] = [
+        ProcessCommand("fail", ["bash", "-c", "sleep 0.1; exit 1"]),
+        FailAfterCancelCommand(),
+    ]
+    reporters = ReporterFactory()
+    run_target(target, reporters, RunOptions(jobs=2, fail_fast=True))
+    results = {r.name: r for r in reporters.reporters}
+    # a command that fails by itself is not hidden by the cancellation
+    assert not results["fail"].cancelled
+    assert not results["fail_after_cancel"].success
+    assert not results["fail_after_cancel"].cancelled
+
+
+class InterruptCommand(PurelyFunctionalCommand):
+    @property
+    def name(self) -> str:
+        return "interrupt"
+
+    def __call__(self, reporter: Reporter) -> int:
+        time.sleep(0.2)
+        raise KeyboardInterrupt
+
+
+@pytest.mark.parametrize("fail_fast", [False, True])
+def test_run_target_interrupt(fail_fast: bool) -> None:
+    # NOTE: the sleep runs in its own session due to the timeout, and doesn't receive
+    # SIGINT from the terminal
+    target: List[CommandBase] = [
+        InterruptCommand(),
+        ProcessCommand("sleep", ["bash", "-c", "sleep 30 & wait"]),
+        ProcessCommand("ok", ["true"]),
+    ]
+    reporters = ReporterFactory()
+    options = RunOptions(jobs=2, fail_fast=fail_fast, timeout=60)
+    started = time.monotonic()
+    run_target(target, reporters, options)
+    assert time.monotonic() - started < 10
+    results = {r.name: r for r in reporters.reporters}
+    assert not results["interrupt"].success and not results["interrupt"].cancelled
+    assert results["sleep"].cancelled
+    # pending commands never start
+    assert results["ok"].cancelled and not results["ok"].started
+
+
+def test_run_target_timeout() -> None:
+    def run(options: RunOptions) -> Dict[str, Reporter]:
+        target: List[CommandBase] = [
+            ProcessCommand("sleep", ["bash", "-c", "sleep 30 & wait"]),
+            ProcessCommand("ok", ["true"]),
+        ]
+        reporters = ReporterFactory()
+        started = time.monotonic()
+        run_target(target, reporters, options)
+        assert time.monotonic() - started < 10
+        return {r.name: r for r in reporters.reporters}
+
+    results = run(RunOptions(jobs=2, command_timeout=0.2))
+    assert results["sleep"].timed_out
+    assert not results["sleep"].success and results["sleep"].exit_code == 124
+    assert results["ok"].success and not results["ok"].timed_out
+
+    # a timeout of the command precedes the one of all commands
+    results = run(RunOptions(command_timeout=60, command_timeouts={"sleep": 0.2}))
+    assert results["sleep"].timed_out
+    assert results["ok"].success
+
+    # commands are not started after the timeout of the run
+    results = run(RunOptions(no_parallel=True, timeout=0.2))
+    assert results["sleep"].timed_out
+    assert results["ok"].timed_out
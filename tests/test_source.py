@@ -2,11 +2,14 @@ import contextlib
 import pathlib
 import tempfile
 from typing import Iterator, Set
+from unittest import mock
 
 import git
 import pytest
 import tomlkit
 
+from pysen import git_utils
+from pysen import source as source_module
 from pysen.path import change_dir
 from pysen.source import (
     PythonFileFilter,
@@ -14,6 +17,7 @@ from pysen.source import (
     SourceEntrySetting,
     _resolve,
     extension_filter,
+    resolution_cache_scope,
 )
 
 BASE_DIR = pathlib.Path(__file__).resolve().parent
@@ -364,3 +368,215 @@ def test_copy() -> None:
         "piyo": SourceEntrySetting(glob=True, base_dir=pathlib.Path("/fuga")),
         "bar": SourceEntrySetting(glob=False),
     }
+
+
+def test_resolve_files_cache() -> None:
+    source = Source()
+    source.add_include(".")
+
+    with create_git_repository({"0.py", "1.md"}, {"2.py"}) as base_dir:
+        with mock.patch.object(
+            source, "_resolve_files", wraps=source._resolve_files
+        ) as resolve:
+            assert source.resolve_files(base_dir, PythonFileFilter) == {
+                base_dir / "0.py"
+            }
+            assert source.resolve_files(base_dir, PythonFileFilter) == {
+                base_dir / "0.py"
+            }
+            assert resolve.call_count == 2
+
+            resolve.reset_mock()
+            with resolution_cache_scope():
+                for _ in range(2):
+                    files = source.resolve_files(base_dir, PythonFileFilter)
+                    assert files == {base_dir / "0.py"}
+                    # the cached set must not be modified by callers
+                    files.clear()
+                assert resolve.call_count == 1
+
+                # a different filter, git mode or source is resolved again
+                assert source.resolve_files(base_dir, None) == {
+                    base_dir / "0.py",
+                    base_dir / "1.md",
+                }
+                assert source.resolve_files(
+                    base_dir, PythonFileFilter, use_git=False
+                ) == {base_dir / "0.py", base_dir / "2.py"}
+                assert resolve.call_count == 3
+
+                source.add_exclude("0.py")
+                assert source.resolve_files(base_dir, PythonFileFilter) == set()
+                assert resolve.call_count == 4
+
+
+def test_resolve_files_without_git() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        base_dir = pathlib.Path(d).resolve()
+        with change_dir(base_dir):
+            for f in ["0.py", "A/1.py", ".venv/lib/2.py", "third_party/3.py"]:
+                touch_file(pathlib.Path(f))
+        (base_dir / ".gitignore").write_text(".venv/\n")
+
+        source = Source(includes=["."], excludes=["third_party"])
+        with mock.patch(
+            "pysen.source.walk_files", wraps=source_module.walk_files
+        ) as walk:
+            assert source.resolve_files(base_dir, PythonFileFilter, use_git=False) == {
+                base_dir / "0.py",
+                base_dir / "A/1.py",
+            }
+            excludes = walk.call_args[0][1]
+            assert excludes.is_contained(base_dir / "third_party" / "3.py")
+
+
+def test_resolve_files_invalid_index() -> None:
+    with create_git_repository({"0.py", "A/1.py"}, {"2.py"}) as base_dir:
+        base_dir = base_dir.resolve()
+        (base_dir / ".git" / "index").write_bytes(b"DIRC\x00\x00\x00\x02\xff")
+        git_utils.list_indexed_files.cache_clear()
+
+        # files are resolved by walking the directories instead of the index
+        source = Source(includes=["."])
+        expected = {base_dir / "0.py", base_dir / "A/1.py", base_dir / "2.py"}
+        assert source.resolve_files(base_dir, PythonFileFilter) == expected
+        assert source.resolve_covered_files(
+            base_dir, [base_dir / "0.py", base_dir / "2.py"], PythonFileFilter
+        ) == {base_dir / "0.py", base_dir / "2.py"}
+        git_utils.list_indexed_files.cache_clear()
+
+
+def test_resolve_files_globs() -> None:
+    tracked_files = {
+        "A/0.py",
+        "A/1.template",
+        "A/B/2.template",
+        "A/B/3.md",
+        "A/B/4.py",
+        "C/5_grpc.py",
+        "C/6.py",
+    }
+    untracked_files = {"A/7.template", "C/8.py"}
+
+    source = Source(
+        include_globs=["**/*.template", "A/B", "C/*.py"],
+        exclude_globs=["**/*_grpc.py", "A/B/2.*"],
+    )
+
+    with create_git_repository(tracked_files, untracked_files) as base_dir:
+        base_dir = base_dir.resolve()
+        with mock.patch.object(pathlib.Path, "glob") as glob:
+            # globbed files are included regardless of the filter while files under
+            # globbed directories are filtered
+            assert source.resolve_files(base_dir, PythonFileFilter) == {
+                base_dir / "A/1.template",
+                base_dir / "A/B/4.py",
+                base_dir / "C/6.py",
+            }
+            assert source.resolve_files(base_dir, PythonFileFilter, use_git=False) == {
+                base_dir / "A/1.template",
+                base_dir / "A/7.template",
+                base_dir / "A/B/4.py",
+                base_dir / "C/6.py",
+                base_dir / "C/8.py",
+            }
+            glob.assert_not_called()
+
+
+@pytest.mark.parametrize("use_git", [True, False])
+def test_resolve_covered_files(use_git: bool) -> None:
+    tracked_files = {
+        "0.py",
+        "1.md",
+        "A/2.py",
+        "A/3.template",
+        "A/third_party/4.py",
+        "B/5_grpc.py",
+        "B/6.py",
+        "C/7.py",
+        "script",
+    }
+    untracked_files = {"8.py", "A/9.py", ".venv/10.py", "C/11.py"}
+
+    source = Source(
+        includes=["A", "B", "script", "8.py"],
+        include_globs=["**/*.template", "C/*.py"],
+        excludes=["A/third_party"],
+        exclude_globs=["**/*_grpc.py"],
+    )
+
+    with create_git_repository(tracked_files, untracked_files) as base_dir:
+        base_dir = base_dir.resolve()
+        (base_dir / ".gitignore").write_text(".venv/\n")
+        files = [base_dir / f for f in tracked_files | untracked_files]
+        files.append(base_dir / "missing.py")
+
+        expected = source.resolve_files(base_dir, PythonFileFilter, use_git)
+        with mock.patch.object(source, "_resolve_files") as resolve:
+            covered = source.resolve_covered_files(
+                base_dir, files, PythonFileFilter, use_git
+            )
+            resolve.assert_not_called()
+
+        assert covered == expected.intersection(files)
+        assert (base_dir / "script") in covered
+        assert (base_dir / "A/3.template") in covered
+        assert (base_dir / "8.py" in covered) == (not use_git)
+
+
+def test_resolve_files_globs_ignored() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        base_dir = pathlib.Path(d).resolve()
+        for f in ["build/0.gen", "build/1.py", "A/.venv/2.py", "A/3.py", "A/4.gen"]:
+            touch_file(base_dir / f)
+        (base_dir / ".gitignore").write_text("build/\n.venv/\n")
+
+        # files matched by a glob are included even if they are ignored, while
+        # ignored subtrees of matched directories are pruned like includes
+        source = Source(include_globs=["**/*.gen", "A"])
+        files = [
+            base_dir / f
+            for f in ["build/0.gen", "build/1.py", "A/.venv/2.py", "A/3.py", "A/4.gen"]
+        ]
+        expected = {base_dir / "build/0.gen", base_dir / "A/3.py", base_dir / "A/4.gen"}
+        assert source.resolve_files(base_dir, PythonFileFilter, use_git=False) == (
+            expected
+        )
+        assert (
+            source.resolve_covered_files(
+                base_dir, files, PythonFileFilter, use_git=False
+            )
+            == expected
+        )
+
+
+def test_resolve_files_globs_outside_repository() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        outside_dir = pathlib.Path(d).resolve()
+        for f in ["0.template", "A/1.py"]:
+            touch_file(outside_dir / f)
+
+        # files outside repository matched by a glob are included with a warning,
+        # while directories are ignored
+        source = Source()
+        source.add_include("*.template", glob=True, base_dir=outside_dir)
+        source.add_include("A", glob=True, base_dir=outside_dir)
+        with create_git_repository({"2.py"}, set()) as base_dir:
+            base_dir = base_dir.resolve()
+            reporter = mock.Mock()
+            expected = {outside_dir / "0.template"}
+            assert (
+                source.resolve_files(base_dir, PythonFileFilter, reporter=reporter)
+                == expected
+            )
+            reporter.logger.warning.assert_called_with(
+                f"{outside_dir / '0.template'} is outside repository. ignored."
+            )
+            assert (
+                source.resolve_covered_files(
+                    base_dir,
+                    [outside_dir / "0.template", outside_dir / "A/1.py"],
+                    PythonFileFilter,
+                )
+                == expected
+            )
@@ -0,0 +1,169 @@
+import pathlib
+import tempfile
+from typing import Optional, Set
+
+import pytest
+
+from pysen.path import PathPrefixTrie
+from pysen.walker import (
+    is_ignored,
+    is_walked,
+    load_ignore_file,
+    parse_ignore_rule,
+    walk_files,
+)
+
+
+def _create_files(base_dir: pathlib.Path, files: Set[str]) -> None:
+    for f in files:
+        path = base_dir / f
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+
+
+@pytest.mark.parametrize(
+    "pattern,path,is_dir,expected",
+    [
+        ("foo", "foo", False, True),
+        ("foo", "a/b/foo", True, True),
+        ("foo", "foo_2", False, False),
+        ("*.pyc", "a/b.pyc", False, True),
+        ("*.pyc", "a/b.py", False, False),
+        ("/foo", "foo", False, True),
+        ("/foo", "a/foo", False, False),
+        ("a/*.py", "a/b.py", False, True),
+        ("a/*.py", "a/b/c.py", False, False),
+        ("a/*.py", "x/a/b.py", False, False),
+        ("build/", "build", True, True),
+        ("build/", "build", False, False),
+        ("**/foo", "foo", False, True),
+        ("**/foo", "a/b/foo", False, True),
+        ("a/**", "a/b/c", False, True),
+        ("a/**", "a", True, False),
+        ("a/**/b", "a/b", False, True),
+        ("a/**/b", "a/x/y/b", False, True),
+        ("a?c", "abc", False, True),
+        ("a?c", "a/c", False, False),
+        ("[abc].py", "b.py", False, True),
+        ("[!abc].py", "b.py", False, False),
+        ("[!abc].py", "d.py", False, True),
+        ("\\#foo", "#foo", False, True),
+        ("foo\\ ", "foo ", False, True),
+        ("foo  ", "foo", False, True),
+    ],
+)
+def test_parse_ignore_rule(
+    pattern: str, path: str, is_dir: bool, expected: bool
+) -> None:
+    rule = parse_ignore_rule(pattern)
+    assert rule is not None
+    assert (
+        (not rule.dir_only or is_dir) and rule.regex.match(path) is not None
+    ) == expected
+
+
+@pytest.mark.parametrize("line", ["", "\n", "# comment", "/", "!"])
+def test_parse_ignore_rule_empty(line: str) -> None:
+    assert parse_ignore_rule(line) is None
+
+
+def test_is_ignored() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        base_dir = pathlib.Path(d)
+        (base_dir / ".gitignore").write_text("*.log\n!keep.log\n# comment\n")
+        (base_dir / "sub").mkdir()
+        (base_dir / "sub" / ".gitignore").write_text("keep.log\n")
+
+        root = load_ignore_file(str(base_dir))
+        sub = load_ignore_file(str(base_dir / "sub"))
+        assert root is not None and sub is not None
+        assert load_ignore_file(str(base_dir / "missing")) is None
+
+        assert is_ignored(str(base_dir / "a.log"), False, (root,))
+        assert not is_ignored(str(base_dir / "keep.log"), False, (root,))
+        assert not is_ignored(str(base_dir / "a.py"), False, (root,))
+        # rules in a deeper ignore file take precedence
+        assert is_ignored(str(base_dir / "sub" / "keep.log"), False, (root, sub))
+
+
+def test_walk_files() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        base_dir = pathlib.Path(d).resolve()
+        _create_files(
+            base_dir,
+            {
+                "a.py",
+                "b.log",
+                ".git/config",
+                ".venv/lib/c.py",
+                "build/d.py",
+                "pkg/e.py",
+                "pkg/f.py",
+                "pkg/generated/g.py",
+                "pkg/keep.log",
+                "third_party/h.py",
+                "third_party_2/i.py",
+            },
+        )
+        (base_dir / ".gitignore").write_text(".venv/\n/build\n*.log\n")
+        (base_dir / "pkg" / ".gitignore").write_text("generated/\n!keep.log\n")
+
+        def walk(
+            root: pathlib.Path,
+            excludes: Optional[PathPrefixTrie] = None,
+            ignore_root: Optional[pathlib.Path] = None,
+        ) -> Set[str]:
+            return {
+                str(p.relative_to(base_dir))
+                for p in walk_files(root, excludes, ignore_root)
+            }
+
+        assert walk(base_dir) == {
+            ".gitignore",
+            "a.py",
+            "pkg/.gitignore",
+            "pkg/e.py",
+            "pkg/f.py",
+            "pkg/keep.log",
+            "third_party/h.py",
+            "third_party_2/i.py",
+        }
+
+        excludes = PathPrefixTrie([base_dir / "third_party", base_dir / "pkg/e.py"])
+        assert walk(base_dir, excludes) == {
+            ".gitignore",
+            "a.py",
+            "pkg/.gitignore",
+            "pkg/f.py",
+            "pkg/keep.log",
+        }
+
+        # .gitignore files in the parent directories are honored only if ignore_root
+        # is given
+        (base_dir / "pkg" / "x.log").touch()
+        assert "pkg/x.log" in walk(base_dir / "pkg")
+        assert "pkg/x.log" not in walk(base_dir / "pkg", ignore_root=base_dir)
+        assert "pkg/keep.log" in walk(base_dir / "pkg", ignore_root=base_dir)
+        # an explicitly given root is not ignored
+        assert walk(base_dir / "build", ignore_root=base_dir) == {"build/d.py"}
+
+        # is_walked must be consistent with walk_files
+        all_files = {p for p in base_dir.glob("**/*") if not p.is_dir()}
+        all_files.add(base_dir / "missing.py")
+        for root in [base_dir, base_dir / "pkg"]:
+            walked = set(walk_files(root, excludes, base_dir))
+            for f in all_files:
+                assert is_walked(root, f, excludes, base_dir) == (f in walked), f
+
+
+def test_walk_files_symlink() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        base_dir = pathlib.Path(d).resolve()
+        _create_files(base_dir, {"a/b.py"})
+        (base_dir / "a" / "loop").symlink_to(base_dir / "a")
+        (base_dir / "a" / "link.py").symlink_to(base_dir / "a" / "b.py")
+
+        assert set(walk_files(base_dir)) == {
+            base_dir / "a" / "b.py",
+            base_dir / "a" / "link.py",
+        }